@@ -0,0 +1,77 @@
+import argparse
+import hashlib
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.key_algorithms import ALGORITHM_RSA, ALGORITHMS, generate_private_key, sign_digest, verify_digest
+
+
+def measure(function, repeats):
+    """
+    Measures the execution time of a function.
+
+    Parameters
+    ----------
+    function : callable
+        The function to measure, called without arguments.
+    repeats : int
+        The number of calls.
+
+    Returns
+    -------
+    list of float
+        The duration of every call in seconds.
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main(argv=None):
+    """
+    Compares key generation, signing and verification times of the supported key algorithms.
+
+    Usage: `python benchmarks/key_algorithms.py [--keygen-repeats N] [--sign-repeats N]`
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments. Defaults to `sys.argv[1:]`.
+
+    Returns
+    -------
+    None.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark algorytmów kluczy.")
+    parser.add_argument("--keygen-repeats", type=int, default=5)
+    parser.add_argument("--sign-repeats", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    digest = hashlib.sha256(os.urandom(1024)).digest()
+    results = {}
+    for algorithm in ALGORITHMS:
+        keygen = measure(lambda: generate_private_key(algorithm), args.keygen_repeats)
+        private_key = generate_private_key(algorithm)
+        public_key = private_key.public_key()
+        signature = sign_digest(private_key, digest)
+        sign = measure(lambda: sign_digest(private_key, digest), args.sign_repeats)
+        verify = measure(lambda: verify_digest(public_key, signature, digest), args.sign_repeats)
+        results[algorithm] = (statistics.median(keygen), statistics.median(sign), statistics.median(verify))
+
+    baseline = results[ALGORITHM_RSA]
+    print(f"{'algorytm':<12} {'keygen [ms]':>12} {'podpis [ms]':>12} {'weryf. [ms]':>12} "
+          f"{'keygen x':>9} {'podpis x':>9}")
+    for algorithm, (keygen, sign, verify) in results.items():
+        print(f"{algorithm:<12} {keygen * 1000:>12.3f} {sign * 1000:>12.3f} {verify * 1000:>12.3f} "
+              f"{baseline[0] / keygen:>9.1f} {baseline[1] / sign:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
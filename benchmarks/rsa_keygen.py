@@ -0,0 +1,94 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.key_algorithms import ALGORITHM_RSA, generate_private_key
+from src.parallel_keygen import PrimeSearchPool
+
+
+def measure(function, repeats):
+    """
+    Measures the execution time of a function.
+
+    Parameters
+    ----------
+    function : callable
+        The function to measure, called without arguments.
+    repeats : int
+        The number of calls.
+
+    Returns
+    -------
+    list of float
+        The duration of every call in seconds.
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(timings, percent):
+    """
+    Returns a percentile of the measured times, interpolated between the nearest measurements.
+
+    Parameters
+    ----------
+    timings : list of float
+        The measured times.
+    percent : int
+        The percentile, from 1 to 99.
+
+    Returns
+    -------
+    float
+        The percentile of the times.
+    """
+    if len(timings) < 2:
+        return timings[0]
+    return statistics.quantiles(timings, n=100, method="inclusive")[percent - 1]
+
+
+def main(argv=None):
+    """
+    Compares the latency of generating 4096-bit RSA keys with OpenSSL on a single core and with the parallel prime
+    search of `src.parallel_keygen`.
+
+    The worker processes of the parallel generator are started once, before the measurement, as in a program
+    generating many keys.
+
+    Usage: `python benchmarks/rsa_keygen.py [--repeats N] [--workers N]`
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments. Defaults to `sys.argv[1:]`.
+
+    Returns
+    -------
+    None.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark generowania kluczy RSA-4096.")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=None, help="Liczba procesów (domyślnie liczba rdzeni).")
+    args = parser.parse_args(argv)
+
+    results = {"OpenSSL": measure(lambda: generate_private_key(ALGORITHM_RSA), args.repeats)}
+    with PrimeSearchPool(args.workers) as pool:
+        pool.generate_private_key()
+        results[f"równoległy ({pool.workers} proc.)"] = measure(pool.generate_private_key, args.repeats)
+
+    print(f"{'generator':<24} {'p50 [ms]':>10} {'p99 [ms]':>10} {'max [ms]':>10}")
+    for name, timings in results.items():
+        print(f"{name:<24} {percentile(timings, 50) * 1000:>10.0f} {percentile(timings, 99) * 1000:>10.0f} "
+              f"{max(timings) * 1000:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
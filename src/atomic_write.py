@@ -0,0 +1,65 @@
+import os
+import tempfile
+
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+def create_temp_file(path, mode=None):
+    """
+    Creates a temporary file next to a file, to be moved over it with `os.replace` once it is complete.
+
+    The temporary file gets a unique name from `tempfile.mkstemp`, so threads and processes writing the same file at
+    the same time never share it.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file which will be replaced.
+    mode : int, optional
+        The permissions of the file. Defaults to the usual permissions of a new file under the current umask. Where
+        the file system does not support permissions (e.g. FAT on USB devices) they are left as they are.
+
+    Returns
+    -------
+    temp_file : file object
+        The temporary file, opened for reading and writing in binary mode.
+    temp_path : str
+        The path of the temporary file.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        os.chmod(temp_path, mode if mode is not None else 0o666 & ~_UMASK)
+    except OSError:
+        pass
+    return os.fdopen(fd, "w+b"), temp_path
+
+
+def write_atomically(path, data, mode=None):
+    """
+    Writes a file through a temporary file in the same directory (see `create_temp_file`), so readers never see a
+    partially written file. When many threads or processes write the same file, the last one to finish replaces it.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file.
+    data : bytes
+        The content of the file.
+    mode : int, optional
+        The permissions of the file, see `create_temp_file`.
+
+    Returns
+    -------
+    None.
+    """
+    temp_file, temp_path = create_temp_file(path, mode)
+    try:
+        with temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
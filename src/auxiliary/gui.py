@@ -1,54 +1,62 @@
 import sys
-from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QLabel, QVBoxLayout, QLineEdit, QFileDialog, QListWidget
+from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QLabel, QVBoxLayout, QLineEdit, QFileDialog, QListWidget, \
+    QListWidgetItem, QComboBox, QCheckBox
 from PyQt5.QtGui import QIcon
 from PyQt5.QtCore import Qt
 
 from key_generation import key_generator
-from src.detecting_usb import detect_usb_devices
+from src.auxiliary.key_pool import KeyPool
+from src.detecting_usb import format_device
+from src.key_algorithms import ALGORITHMS, DEFAULT_ALGORITHM
+from src.mount_watcher import MountWatcher
 
 
-def refresh_usb(window, usb_list, status_label, app):
+def update_usb_devices(added, removed, usb_list, status_label, folder_label, selected_usb_priv_key):
     """
-    Refreshes the list of detected USB devices.
+    Updates the list of USB devices after the mount watcher has detected a change.
 
-    This function searches for connected USB devices and updates the list in the user interface. It provides status updates
-    to the user, indicating whether devices were detected or if no devices were found. If devices are detected, the user
-    can select one from the list, which will then enable the functionality to sign or verify the document.
+    Only the devices which were removed or added are taken out of or put into the list. If the device selected for
+    the private key has been removed, the selection is cleared and the user is asked to choose another device.
 
     Parameters
     ----------
-    window : QWidget
-        The auxiliary application window used for displaying and interacting with the user interface.
+    added : list of UsbDevice
+        The devices connected since the previous scan.
+    removed : list of UsbDevice
+        The devices disconnected since the previous scan.
     usb_list : QListWidget
-        The list widget in the user interface where the detected USB devices will be displayed.
+        The list widget in the user interface where the detected USB devices are displayed.
     status_label : QLabel
         The label in the user interface that provides status updates and prompts the user for further actions.
-    app : QApplication
-        The auxiliary application instance responsible for managing the application's event loop and updating the interface.
+    folder_label : QLabel
+        The label in the user interface that displays the selected folder path for storing the private key.
+    selected_usb_priv_key : str
+        The path of the selected USB device where the private key will be stored.
 
     Returns
     -------
-    None.
+    selected_usb_priv_key : str
+        The path of the selected USB device, or an empty string if it has been removed.
     """
-    status_label.setText("Wyszukiwanie nośników USB...")
-    status_label.setStyleSheet("""
-        font-family: 'Verdana', sans-serif;
-        font-size: 14px;
-        color: #FF6600;
-        padding: 5px;
-        border-radius: 5px;
-        background-color: #FFF3E6;
-        margin-top: 10px;
-        font-weight: normal;
-    """)
-    app.processEvents()
-
-    usb_list.clear()
-    devices = detect_usb_devices()
-    usb_list.addItems([f"{dev}" for dev in devices])
-
-    if devices:
-        status_label.setText(f"Liczba wykrytych nośników USB: {len(devices)}. Wybierz jeden z listy.")
+    removed_mountpoints = {device.mountpoint for device in removed}
+    for row in reversed(range(usb_list.count())):
+        if usb_list.item(row).data(Qt.UserRole) in removed_mountpoints:
+            usb_list.takeItem(row)
+
+    for device in added:
+        item = QListWidgetItem(format_device(device))
+        item.setData(Qt.UserRole, device.mountpoint)
+        usb_list.addItem(item)
+
+    if selected_usb_priv_key and selected_usb_priv_key in removed_mountpoints:
+        selected_usb_priv_key = ""
+        usb_list.clearSelection()
+        folder_label.setText("Ścieżka folderu: Nie wybrano")
+    elif selected_usb_priv_key:
+        return selected_usb_priv_key
+
+    if usb_list.count():
+        status_label.setText(f"Liczba wykrytych nośników USB: {usb_list.count()}. Wybierz jeden z listy.")
         status_label.setStyleSheet("""
             font-family: 'Verdana', sans-serif;
             font-size: 14px;
@@ -60,7 +68,7 @@ def refresh_usb(window, usb_list, status_label, app):
             font-weight: normal;
         """)
     else:
-        status_label.setText("Nie wykryto żadnych nośników USB. Podłącz nośnik i odśwież listę.")
+        status_label.setText("Nie wykryto żadnych nośników USB. Podłącz nośnik, a lista odświeży się automatycznie.")
         status_label.setStyleSheet("""
             font-family: 'Verdana', sans-serif;
             font-size: 14px;
@@ -71,14 +79,14 @@ def refresh_usb(window, usb_list, status_label, app):
             margin-top: 10px;
             font-weight: normal;
         """)
-    window.selected_pendrive = None
+    return selected_usb_priv_key
 
 
 def select_folder_priv_key(usb_list, folder_label, selected_folder_pub_key, status_label):
     """
     Selects a USB device for storing the private key.
 
-    Retrieves the selected item from the USB device list and saves it as the path
+    Retrieves the mount point of the selected item from the USB device list and saves it as the path
     for the private key. Updates the UI labels accordingly.
 
     If the public key folder has not been selected, the user is prompted to choose one.
@@ -99,12 +107,12 @@ def select_folder_priv_key(usb_list, folder_label, selected_folder_pub_key, stat
     selected_usb_priv_key : str
         The path of the selected USB device where the private key will be stored.
     """
-    selected_usb_priv_key = usb_list.currentItem().text()
+    selected_usb_priv_key = usb_list.currentItem().data(Qt.UserRole)
 
     if selected_usb_priv_key:
         folder_label.setText(f"Ścieżka wybranego folderu: {selected_usb_priv_key}")
         if selected_folder_pub_key:
-            status_label.setText("Folder wybrany. Wprowadź PIN i kliknij 'Generuj RSA'")
+            status_label.setText("Folder wybrany. Wprowadź PIN i kliknij 'Generuj klucze'")
         else:
             status_label.setText("Wybierz folder dla klucza publicznego")
     return selected_usb_priv_key
@@ -140,7 +148,7 @@ def select_folder_pub_key(window, folder_pub_label, status_label, selected_usb_p
         selected_folder_pub_key = folder_path_pub_key
         folder_pub_label.setText(f"Ścieżka wybranego folderu: {folder_path_pub_key}")
         if selected_usb_priv_key != "":
-            status_label.setText("Foldery wybrane. Wprowadź PIN i kliknij 'Generuj RSA'")
+            status_label.setText("Foldery wybrane. Wprowadź PIN i kliknij 'Generuj klucze'")
         else:
             status_label.setText("Wybierz urządzenie USB dla klucza prywatnego")
         status_label.setStyleSheet("""
@@ -157,9 +165,10 @@ def select_folder_pub_key(window, folder_pub_label, status_label, selected_usb_p
     return selected_folder_pub_key
 
 
-def generate_rsa(status_label, selected_usb_priv_key, selected_folder_pub_key, app, pin_input):
+def generate_rsa(status_label, selected_usb_priv_key, selected_folder_pub_key, app, pin_input, algorithm_combo, label_input,
+                 key_pool=None):
     """
-    Generates RSA keys using the provided PIN and saves them to the selected folder.
+    Generates keys of the selected algorithm using the provided PIN and saves them to the selected folder.
     Validates user input, including checking if the PIN is a valid numeric value and if a folder is selected.
 
     If the key generation process is successful, the status label is updated to inform the user.
@@ -177,12 +186,19 @@ def generate_rsa(status_label, selected_usb_priv_key, selected_folder_pub_key, a
         The auxiliary application instance responsible for managing the application's event loop and updating the interface.
     pin_input : QLineEdit
         The input field where the user enters their PIN for key generation.
+    algorithm_combo : QComboBox
+        The combo box with the selected key algorithm: RSA, ECDSA-P256 or Ed25519.
+    label_input : QLineEdit
+        The input field with an optional label of the key, stored in the keystore of the USB device.
+    key_pool : KeyPool, optional
+        The pool of RSA keys generated in the background, used in the key provisioning mode.
 
     Returns
     -------
     None
     """
     pin = pin_input.text()
+    algorithm = algorithm_combo.currentText()
 
     if pin and not pin.isdigit():
         status_label.setText("Błąd! PIN musi składać się tylko z cyfr.")
@@ -229,7 +245,7 @@ def generate_rsa(status_label, selected_usb_priv_key, selected_folder_pub_key, a
         """)
         return
 
-    status_label.setText("Generowanie kluczy RSA w toku...")
+    status_label.setText(f"Generowanie kluczy {algorithm} w toku...")
     status_label.setStyleSheet("""
         QLabel {
             font-family: 'Verdana', sans-serif;
@@ -245,9 +261,10 @@ def generate_rsa(status_label, selected_usb_priv_key, selected_folder_pub_key, a
     app.processEvents()
 
     try:
-        key_generator(pin, selected_usb_priv_key, selected_folder_pub_key)
+        key_id = key_generator(pin, selected_usb_priv_key, selected_folder_pub_key, algorithm, label_input.text() or None,
+                               key_pool=key_pool)
         status_label.setText(
-            f"Sukces! Klucze prywatny został zapisany w folderze: {selected_usb_priv_key}, a klucz publiczny w {selected_folder_pub_key}")
+            f"Sukces! Klucz prywatny {key_id[:16]} został zapisany w magazynie kluczy na: {selected_usb_priv_key}, a klucz publiczny w {selected_folder_pub_key}")
         status_label.setStyleSheet("""
             QLabel {
                 font-family: 'Verdana', sans-serif;
@@ -260,6 +277,7 @@ def generate_rsa(status_label, selected_usb_priv_key, selected_folder_pub_key, a
             }
         """)
         pin_input.clear()
+        label_input.clear()
     except Exception as e:
         status_label.setText(f"Błąd podczas generowania kluczy: {str(e)}")
         status_label.setStyleSheet("""
@@ -283,6 +301,7 @@ def create_gui():
     The GUI includes the following components:
     - A folder selection dialog for saving the keys.
     - A PIN input field for entering a security PIN.
+    - A combo box for choosing the key algorithm (RSA, ECDSA-P256 or Ed25519).
     - A button to trigger the RSA key generation process.
     - A status label to display messages to the user.
 
@@ -361,15 +380,23 @@ def create_gui():
 
     usb_list = QListWidget(window)
 
-    button_refresh_usb = QPushButton('🔄 Odśwież listę USB', window)
-
     button_select_folder_pub_key = QPushButton('📜 Wybierz folder dla klucza publicznego', window)
 
     pin_input = QLineEdit(window)
     pin_input.setEchoMode(QLineEdit.Password)
     pin_input.setPlaceholderText("Wpisz PIN")
 
-    button_generate_rsa = QPushButton('🔑 Generuj RSA', window)
+    label_input = QLineEdit(window)
+    label_input.setPlaceholderText("Etykieta klucza (opcjonalnie)")
+
+    algorithm_combo = QComboBox(window)
+    algorithm_combo.addItems(ALGORITHMS)
+    algorithm_combo.setCurrentText(DEFAULT_ALGORITHM)
+
+    button_generate_rsa = QPushButton('🔑 Generuj klucze', window)
+
+    checkbox_key_pool = QCheckBox("Tryb wydawania kluczy (przygotowuj klucze RSA w tle)", window)
+    key_pool = None
 
     def select_folder_priv_key_clicked():
         nonlocal selected_usb_priv_key
@@ -379,15 +406,36 @@ def create_gui():
         nonlocal selected_folder_pub_key
         selected_folder_pub_key = select_folder_pub_key(window, folder_pub_label, status_label, selected_usb_priv_key)
 
-    button_refresh_usb.clicked.connect(lambda: refresh_usb(window, usb_list, status_label, app))
+    def key_pool_toggled(checked):
+        nonlocal key_pool
+        if checked:
+            key_pool = KeyPool()
+            key_pool.start()
+        elif key_pool is not None:
+            key_pool.stop()
+            key_pool = None
+
+    def stop_key_pool():
+        if key_pool is not None:
+            key_pool.stop()
+
+    def usb_devices_changed(added, removed):
+        nonlocal selected_usb_priv_key
+        selected_usb_priv_key = update_usb_devices(added, removed, usb_list, status_label, folder_label, selected_usb_priv_key)
+
+    mount_watcher = MountWatcher(window)
+    mount_watcher.changed.connect(usb_devices_changed)
+    mount_watcher.error.connect(lambda e: status_label.setText(f"Błąd podczas wyszukiwania nośników USB: {str(e)}"))
+    app.aboutToQuit.connect(mount_watcher.stop)
+    app.aboutToQuit.connect(stop_key_pool)
+    checkbox_key_pool.toggled.connect(key_pool_toggled)
     usb_list.itemClicked.connect(select_folder_priv_key_clicked)
     button_select_folder_pub_key.clicked.connect(select_folder_priv_pub_clicked)
-    button_generate_rsa.clicked.connect(lambda: generate_rsa(status_label, selected_usb_priv_key, selected_folder_pub_key, app, pin_input))
+    button_generate_rsa.clicked.connect(lambda: generate_rsa(status_label, selected_usb_priv_key, selected_folder_pub_key, app, pin_input, algorithm_combo, label_input, key_pool))
 
     folder_layout.addWidget(folder_label_title)
     folder_layout.addWidget(private_key_label)
     folder_layout.addWidget(usb_list)
-    folder_layout.addWidget(button_refresh_usb)
     folder_layout.addWidget(folder_label)
     folder_layout.addWidget(public_key_label)
     folder_layout.addWidget(button_select_folder_pub_key)
@@ -396,6 +444,9 @@ def create_gui():
     layout.addLayout(folder_layout)
     layout.addWidget(key_label_title)
     layout.addWidget(pin_input)
+    layout.addWidget(label_input)
+    layout.addWidget(algorithm_combo)
+    layout.addWidget(checkbox_key_pool)
     layout.addWidget(button_generate_rsa)
     layout.addWidget(status_label)
 
@@ -455,5 +506,6 @@ def create_gui():
 
     window.setLayout(layout)
     window.show()
+    mount_watcher.start()
 
     sys.exit(app.exec_())
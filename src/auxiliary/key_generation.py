@@ -1,103 +1,125 @@
 import os
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
-from Crypto.Cipher import AES
-from Crypto.Hash import SHA256
-from Crypto.Util.Padding import pad
 
-RSA_KEY_SIZE = 4096
-PUBLIC_EXPONENT = 65537
+from src.key_algorithms import ALGORITHM_RSA, DEFAULT_ALGORITHM, PUBLIC_EXPONENT, RSA_KEY_SIZE, generate_private_key, \
+    key_algorithm, public_key_fingerprint
+from src.key_container import encrypt_private_key as encrypt_key_container
+from src.keystore import Keystore
+from src.parallel_keygen import generate_rsa_private_key
+from src.atomic_write import write_atomically
 
 
-def generate_keys():
+def generate_keys(algorithm=DEFAULT_ALGORITHM, key_pool=None, workers=None):
     """
-    Generates a pair of RSA keys: a private key and a public key.
+    Generates a key pair: a private key and a public key.
 
-    This function uses the cryptography library to generate an RSA private key with the specified key size and public exponent.
-    The corresponding public key is derived from the private key.
+    This function uses the cryptography library to generate a private key for the chosen algorithm. RSA keys are
+    generated with the specified key size and public exponent; ECDSA P-256 and Ed25519 keys are much faster to generate
+    and to sign with. The corresponding public key is derived from the private key.
+
+    If a pool of keys generated in advance is given and holds a key of the chosen algorithm, that key is used instead
+    of generating a new one.
+
+    Parameters
+    ----------
+    algorithm : str, optional
+        The key algorithm, one of `src.key_algorithms.ALGORITHMS`. Defaults to 4096-bit RSA.
+    key_pool : KeyPool, optional
+        The pool of keys generated in the background (see `src.auxiliary.key_pool.KeyPool`).
+    workers : int, optional
+        If greater than 1, the primes of an RSA key are searched for by this many processes at the same time (see
+        `src.parallel_keygen`), which shortens the generation time on multi-core machines. By default the key is
+        generated by OpenSSL on a single core.
 
     Returns
     -------
-    private_key : RSA key
+    private_key : private key
         The generated private key.
-    public_key : RSA key
+    public_key : public key
         The generated public key.
     """
-    private_key = rsa.generate_private_key(public_exponent=PUBLIC_EXPONENT, key_size=RSA_KEY_SIZE,
-                                           backend=default_backend())
+    private_key = None
+    if key_pool is not None and key_pool.algorithm == algorithm:
+        private_key = key_pool.take()
+    if private_key is None and algorithm == ALGORITHM_RSA and workers is not None and workers > 1:
+        private_key = generate_rsa_private_key(RSA_KEY_SIZE, PUBLIC_EXPONENT, workers)
+    if private_key is None:
+        private_key = generate_private_key(algorithm)
     public_key = private_key.public_key()
 
     return private_key, public_key
 
 
-def encrypt_private_key(private_key, pin):
+def encrypt_private_key(private_key, pin, kdf_cost=None):
     """
-    Encrypts the private key using AES encryption with a key derived from the provided PIN.
+    Encrypts the private key with a key derived from the provided PIN.
 
-    This function uses AES encryption in CBC mode to encrypt the private key. The PIN is hashed using SHA-256
-    and then used as the key for the AES encryption. A random initialization vector (IV) is generated for the CBC mode.
+    The private key is stored in a version 2 key container (see `src.key_container.encrypt_private_key`): a header
+    with the key algorithm and the fingerprint of the public key, followed by the DER encoded PKCS#8 private key
+    encrypted and authenticated with AES-256-GCM. The encryption key is derived from the PIN with scrypt (or PBKDF2),
+    whose cost is calibrated so that unlocking the key takes about 250 ms on the current host (see `src.kdf`).
 
     Parameters
     ----------
-    private_key : RSA key
+    private_key : private key
         The private key to be encrypted.
     pin : str
         The PIN used to generate the encryption key.
+    kdf_cost : KdfCost, optional
+        The key derivation function and its cost, e.g. from `src.kdf.calibrate_kdf` with another target latency.
+        Defaults to the cost calibrated for 250 ms.
 
     Returns
     -------
     encrypted_key : bytes
-        The encrypted private key, which includes the IV followed by the encrypted data.
+        The key container with the encrypted private key.
     """
-    iv = os.urandom(16)
-
-    # Hash the PIN to create a key for AES encryption
-    hashed_pin = SHA256.new(pin.encode()).digest()
-    cipher = AES.new(hashed_pin, AES.MODE_CBC, iv)
-
-    private_key_bytes = private_key.private_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.PKCS8,
-        encryption_algorithm=serialization.NoEncryption()
-    )
+    return encrypt_key_container(private_key, pin, kdf_cost)
 
-    encrypted_key = cipher.encrypt(pad(private_key_bytes, AES.block_size))
 
-    return iv + encrypted_key
-
-
-def save_keys(public_key, private_key, directory, directory_pub):
+def save_keys(public_key, private_key, directory, directory_pub, label=None):
     """
-    Saves the public and encrypted private keys to the specified directory.
+    Saves the encrypted private key in the keystore of the medium and the public key in the specified directory.
 
-    This function writes the public key to a `.pubk` file and the encrypted private key to a `.pk` file.
-    Both files are saved in the specified directory.
+    The encrypted private key is added to the keystore in `directory` under its key ID, the fingerprint of the public
+    key (see `src.keystore.Keystore`), so the keys generated before are kept. The public key is written both as
+    `<key id>.pubk` and as `public_key.pubk`, which always holds the most recently generated key. All the files are
+    written atomically, so an interrupted run never leaves a truncated key behind.
 
     Parameters
     ----------
-    public_key : RSA key
-        The public key to be saved.
+    public_key : public key
+        The public key to be saved. Its SubjectPublicKeyInfo encoding records the key algorithm.
     private_key : bytes
         The encrypted private key to be saved.
     directory : str
-        The directory where the keys will be saved.
+        The medium where the keystore with the private key is kept.
+    directory_pub : str
+        The directory where the public key will be saved.
+    label : str, optional
+        A description of the key stored in the keystore index.
+
+    Returns
+    -------
+    key_id : str
+        The ID of the saved key.
     """
-    public_key_path = os.path.join(directory_pub, "public_key.pubk")
-    with open(public_key_path, "wb") as public_key_file:
-        public_key_file.write(public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        ))
+    key_id = public_key_fingerprint(public_key)
+    public_key_pem = public_key.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    for name in (f"{key_id}.pubk", "public_key.pubk"):
+        write_atomically(os.path.join(directory_pub, name), public_key_pem)
 
-    private_key_path = os.path.join(directory, "encrypted_private_key.pk")
-    with open(private_key_path, "wb") as private_key_file:
-        private_key_file.write(private_key)
+    Keystore(directory).add(key_id, private_key, key_algorithm(public_key), label)
+    return key_id
 
 
-def key_generator(pin, directory, directory_pub):
+def key_generator(pin, directory, directory_pub, algorithm=DEFAULT_ALGORITHM, label=None, kdf_cost=None,
+                  key_pool=None, workers=None):
     """
-    Generates a pair of RSA keys, encrypts the private key using the provided PIN, and saves the keys to a directory.
+    Generates a key pair, encrypts the private key using the provided PIN, and saves the keys to a directory.
 
     This function calls `generate_keys` to generate the keys, then `encrypt_private_key` to encrypt the private key,
     and finally `save_keys` to save the keys to disk.
@@ -108,11 +130,22 @@ def key_generator(pin, directory, directory_pub):
         The PIN used to encrypt the private key.
     directory : str
         The directory where the keys will be saved.
+    algorithm : str, optional
+        The key algorithm, one of `src.key_algorithms.ALGORITHMS`. Defaults to 4096-bit RSA.
+    label : str, optional
+        A description of the key stored in the keystore index.
+    kdf_cost : KdfCost, optional
+        The key derivation function and its cost. Defaults to the cost calibrated on the current host.
+    key_pool : KeyPool, optional
+        The pool of keys generated in the background, used instead of generating the key when it is not empty.
+    workers : int, optional
+        The number of processes searching for the primes of an RSA key, see `generate_keys`.
 
     Returns
     -------
-    None
+    key_id : str
+        The ID of the generated key.
     """
-    private_key, public_key = generate_keys()
-    private_key_encrypted = encrypt_private_key(private_key, pin)
-    save_keys(public_key, private_key_encrypted, directory, directory_pub)
+    private_key, public_key = generate_keys(algorithm, key_pool, workers)
+    private_key_encrypted = encrypt_private_key(private_key, pin, kdf_cost)
+    return save_keys(public_key, private_key_encrypted, directory, directory_pub, label)
@@ -0,0 +1,200 @@
+import multiprocessing
+import threading
+
+from cryptography.hazmat.primitives import serialization
+
+from src.key_algorithms import DEFAULT_ALGORITHM, generate_private_key
+from src.key_container import load_authenticated_der_key
+
+DEFAULT_POOL_SIZE = 3
+MAX_KEY_DER_SIZE = 16384
+
+
+def _generate_keys(connection, slots, algorithm):
+    """
+    Runs in the background process: generates a key whenever the pool has a free slot and sends it to the
+    application.
+
+    Parameters
+    ----------
+    connection : multiprocessing.connection.Connection
+        The sending end of the pipe to the application.
+    slots : multiprocessing.Semaphore
+        The number of free places in the pool.
+    algorithm : str
+        The key algorithm, one of `src.key_algorithms.ALGORITHMS`.
+
+    Returns
+    -------
+    None.
+    """
+    try:
+        while True:
+            slots.acquire()
+            private_key = generate_private_key(algorithm)
+            connection.send_bytes(private_key.private_bytes(
+                encoding=serialization.Encoding.DER,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            ))
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+
+
+class KeyPool:
+    """
+    Pool of private keys generated in advance by a background process.
+
+    Generating a 4096-bit RSA key takes from one to more than ten seconds. When many USB devices are provisioned one
+    after another, the pool keeps a few keys ready, so generating keys only takes a key from the pool, encrypts it and
+    writes it. A background process refills the pool while the user connects the next device.
+
+    The keys are kept only in the memory of the application, as DER encoded PKCS#8 in `bytearray` buffers, and never
+    written to disk. A key is taken out of the pool exactly once, and its buffer is overwritten with zeros as soon as
+    it is loaded; `stop` terminates the background process and overwrites the keys which were not used.
+    """
+
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, size=DEFAULT_POOL_SIZE):
+        """
+        Parameters
+        ----------
+        algorithm : str, optional
+            The algorithm of the pooled keys. Defaults to 4096-bit RSA, the only one slow enough to need a pool.
+        size : int, optional
+            The number of keys kept ready.
+        """
+        self.algorithm = algorithm
+        self.size = size
+        self._keys = []
+        self._lock = threading.Lock()
+        self._process = None
+        self._connection = None
+        self._slots = None
+        self._reader = None
+
+    def start(self):
+        """
+        Starts the background process filling the pool. Does nothing if it is already running.
+
+        The process is started with the `spawn` method, so it does not inherit the state of the Qt application.
+
+        Returns
+        -------
+        None.
+        """
+        if self._process is not None:
+            return
+
+        context = multiprocessing.get_context("spawn")
+        receiving, sending = context.Pipe(duplex=False)
+        self._slots = context.Semaphore(self.size)
+        self._process = context.Process(target=_generate_keys, args=(sending, self._slots, self.algorithm),
+                                        name="key-pool", daemon=True)
+        self._process.start()
+        sending.close()
+
+        self._connection = receiving
+        self._reader = threading.Thread(target=self._receive_keys, args=(receiving,), name="key-pool-reader",
+                                        daemon=True)
+        self._reader.start()
+
+    def take(self):
+        """
+        Takes a key out of the pool and frees its place for the next key.
+
+        Returns
+        -------
+        private key or None
+            The private key, or `None` if the pool is empty or not running and the key has to be generated directly.
+        """
+        with self._lock:
+            if not self._keys or self._process is None:
+                return None
+            private_key_der = self._keys.pop(0)
+            self._slots.release()
+
+        try:
+            return load_authenticated_der_key(private_key_der)
+        finally:
+            wipe(private_key_der)
+
+    def available(self):
+        """
+        Returns the number of keys ready in the pool.
+
+        Returns
+        -------
+        int
+        """
+        with self._lock:
+            return len(self._keys)
+
+    def stop(self):
+        """
+        Terminates the background process and overwrites the keys left in the pool with zeros.
+
+        Returns
+        -------
+        None.
+        """
+        with self._lock:
+            process, connection = self._process, self._connection
+            self._process = self._connection = None
+            for private_key_der in self._keys:
+                wipe(private_key_der)
+            self._keys.clear()
+
+        if process is not None:
+            process.terminate()
+            process.join(timeout=5)
+        if self._reader is not None:
+            self._reader.join(timeout=5)
+            self._reader = None
+        if connection is not None:
+            connection.close()
+
+    def _receive_keys(self, connection):
+        """
+        Runs on the reader thread: receives the keys generated by the background process and puts them into the pool
+        until the process ends.
+
+        Parameters
+        ----------
+        connection : multiprocessing.connection.Connection
+            The receiving end of the pipe from the background process.
+
+        Returns
+        -------
+        None.
+        """
+        buffer = bytearray(MAX_KEY_DER_SIZE)
+        try:
+            while True:
+                size = connection.recv_bytes_into(buffer)
+                private_key_der = buffer[:size]
+                wipe(buffer)
+                with self._lock:
+                    if self._connection is not connection:
+                        wipe(private_key_der)
+                        return
+                    self._keys.append(private_key_der)
+        except (EOFError, OSError):
+            pass
+        finally:
+            wipe(buffer)
+
+
+def wipe(buffer):
+    """
+    Overwrites a buffer holding key material with zeros.
+
+    Parameters
+    ----------
+    buffer : bytearray
+        The buffer to overwrite.
+
+    Returns
+    -------
+    None.
+    """
+    buffer[:] = bytes(len(buffer))
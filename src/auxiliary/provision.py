@@ -0,0 +1,267 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cryptography.hazmat.primitives import serialization
+
+from src.auxiliary.key_generation import encrypt_private_key, generate_keys, save_keys
+from src.kdf import DEFAULT_TARGET_LATENCY, calibrate_kdf
+from src.key_algorithms import ALGORITHMS, DEFAULT_ALGORITHM
+from src.pin_source import read_pin
+
+MANIFEST_FIELDS = ["user", "pin", "private_key_dir", "public_key_dir", "algorithm"]
+REPORT_FIELDS = ["user", "status", "key_id", "algorithm", "private_key_dir", "public_key_dir", "seconds", "error"]
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+ProvisioningEntry = namedtuple("ProvisioningEntry", ["user", "pin_source", "private_key_dir", "public_key_dir",
+                                                     "algorithm"])
+ProvisioningRecord = namedtuple("ProvisioningRecord", REPORT_FIELDS)
+
+_worker_kdf_cost = None
+
+
+def read_manifest(manifest_file, default_algorithm=DEFAULT_ALGORITHM):
+    """
+    Reads the provisioning manifest.
+
+    The manifest is a CSV file with a header row and the columns `user`, `pin`, `private_key_dir`, `public_key_dir`
+    and, optionally, `algorithm`. The `pin` column names the source of the PIN, never the PIN itself (see
+    `src.pin_source.read_pin`).
+
+    Parameters
+    ----------
+    manifest_file : file object
+        The text file with the manifest.
+    default_algorithm : str, optional
+        The key algorithm of the rows with an empty `algorithm` column.
+
+    Returns
+    -------
+    list of ProvisioningEntry
+        The users to provision, in the order of the manifest.
+
+    Raises
+    ------
+    ValueError
+        If a required column is missing or a row is incomplete.
+    """
+    reader = csv.DictReader(manifest_file)
+    missing = [field for field in MANIFEST_FIELDS[:4] if field not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Brak kolumn w manifeście: {', '.join(missing)}")
+
+    entries = []
+    for row in reader:
+        values = [(row.get(field) or "").strip() for field in MANIFEST_FIELDS]
+        if not any(values):
+            continue
+        if not all(values[:4]):
+            raise ValueError(f"Niekompletny wiersz {reader.line_num} manifestu.")
+        entries.append(ProvisioningEntry(*values[:4], values[4] or default_algorithm))
+    return entries
+
+
+def _init_worker(kdf_cost):
+    """
+    Stores the key derivation cost, calibrated once in the main process, in every worker process of the pool.
+
+    Parameters
+    ----------
+    kdf_cost : KdfCost
+        The key derivation function and its cost.
+
+    Returns
+    -------
+    None.
+    """
+    global _worker_kdf_cost
+    _worker_kdf_cost = kdf_cost
+
+
+def _generate_task(algorithm, pin):
+    """
+    Generates a key pair and encrypts the private key in a worker process of the provisioning pool.
+
+    Parameters
+    ----------
+    algorithm : str
+        The key algorithm, one of `src.key_algorithms.ALGORITHMS`.
+    pin : str
+        The PIN used to encrypt the private key.
+
+    Returns
+    -------
+    public_key_der : bytes
+        The DER encoded public key.
+    encrypted_key : bytes
+        The encrypted private key. The unencrypted key never leaves the worker process.
+    seconds : float
+        The time of generating and encrypting the key.
+    """
+    start = time.perf_counter()
+    private_key, public_key = generate_keys(algorithm)
+    public_key_der = public_key.public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    encrypted_key = encrypt_private_key(private_key, pin, _worker_kdf_cost)
+    return public_key_der, encrypted_key, time.perf_counter() - start
+
+
+def provision_keys(entries, workers=None, kdf_cost=None, on_result=None):
+    """
+    Generates the keys of many users in parallel and saves them in their keystores.
+
+    The key pairs are generated and the private keys encrypted on a pool of worker processes, which is where all the
+    time goes. The keys are saved with `save_keys` in the main process as soon as they are ready, so users sharing a
+    keystore or a public key directory never update it at the same time, and every file is written atomically. The key
+    derivation is calibrated once before the pool starts, so all the keys get the same cost, measured on an idle host.
+
+    Parameters
+    ----------
+    entries : list of ProvisioningEntry
+        The users to provision, as returned by `read_manifest`.
+    workers : int, optional
+        The number of worker processes. Defaults to the number of CPUs.
+    kdf_cost : KdfCost, optional
+        The key derivation function and its cost. Defaults to the cost calibrated on the current host.
+    on_result : callable, optional
+        Called with every `ProvisioningRecord` as soon as the keys of the user are saved.
+
+    Returns
+    -------
+    list of ProvisioningRecord
+        The results for all the users, in the order in which they completed. Errors are reported in the records
+        instead of being raised, so a single wrong row does not stop the whole run.
+    """
+    kdf_cost = kdf_cost or calibrate_kdf()
+    results = []
+
+    def report(entry, key_id, seconds, error):
+        record = ProvisioningRecord(entry.user, STATUS_ERROR if error else STATUS_OK, key_id, entry.algorithm,
+                                    entry.private_key_dir, entry.public_key_dir, round(seconds, 3), error)
+        results.append(record)
+        if on_result is not None:
+            on_result(record)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(kdf_cost,)) as executor:
+        futures = {}
+        for entry in entries:
+            try:
+                if entry.algorithm not in ALGORITHMS:
+                    raise ValueError(f"Nieobsługiwany algorytm klucza: {entry.algorithm}")
+                pin = read_pin(entry.pin_source)
+            except (OSError, ValueError) as e:
+                report(entry, None, 0.0, str(e))
+                continue
+            futures[executor.submit(_generate_task, entry.algorithm, pin)] = entry
+
+        for future in as_completed(futures):
+            entry = futures[future]
+            seconds = 0.0
+            try:
+                public_key_der, encrypted_key, seconds = future.result()
+                os.makedirs(entry.public_key_dir, exist_ok=True)
+                key_id = save_keys(serialization.load_der_public_key(public_key_der), encrypted_key,
+                                   entry.private_key_dir, entry.public_key_dir, entry.user)
+                report(entry, key_id, seconds, None)
+            except Exception as e:
+                report(entry, None, seconds, str(e))
+
+    return results
+
+
+def create_report_writer(report_file, report_format):
+    """
+    Creates a function writing provisioning records to a JSONL or CSV report.
+
+    Parameters
+    ----------
+    report_file : file object
+        The text file where the report will be written.
+    report_format : str
+        The report format: `jsonl` or `csv`.
+
+    Returns
+    -------
+    callable
+        A function writing a single `ProvisioningRecord` to the report.
+    """
+    if report_format == "csv":
+        writer = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        return lambda record: writer.writerow(record._asdict())
+
+    return lambda record: report_file.write(json.dumps(record._asdict(), ensure_ascii=False) + "\n")
+
+
+def main(argv=None):
+    """
+    Entry point of the bulk key provisioning command.
+
+    Generates the keys of all the users listed in the manifest in parallel, saves them and writes a report with the
+    key ID of every user, or the reason why their keys could not be generated.
+
+    Usage: `python -m src.auxiliary.provision MANIFEST [--algorithm ALG] [--workers N] [--target MS]
+    [--format jsonl|csv] [--report FILE]`
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments. Defaults to `sys.argv[1:]`.
+
+    Returns
+    -------
+    int
+        The exit code: 0 if the keys of all the users were generated, 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(description="Generowanie kluczy wielu użytkowników według manifestu.")
+    parser.add_argument("manifest", help="Plik CSV z kolumnami user, pin (env:NAZWA, fd:N lub file:ŚCIEŻKA), "
+                                         "private_key_dir, public_key_dir i opcjonalnie algorithm "
+                                         "('-' oznacza standardowe wejście).")
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default=DEFAULT_ALGORITHM,
+                        help="Algorytm kluczy wierszy bez kolumny algorithm.")
+    parser.add_argument("--workers", type=int, default=None, help="Liczba procesów (domyślnie liczba rdzeni).")
+    parser.add_argument("--target", type=float, default=DEFAULT_TARGET_LATENCY * 1000,
+                        help="Docelowy czas odblokowania klucza w milisekundach.")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl", help="Format raportu.")
+    parser.add_argument("--report", help="Plik raportu (domyślnie standardowe wyjście).")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.manifest == "-":
+            entries = read_manifest(sys.stdin, args.algorithm)
+        else:
+            with open(args.manifest, encoding="utf-8", newline="") as manifest_file:
+                entries = read_manifest(manifest_file, args.algorithm)
+    except (OSError, ValueError) as e:
+        print(f"Nie można odczytać manifestu: {e}", file=sys.stderr)
+        return 1
+
+    report_file = open(args.report, "w", encoding="utf-8", newline="") if args.report else sys.stdout
+    start = time.perf_counter()
+    try:
+        results = provision_keys(entries, workers=args.workers, kdf_cost=calibrate_kdf(args.target / 1000),
+                                 on_result=create_report_writer(report_file, args.format))
+    finally:
+        if report_file is not sys.stdout:
+            report_file.close()
+    elapsed = time.perf_counter() - start
+
+    generated = sum(1 for record in results if record.status == STATUS_OK)
+    print(f"Wygenerowano klucze {generated} z {len(results)} użytkowników w {elapsed:.1f} s", file=sys.stderr)
+    for record in results:
+        if record.status != STATUS_OK:
+            print(f"BŁĄD {record.user}: {record.error}", file=sys.stderr)
+
+    return 0 if generated == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,319 @@
+import argparse
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from cryptography.hazmat.primitives import serialization
+
+from src.document_signing import decrypt_private_key, write_signed_pdf
+from src.detecting_usb import detect_usb_devices
+from src.find_keys import PRIVATE_KEY_NAME
+from src.key_discovery import discover_first_key
+from src.keystore import Keystore, locate_private_key
+from src.pin_source import resolve_pin
+
+PENDING_PER_WORKER = 4
+
+SigningResult = namedtuple("SigningResult", ["pdf_path", "output_pdf_path", "size", "seconds", "error"])
+SigningSummary = namedtuple("SigningSummary", ["signed", "failed", "size"])
+
+_worker_private_key = None
+
+
+def collect_pdf_files(inputs, output_dir):
+    """
+    Builds the list of PDF files to sign together with the paths of the signed copies.
+
+    Every input can be a PDF file or a directory. Directories are searched recursively for PDF files and their
+    relative layout is preserved in the output directory. Single files are saved in the output directory under their
+    own name.
+
+    Parameters
+    ----------
+    inputs : list of str
+        The paths to the PDF files or directories containing PDF files.
+    output_dir : str
+        The directory where the signed PDF files will be saved.
+
+    Returns
+    -------
+    list of tuple
+        The `(pdf_path, output_pdf_path)` pairs of the documents to sign.
+
+    Raises
+    ------
+    ValueError
+        If two input files would be saved under the same output path.
+    """
+    tasks = []
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            for root, _, files in os.walk(input_path):
+                for name in sorted(files):
+                    if name.lower().endswith(".pdf"):
+                        pdf_path = os.path.join(root, name)
+                        relative_path = os.path.relpath(pdf_path, input_path)
+                        tasks.append((pdf_path, os.path.join(output_dir, relative_path)))
+        else:
+            tasks.append((input_path, os.path.join(output_dir, os.path.basename(input_path))))
+
+    output_paths = set()
+    for _, output_pdf_path in tasks:
+        if output_pdf_path in output_paths:
+            raise ValueError(f"Kilka plików zostałoby zapisanych jako {output_pdf_path}.")
+        output_paths.add(output_pdf_path)
+
+    return tasks
+
+
+def _init_worker(private_key_der):
+    """
+    Loads the unlocked private key once in every worker process of the signing pool.
+
+    Parameters
+    ----------
+    private_key_der : bytes
+        The unencrypted DER encoded private key.
+
+    Returns
+    -------
+    None.
+    """
+    global _worker_private_key
+    _worker_private_key = serialization.load_der_private_key(private_key_der, password=None)
+
+
+def _sign_task(pdf_path, output_pdf_path):
+    """
+    Signs a single PDF file in a worker process of the signing pool.
+
+    Parameters
+    ----------
+    pdf_path : str
+        The path to the PDF file to be signed.
+    output_pdf_path : str
+        The path where the signed PDF file will be saved.
+
+    Returns
+    -------
+    SigningResult
+        The result of signing the document. Errors are reported in the `error` field instead of being raised, so a
+        single broken file does not stop the whole batch.
+    """
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(output_pdf_path)), exist_ok=True)
+        size = write_signed_pdf(pdf_path, output_pdf_path, _worker_private_key)
+        return SigningResult(pdf_path, output_pdf_path, size, time.perf_counter() - start, None)
+    except Exception as e:
+        return SigningResult(pdf_path, output_pdf_path, 0, time.perf_counter() - start, str(e))
+
+
+def sign_batch(tasks, private_key, workers=None, on_result=None):
+    """
+    Signs many PDF files in parallel with a single unlocked private key.
+
+    The private key is serialized once and handed to every worker process when the pool starts, so the key is
+    located, decrypted and parsed only once for the whole batch. The documents are then hashed and signed in parallel
+    on all available cores. At most `PENDING_PER_WORKER` documents per worker are queued at a time and the results
+    are only counted, so the memory used does not grow with the size of the batch.
+
+    Parameters
+    ----------
+    tasks : iterable of tuple
+        The `(pdf_path, output_pdf_path)` pairs of the documents to sign, as returned by `collect_pdf_files`.
+    private_key : private key
+        The unlocked private key used to sign the documents.
+    workers : int, optional
+        The number of worker processes. Defaults to the number of CPUs.
+    on_result : callable, optional
+        Called with every `SigningResult` as soon as the document is signed.
+
+    Returns
+    -------
+    SigningSummary
+        The number of signed documents, the number of documents which could not be signed and the total size of the
+        signed documents.
+    """
+    private_key_der = private_key.private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * PENDING_PER_WORKER
+    summary = SigningSummary(0, 0, 0)
+    pending = set()
+
+    def finish(done):
+        nonlocal summary
+        for future in done:
+            result = future.result()
+            if result.error:
+                summary = summary._replace(failed=summary.failed + 1)
+            else:
+                summary = summary._replace(signed=summary.signed + 1, size=summary.size + result.size)
+            if on_result is not None:
+                on_result(result)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(private_key_der,)) as executor:
+        for pdf_path, output_pdf_path in tasks:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                finish(done)
+            pending.add(executor.submit(_sign_task, pdf_path, output_pdf_path))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            finish(done)
+
+    return summary
+
+
+def find_keystore_key(devices, key_id=None):
+    """
+    Finds a private key in the keystores of the given devices.
+
+    Only the keystore index at the root of every device is read, so no device is searched.
+
+    Parameters
+    ----------
+    devices : list of UsbDevice
+        The devices to check.
+    key_id : str, optional
+        The key ID or its unique prefix. Defaults to the most recently created key of the first device with a
+        keystore.
+
+    Returns
+    -------
+    str or None
+        The path to the encrypted private key, or `None` if none of the keystores holds it.
+
+    Raises
+    ------
+    ValueError
+        If the key ID prefix is too short or ambiguous.
+    """
+    for device in devices:
+        keystore = Keystore(device.mountpoint)
+        device_key_id = key_id if key_id is not None else keystore.newest()
+        key_path = keystore.path(device_key_id) if device_key_id is not None else None
+        if key_path is not None:
+            return key_path
+    return None
+
+
+def format_throughput(size, seconds):
+    """
+    Formats a data size and the time it took to process it as a human-readable throughput.
+
+    Parameters
+    ----------
+    size : int
+        The number of bytes processed.
+    seconds : float
+        The processing time in seconds.
+
+    Returns
+    -------
+    str
+        The size, time and throughput in megabytes per second.
+    """
+    megabytes = size / (1024 * 1024)
+    rate = megabytes / seconds if seconds > 0 else 0.0
+    return f"{megabytes:.2f} MB w {seconds:.3f} s ({rate:.2f} MB/s)"
+
+
+def print_result(result):
+    """
+    Prints the result of signing a single document together with its throughput.
+
+    Parameters
+    ----------
+    result : SigningResult
+        The result of signing the document.
+
+    Returns
+    -------
+    None.
+    """
+    if result.error:
+        print(f"BŁĄD {result.pdf_path}: {result.error}", file=sys.stderr)
+    else:
+        print(f"Podpisano {result.pdf_path} -> {result.output_pdf_path}: "
+              f"{format_throughput(result.size, result.seconds)}")
+
+
+def main(argv=None):
+    """
+    Entry point of the batch signing command.
+
+    Unlocks the private key from the given USB device once, signs all the given PDF files into the output directory
+    and reports the per-file and total throughput. `--key-id` chooses a key from the keystore of the device, the most
+    recently created key is used by default. Without `--usb` the keystores of all the connected USB devices are
+    checked, and then all the devices are searched for the private key at the same time. The PIN is read from the
+    `--pin` source, the `QES_PIN` environment variable or the terminal, so the command can run unattended.
+
+    Usage: `python -m src.batch_signing [--usb PATH] [--key-id ID] [--pin SOURCE] --output DIR [--workers N]
+    PDF_OR_DIR...`
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments. Defaults to `sys.argv[1:]`.
+
+    Returns
+    -------
+    int
+        The exit code: 0 if all documents were signed, 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(description="Podpisywanie wielu plików PDF jednym kluczem prywatnym.")
+    parser.add_argument("inputs", nargs="+", help="Pliki PDF lub katalogi z plikami PDF.")
+    parser.add_argument("--usb", help="Ścieżka nośnika USB z kluczem prywatnym (domyślnie przeszukiwane są wszystkie "
+                                      "podłączone nośniki).")
+    parser.add_argument("--key-id", help="Identyfikator (lub jego początek) klucza z magazynu kluczy nośnika.")
+    parser.add_argument("--pin", help="Źródło PIN-u: env:NAZWA, fd:N lub file:ŚCIEŻKA (domyślnie zmienna QES_PIN "
+                                      "lub terminal).")
+    parser.add_argument("--output", required=True, help="Katalog, do którego zostaną zapisane podpisane pliki.")
+    parser.add_argument("--workers", type=int, default=None, help="Liczba procesów (domyślnie liczba rdzeni).")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.usb:
+            encrypted_key_path = locate_private_key(args.usb, args.key_id)
+        else:
+            encrypted_key_path = find_keystore_key(detect_usb_devices(), args.key_id)
+            if encrypted_key_path is None and args.key_id is None:
+                candidate = discover_first_key(PRIVATE_KEY_NAME)
+                encrypted_key_path = candidate.path if candidate else None
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+    if not encrypted_key_path:
+        print("Nie znaleziono klucza prywatnego na pendrive.", file=sys.stderr)
+        return 1
+
+    try:
+        private_key = decrypt_private_key(encrypted_key_path, resolve_pin(args.pin))
+        tasks = collect_pdf_files(args.inputs, args.output)
+    except (OSError, ValueError) as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    summary = sign_batch(tasks, private_key, workers=args.workers, on_result=print_result)
+    elapsed = time.perf_counter() - start
+
+    files_per_second = summary.signed / elapsed if elapsed > 0 else 0.0
+    print(f"Podpisano {summary.signed} z {summary.signed + summary.failed} plików: "
+          f"{format_throughput(summary.size, elapsed)}, {files_per_second:.1f} plików/s")
+
+    return 0 if summary.failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,391 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from cryptography.hazmat.primitives import serialization
+
+from src.key_algorithms import public_key_fingerprint
+from src.key_cache import public_keys
+from src.trust_store import TrustStore
+from src.verification_index import VerificationIndex
+from src.verify_signature import STATUS_VALID, check_signature_in_trust_store, check_signature_with_digest
+
+STATUS_ERROR = "error"
+PENDING_PER_WORKER = 4
+REPORT_FIELDS = ["path", "status", "key", "digest", "cached", "seconds", "error"]
+
+VerificationRecord = namedtuple("VerificationRecord", REPORT_FIELDS)
+
+_worker_public_key = None
+_worker_public_key_path = None
+_worker_key_fingerprint = None
+_worker_trust_store = None
+
+
+def iter_pdf_files(inputs, manifest=None):
+    """
+    Lazily yields the paths of the PDF files to verify.
+
+    Every input can be a PDF file or a directory, which is searched recursively for PDF files. The manifest, if given,
+    is a text file with one path per line; `-` reads the manifest from the standard input. The paths are yielded as
+    they are found, so huge archives can be processed without building the full list first.
+
+    Parameters
+    ----------
+    inputs : list of str
+        The paths to the PDF files or directories containing PDF files.
+    manifest : str, optional
+        The path to the manifest file.
+
+    Returns
+    -------
+    generator of str
+        The paths of the PDF files.
+    """
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            for root, _, files in os.walk(input_path):
+                for name in sorted(files):
+                    if name.lower().endswith(".pdf"):
+                        yield os.path.join(root, name)
+        else:
+            yield input_path
+
+    if manifest == "-":
+        yield from _iter_manifest(sys.stdin)
+    elif manifest:
+        with open(manifest, encoding="utf-8") as manifest_file:
+            yield from _iter_manifest(manifest_file)
+
+
+def _iter_manifest(manifest_file):
+    """
+    Yields the non-empty lines of a manifest file as paths.
+
+    Parameters
+    ----------
+    manifest_file : file object
+        The text file with one path per line.
+
+    Returns
+    -------
+    generator of str
+        The paths listed in the manifest.
+    """
+    for line in manifest_file:
+        path = line.strip()
+        if path:
+            yield path
+
+
+def _init_worker(public_key_pem, trust_store_dir=None, public_key_path=None):
+    """
+    Prepares the public key or opens the trust store once in every worker process of the verification pool.
+
+    A public key given as a file is loaded through the shared `public_keys` cache of the worker before every document
+    (see `_worker_key`), so it is parsed only once per worker and a replaced key file is picked up.
+
+    Parameters
+    ----------
+    public_key_pem : bytes or None
+        The PEM encoded public key, `None` if the key file or the trust store is used.
+    trust_store_dir : str, optional
+        The trust store directory.
+    public_key_path : str, optional
+        The path to the PEM encoded public key.
+
+    Returns
+    -------
+    None.
+    """
+    global _worker_public_key, _worker_public_key_path, _worker_key_fingerprint, _worker_trust_store
+    if trust_store_dir is not None:
+        _worker_trust_store = TrustStore(trust_store_dir)
+    elif public_key_path is not None:
+        _worker_public_key_path = public_key_path
+    else:
+        _worker_public_key = serialization.load_pem_public_key(public_key_pem)
+        _worker_key_fingerprint = public_key_fingerprint(_worker_public_key)
+
+
+def _load_key_file(public_key_path, loaded=(None, None)):
+    """
+    Loads a public key file through the shared `public_keys` cache together with its fingerprint.
+
+    Parameters
+    ----------
+    public_key_path : str
+        The path to the PEM encoded public key.
+    loaded : tuple, optional
+        The public key and fingerprint returned by the previous call, reused while the key file is unchanged.
+
+    Returns
+    -------
+    public_key : public key
+        The public key stored in the file.
+    fingerprint : str
+        The hex encoded fingerprint of the public key, computed again only when the key file changes.
+    """
+    public_key = public_keys.load(public_key_path)
+    if public_key is loaded[0]:
+        return loaded
+    return public_key, public_key_fingerprint(public_key)
+
+
+def _worker_key():
+    """
+    Returns the public key of the worker process and its fingerprint.
+
+    Returns
+    -------
+    public_key : public key
+        The public key used to verify the documents.
+    fingerprint : str
+        The hex encoded fingerprint of the public key.
+    """
+    global _worker_public_key, _worker_key_fingerprint
+    if _worker_public_key_path is not None:
+        _worker_public_key, _worker_key_fingerprint = _load_key_file(_worker_public_key_path,
+                                                                     (_worker_public_key, _worker_key_fingerprint))
+    return _worker_public_key, _worker_key_fingerprint
+
+
+def _verify_task(pdf_path):
+    """
+    Verifies a single PDF file in a worker process of the verification pool.
+
+    Parameters
+    ----------
+    pdf_path : str
+        The path to the PDF file to verify.
+
+    Returns
+    -------
+    VerificationRecord
+        The result of the verification. Errors are reported with the `STATUS_ERROR` status instead of being raised.
+    """
+    start = time.perf_counter()
+    key = _worker_key_fingerprint
+    try:
+        if _worker_trust_store is not None:
+            status, digest, key = check_signature_in_trust_store(pdf_path, _worker_trust_store)
+        else:
+            public_key, key = _worker_key()
+            status, digest = check_signature_with_digest(pdf_path, public_key)
+        error = None
+    except Exception as e:
+        status, digest = STATUS_ERROR, None
+        error = str(e)
+    return VerificationRecord(pdf_path, status, key, digest, False, time.perf_counter() - start, error)
+
+
+def verify_batch(pdf_paths, public_key_pem=None, workers=None, on_result=None, index=None, trust_store_dir=None,
+                 public_key_path=None):
+    """
+    Verifies the signatures of many PDF files in parallel.
+
+    The documents are distributed over a pool of worker processes. At most `PENDING_PER_WORKER` documents per worker
+    are queued at a time, so the paths can come from a lazy generator over an archive of any size without holding
+    all the pending tasks in memory.
+
+    With a trust store instead of a public key, every document is verified with the trusted key identified by its
+    `/KeyID` field, and the `key` field of the records is the fingerprint of the signer.
+
+    If a verification index is given, files that did not change since their last verification with the same key are
+    answered from the index without being read, and the results of the verified files are stored in it under the
+    fingerprint of the key the worker actually used. A key file replaced during the batch is picked up by the workers
+    and by the index lookups alike. Paths
+    pointing to the same file (hard links, repeated manifest entries) are hashed only once per batch.
+
+    Parameters
+    ----------
+    pdf_paths : iterable of str
+        The paths of the PDF files to verify.
+    public_key_pem : bytes, optional
+        The PEM encoded public key used to verify the signatures. Required unless a key file or a trust store is given.
+    workers : int, optional
+        The number of worker processes. Defaults to the number of CPUs.
+    on_result : callable, optional
+        Called with every `VerificationRecord` as soon as the document is verified.
+    index : VerificationIndex, optional
+        The persistent store of verification results.
+    trust_store_dir : str, optional
+        The trust store directory, see `src.trust_store`.
+    public_key_path : str, optional
+        The path to the PEM encoded public key, used instead of `public_key_pem`. The key is loaded through the
+        `src.key_cache.public_keys` cache of every process.
+
+    Returns
+    -------
+    collections.Counter
+        The number of documents with every status.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * PENDING_PER_WORKER
+    if trust_store_dir is not None:
+        key_fingerprint = TrustStore(trust_store_dir).version()
+    elif public_key_path is not None:
+        loaded_key = _load_key_file(public_key_path)
+        key_fingerprint = loaded_key[1]
+    else:
+        key_fingerprint = public_key_fingerprint(serialization.load_pem_public_key(public_key_pem))
+    counts = Counter()
+    tasks = {}
+    in_flight = {}
+    linked_results = {}
+
+    def report(record, stat, store):
+        if store and index is not None and stat is not None and record.status != STATUS_ERROR:
+            index_key = key_fingerprint if trust_store_dir is not None else record.key
+            index.store(record.path, stat, index_key, record.status, record.digest, record.key)
+        counts[record.status] += 1
+        if on_result is not None:
+            on_result(record)
+
+    def finish(future):
+        record = future.result()
+        stat, identity, duplicates = tasks.pop(future)
+        report(record, stat, store=True)
+        if identity is not None:
+            del in_flight[identity]
+            if stat.st_nlink > 1:
+                linked_results[identity] = record
+        for duplicate_path, duplicate_stat in duplicates:
+            report(record._replace(path=duplicate_path, cached=True, seconds=0.0), duplicate_stat, store=True)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(public_key_pem, trust_store_dir, public_key_path)) as executor:
+        for pdf_path in pdf_paths:
+            try:
+                stat = os.stat(pdf_path)
+                identity = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                stat = identity = None
+
+            if public_key_path is not None and index is not None:
+                try:
+                    loaded_key = _load_key_file(public_key_path, loaded_key)
+                    key_fingerprint = loaded_key[1]
+                except (OSError, ValueError):
+                    key_fingerprint = None
+
+            if stat is not None:
+                cached = index.lookup(pdf_path, stat, key_fingerprint) \
+                    if index is not None and key_fingerprint is not None else None
+                if cached is not None:
+                    status, digest, signer = cached
+                    if signer is None and trust_store_dir is None:
+                        signer = key_fingerprint
+                    report(VerificationRecord(pdf_path, status, signer, digest, True, 0.0, None), stat, store=False)
+                    continue
+                if identity in linked_results:
+                    report(linked_results[identity]._replace(path=pdf_path, cached=True, seconds=0.0), stat,
+                           store=True)
+                    continue
+                if identity in in_flight:
+                    tasks[in_flight[identity]][2].append((pdf_path, stat))
+                    continue
+
+            if len(tasks) >= max_pending:
+                done, _ = wait(list(tasks), return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+
+            future = executor.submit(_verify_task, pdf_path)
+            tasks[future] = (stat, identity, [])
+            if identity is not None:
+                in_flight[identity] = future
+
+        while tasks:
+            done, _ = wait(list(tasks), return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(future)
+
+    return counts
+
+
+def create_report_writer(report_file, report_format):
+    """
+    Creates a function writing verification records to a JSONL or CSV report.
+
+    Parameters
+    ----------
+    report_file : file object
+        The text file where the report will be written.
+    report_format : str
+        The report format: `jsonl` or `csv`.
+
+    Returns
+    -------
+    callable
+        A function writing a single `VerificationRecord` to the report.
+    """
+    if report_format == "csv":
+        writer = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        return lambda record: writer.writerow(record._asdict())
+
+    return lambda record: report_file.write(json.dumps(record._asdict(), ensure_ascii=False) + "\n")
+
+
+def main(argv=None):
+    """
+    Entry point of the batch verification command.
+
+    Verifies all the given PDF files against a single public key, or against the trust store, in parallel and writes a
+    machine-readable report with the status code, signer key fingerprint and verification time of every document.
+
+    Usage: `python -m src.batch_verification (--key KEY | --trust-store DIR) [--manifest FILE] [--format jsonl|csv] [--report FILE]
+    [--workers N] [--index DB] [PDF_OR_DIR...]`
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments. Defaults to `sys.argv[1:]`.
+
+    Returns
+    -------
+    int
+        The exit code: 0 if all signatures are valid, 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(description="Weryfikacja podpisów wielu plików PDF.")
+    parser.add_argument("inputs", nargs="*", help="Pliki PDF lub katalogi z plikami PDF.")
+    key_group = parser.add_mutually_exclusive_group(required=True)
+    key_group.add_argument("--key", help="Ścieżka do klucza publicznego.")
+    key_group.add_argument("--trust-store", help="Katalog magazynu zaufanych kluczy (klucz jest wybierany według "
+                                                 "pola /KeyID podpisu).")
+    parser.add_argument("--manifest", help="Plik z listą ścieżek (jedna na linię, '-' oznacza standardowe wejście).")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl", help="Format raportu.")
+    parser.add_argument("--report", help="Plik raportu (domyślnie standardowe wyjście).")
+    parser.add_argument("--workers", type=int, default=None, help="Liczba procesów (domyślnie liczba rdzeni).")
+    parser.add_argument("--index", help="Baza SQLite z wynikami poprzednich weryfikacji.")
+    args = parser.parse_args(argv)
+
+    if not args.inputs and not args.manifest:
+        parser.error("Nie podano plików do weryfikacji.")
+
+    report_file = open(args.report, "w", encoding="utf-8", newline="") if args.report else sys.stdout
+    index = VerificationIndex(args.index) if args.index else None
+    try:
+        write_record = create_report_writer(report_file, args.format)
+        counts = verify_batch(iter_pdf_files(args.inputs, args.manifest), workers=args.workers, on_result=write_record,
+                              index=index, trust_store_dir=args.trust_store, public_key_path=args.key)
+    finally:
+        if index is not None:
+            index.close()
+        if report_file is not sys.stdout:
+            report_file.close()
+
+    summary = ", ".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+    print(f"Zweryfikowano {sum(counts.values())} plików ({summary})", file=sys.stderr)
+
+    return 0 if counts[STATUS_VALID] == sum(counts.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,310 @@
+import argparse
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+from src.pin_source import resolve_pin
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+def open_input(path):
+    """
+    Opens the input document, `-` or no path meaning the standard input.
+
+    Parameters
+    ----------
+    path : str or None
+        The path of the document.
+
+    Returns
+    -------
+    file object
+        The document opened in binary mode. The standard input is not closed when the returned object is closed.
+    """
+    if path in (None, "-"):
+        return os.fdopen(os.dup(sys.stdin.buffer.fileno()), "rb")
+    return open(path, "rb")
+
+
+def open_seekable_input(path):
+    """
+    Opens the input document for random access, which signature verification needs.
+
+    A path, or a standard input redirected from a regular file, is used directly. A pipe is first copied in chunks to
+    an anonymous temporary file, which disappears when it is closed.
+
+    Parameters
+    ----------
+    path : str or None
+        The path of the document, `-` or `None` for the standard input.
+
+    Returns
+    -------
+    file object
+        The document opened in binary mode, with a real file descriptor.
+    """
+    source = open_input(path)
+    if stat.S_ISREG(os.fstat(source.fileno()).st_mode):
+        source.seek(0)
+        return source
+
+    with source:
+        spool = tempfile.TemporaryFile()
+        shutil.copyfileobj(source, spool, SPOOL_CHUNK_SIZE)
+        spool.seek(0)
+        return spool
+
+
+def command_sign(args):
+    """
+    Signs a document read from a file or the standard input and writes the signed copy to a file or the standard
+    output.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+
+    Returns
+    -------
+    int
+        The exit code.
+    """
+    from src.atomic_write import create_temp_file
+    from src.batch_signing import find_keystore_key
+    from src.detecting_usb import detect_usb_devices
+    from src.document_signing import decrypt_private_key, sign_stream, write_signed_pdf
+    from src.find_keys import PRIVATE_KEY_NAME
+    from src.key_discovery import discover_first_key
+    from src.keystore import locate_private_key
+
+    if args.key_file:
+        encrypted_key_path = args.key_file
+    elif args.usb:
+        encrypted_key_path = locate_private_key(args.usb, args.key_id)
+    else:
+        encrypted_key_path = find_keystore_key(detect_usb_devices(), args.key_id)
+        if encrypted_key_path is None and args.key_id is None:
+            candidate = discover_first_key(PRIVATE_KEY_NAME)
+            encrypted_key_path = candidate.path if candidate else None
+    if not encrypted_key_path:
+        print("Nie znaleziono klucza prywatnego na pendrive.", file=sys.stderr)
+        return 1
+
+    private_key = decrypt_private_key(encrypted_key_path, resolve_pin(args.pin))
+
+    if args.input not in (None, "-") and args.output not in (None, "-"):
+        write_signed_pdf(args.input, args.output, private_key)
+        return 0
+
+    with open_input(args.input) as source:
+        if args.output in (None, "-"):
+            target = sys.stdout.buffer
+            sign_stream(source, target, private_key)
+            target.flush()
+        else:
+            target, temp_path = create_temp_file(args.output)
+            try:
+                with target:
+                    sign_stream(source, target, private_key)
+                os.replace(temp_path, args.output)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+    return 0
+
+
+def command_verify(args):
+    """
+    Verifies the signature of a document read from a file or the standard input.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+
+    Returns
+    -------
+    int
+        The exit code: 0 if the signature is valid, 1 otherwise.
+    """
+    from src.key_cache import public_keys
+    from src.trust_store import TrustStore
+    from src.verify_signature import STATUS_MESSAGES, STATUS_UNSIGNED, STATUS_VALID, check_file_in_trust_store, \
+        check_located_signature, locate_signature
+
+    with open_seekable_input(args.input) as pdf_file:
+        if args.trust_store:
+            status, digest, key_id = check_file_in_trust_store(pdf_file, TrustStore(args.trust_store))
+        else:
+            location = locate_signature(pdf_file)
+            if location is None:
+                status, digest, key_id = STATUS_UNSIGNED, None, None
+            else:
+                status, digest = check_located_signature(pdf_file, location, public_keys.load(args.key))
+                key_id = location.key_id
+
+    if args.json:
+        print(json.dumps({"status": status, "key": key_id, "digest": digest}))
+    else:
+        print(f"{status}: {STATUS_MESSAGES[status]}")
+    return 0 if status == STATUS_VALID else 1
+
+
+def command_keygen(args):
+    """
+    Generates a key pair, saves the encrypted private key in the keystore of the given medium and prints its key ID.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+
+    Returns
+    -------
+    int
+        The exit code.
+    """
+    from src.auxiliary.key_generation import key_generator
+    from src.kdf import calibrate_kdf
+
+    pin = resolve_pin(args.pin)
+    os.makedirs(args.public_dir, exist_ok=True)
+    key_id = key_generator(pin, args.private_dir, args.public_dir, args.algorithm, args.label,
+                           kdf_cost=calibrate_kdf(args.target / 1000), workers=args.workers)
+    print(key_id)
+    return 0
+
+
+def command_detect(args):
+    """
+    Lists the connected USB devices and, with `--keys`, the keys found on them.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments.
+
+    Returns
+    -------
+    int
+        The exit code.
+    """
+    from src.detecting_usb import detect_usb_devices, format_device
+    from src.key_discovery import discover_keys
+
+    devices = detect_usb_devices()
+    keys = list(discover_keys(devices)) if args.keys else []
+
+    if args.json:
+        print(json.dumps({
+            "devices": [device._asdict() for device in devices],
+            "keys": [{"path": key.path, "type": key.key_type, "fingerprint": key.fingerprint,
+                      "device": key.device.mountpoint} for key in keys],
+        }, ensure_ascii=False))
+        return 0
+
+    for device in devices:
+        print(format_device(device))
+        for key in keys:
+            if key.device.mountpoint == device.mountpoint:
+                print(f"  {key.key_type:<8} {key.fingerprint or '-':<64} {key.path}")
+    return 0
+
+
+def build_parser():
+    """
+    Builds the parser of the command line arguments.
+
+    Returns
+    -------
+    argparse.ArgumentParser
+    """
+    from src.key_algorithms import ALGORITHMS, DEFAULT_ALGORITHM
+    from src.kdf import DEFAULT_TARGET_LATENCY
+
+    parser = argparse.ArgumentParser(prog="python -m src.cli",
+                                     description="Kwalifikowany podpis elektroniczny bez interfejsu graficznego.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pin_help = "Źródło PIN-u: env:NAZWA, fd:N lub file:ŚCIEŻKA (domyślnie zmienna QES_PIN lub terminal)."
+
+    sign_parser = commands.add_parser("sign", help="Podpisuje dokument PDF.")
+    sign_parser.add_argument("input", nargs="?", help="Plik PDF ('-' lub brak oznacza standardowe wejście).")
+    sign_parser.add_argument("-o", "--output", help="Plik wynikowy ('-' lub brak oznacza standardowe wyjście).")
+    key_group = sign_parser.add_mutually_exclusive_group()
+    key_group.add_argument("--usb", help="Ścieżka nośnika z kluczem prywatnym (domyślnie przeszukiwane są wszystkie "
+                                         "podłączone nośniki).")
+    key_group.add_argument("--key-file", help="Ścieżka do zaszyfrowanego klucza prywatnego.")
+    sign_parser.add_argument("--key-id", help="Identyfikator (lub jego początek) klucza z magazynu kluczy nośnika.")
+    sign_parser.add_argument("--pin", help=pin_help)
+    sign_parser.set_defaults(handler=command_sign)
+
+    verify_parser = commands.add_parser("verify", help="Weryfikuje podpis dokumentu PDF.")
+    verify_parser.add_argument("input", nargs="?", help="Plik PDF ('-' lub brak oznacza standardowe wejście).")
+    verify_key_group = verify_parser.add_mutually_exclusive_group(required=True)
+    verify_key_group.add_argument("--key", help="Ścieżka do klucza publicznego.")
+    verify_key_group.add_argument("--trust-store", help="Katalog magazynu zaufanych kluczy.")
+    verify_parser.add_argument("--json", action="store_true", help="Wynik w formacie JSON.")
+    verify_parser.set_defaults(handler=command_verify)
+
+    keygen_parser = commands.add_parser("keygen", help="Generuje parę kluczy.")
+    keygen_parser.add_argument("--private-dir", required=True, help="Nośnik, na którym zostanie zapisany klucz "
+                                                                    "prywatny.")
+    keygen_parser.add_argument("--public-dir", required=True, help="Katalog, w którym zostanie zapisany klucz "
+                                                                   "publiczny.")
+    keygen_parser.add_argument("--algorithm", choices=ALGORITHMS, default=DEFAULT_ALGORITHM, help="Algorytm klucza.")
+    keygen_parser.add_argument("--label", help="Etykieta klucza w magazynie kluczy.")
+    keygen_parser.add_argument("--pin", help=pin_help)
+    keygen_parser.add_argument("--workers", type=int, default=None,
+                               help="Liczba procesów szukających liczb pierwszych klucza RSA (domyślnie OpenSSL).")
+    keygen_parser.add_argument("--target", type=float, default=DEFAULT_TARGET_LATENCY * 1000,
+                               help="Docelowy czas odblokowania klucza w milisekundach.")
+    keygen_parser.set_defaults(handler=command_keygen)
+
+    detect_parser = commands.add_parser("detect", help="Wyświetla podłączone nośniki USB.")
+    detect_parser.add_argument("--keys", action="store_true", help="Wyszukuje również klucze na nośnikach.")
+    detect_parser.add_argument("--json", action="store_true", help="Wynik w formacie JSON.")
+    detect_parser.set_defaults(handler=command_detect)
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point of the command line interface, which signs, verifies and generates keys without Qt.
+
+    Usage: `python -m src.cli sign [--usb PATH | --key-file FILE] [--key-id ID] [--pin SOURCE] [-o OUTPUT] [INPUT]`,
+    `... verify (--key KEY | --trust-store DIR) [--json] [INPUT]`, `... keygen --private-dir DIR --public-dir DIR
+    [--algorithm ALG] [--label TEXT] [--pin SOURCE] [--workers N] [--target MS]` or `... detect [--keys] [--json]`
+
+    Documents are read from the standard input and signed documents written to the standard output when no path is
+    given, so the command can be used in a pipeline. Only the modules needed by the chosen command are imported.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments. Defaults to `sys.argv[1:]`.
+
+    Returns
+    -------
+    int
+        The exit code: 0 on success, 1 on failure or an invalid signature.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.handler is command_sign and args.key_file and args.key_id:
+        parser.error("argument --key-id: nie można użyć razem z --key-file (plik zawiera jeden klucz)")
+    try:
+        return args.handler(args)
+    except (OSError, ValueError) as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
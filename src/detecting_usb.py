@@ -1,5 +1,18 @@
+import json
+import os
 import platform
+import re
 import subprocess
+from collections import namedtuple
+
+MOUNTINFO_PATH = "/proc/self/mountinfo"
+SYS_DEV_BLOCK = "/sys/dev/block"
+SYS_BLOCK = "/sys/block"
+DISK_BY_UUID = "/dev/disk/by-uuid"
+DISK_BY_LABEL = "/dev/disk/by-label"
+SECTOR_SIZE = 512
+
+UsbDevice = namedtuple("UsbDevice", ["name", "mountpoint", "uuid", "label", "size"])
 
 
 def detect_usb_devices():
@@ -9,49 +22,311 @@ def detect_usb_devices():
     This function identifies USB devices by checking the operating system. It handles both Windows and Linux platforms.
     - On Windows, it uses the `wmic` command to query information about logical disks and searches for devices marked as
       "Removable Disk."
-    - On Linux, it uses the `lsblk` command to list block devices and identifies USB devices based on the mount points
-      under `/media` or `/mnt`.
+    - On Linux, it reads the mounted file systems from `/proc/self/mountinfo` and keeps the block devices which are
+      removable or attached through USB according to `/sys/block`. No process is spawned. If the kernel interfaces
+      are not available, `lsblk --json` is used instead.
+
+    The function returns a list of device records. If no USB devices are detected, it returns an empty list.
+
+    Parameters
+    ----------
+    None.
+
+    Returns
+    -------
+    usb_devices : list of UsbDevice
+        The detected USB devices. Every record contains the device name (e.g. "sdb1" or "E:"), the mount point that
+        can be used as a path (e.g. "/media/user/My USB" or "E:\\"), the file system UUID and label (or `None` if
+        unknown) and the size in bytes (or `None` if unknown). Use `format_device` to display a device.
+    """
+    system_name = platform.system()
 
-    The function returns a list of connected USB devices. If no USB devices are detected, it returns a default message
-    indicating that no USB devices were found.
+    if system_name == "Windows":
+        return detect_windows_devices()
+
+    if system_name == "Linux":
+        try:
+            return detect_linux_devices()
+        except OSError:
+            return detect_lsblk_devices()
 
-    The detected devices are returned in different formats depending on the operating system:
-    - **Windows**: It returns the drive letter followed by a backslash (e.g., "C:\").
-    - **Linux**: It returns the device label followed by the device name (e.g., "My USB (sdb1)").
+    return []
 
-    If no devices are found, the function returns a list containing the message "Brak wykrytych nośników" (which means
-    "No detected media").
+
+def format_device(device):
+    """
+    Formats a device record for display, e.g. "My USB (sdb1)".
 
     Parameters
     ----------
-    None.
+    device : UsbDevice
+        The device to format.
+
+    Returns
+    -------
+    str
+        The label of the device (or its mount point if it has no label) followed by the device name.
+    """
+    return f"{device.label or device.mountpoint} ({device.name})"
+
+
+def detect_windows_devices():
+    """
+    Detects removable disks on Windows with the `wmic` command.
 
     Returns
     -------
-    usb_devices : list
-        A list of detected USB devices or a message indicating no devices were found. The format depends on the
-        operating system:
-        - **Windows**: A list of drive letters with a backslash (e.g., ["C:\"]).
-        - **Linux**: A list of device labels and names (e.g., ["My USB (sdb1)"]).
-        If no devices are found, the list contains the string ["Brak wykrytych nośników"].
+    list of UsbDevice
+        The detected removable disks.
     """
     usb_devices = []
+    result = subprocess.run(["wmic", "logicaldisk", "get", "caption,description,volumename"], capture_output=True, text=True)
+    for line in result.stdout.split("\n"):
+        if "Removable Disk" in line:
+            columns = line.split()
+            if len(columns) > 2:
+                label = " ".join(columns[3:]) or None
+                usb_devices.append(UsbDevice(columns[0], f"{columns[0]}\\", None, label, None))
+    return usb_devices
+
+
+def volume_uuid(path):
+    """
+    Returns the identifier of the file system volume containing a path.
+
+    On Linux this is the file system UUID found in `/dev/disk/by-uuid` for the block device of the path. On Windows it
+    is the volume serial number. The identifier stays the same when the volume is mounted again under another path.
+
+    Parameters
+    ----------
+    path : str
+        A path on the volume.
+
+    Returns
+    -------
+    str or None
+        The identifier of the volume, or `None` if it cannot be determined.
+    """
     system_name = platform.system()
 
     if system_name == "Windows":
-        result = subprocess.run(["wmic", "logicaldisk", "get", "caption,description,volumename"], capture_output=True, text=True)
-        for line in result.stdout.split("\n"):
-            if "Removable Disk" in line:
-                columns = line.split()
-                if len(columns) > 2:
-                    usb_devices.append(f"{columns[0]}\\")
-
-    elif system_name == "Linux":
-        result = subprocess.run(["lsblk", "-o", "NAME,LABEL,MOUNTPOINT"], capture_output=True, text=True)
-        for line in result.stdout.split("\n"):
-            if "/media" in line or "/mnt" in line:
-                columns = line.split()
-                if len(columns) > 1:
-                    usb_devices.append(f"{columns[1]} ({columns[0]})")
-
-    return usb_devices if usb_devices else ["Brak wykrytych nośników"]
+        return windows_volume_serial(path)
+
+    if system_name == "Linux":
+        try:
+            device = os.stat(path).st_dev
+        except OSError:
+            return None
+        sys_path = os.path.realpath(os.path.join(SYS_DEV_BLOCK, f"{os.major(device)}:{os.minor(device)}"))
+        return read_disk_links(DISK_BY_UUID).get(os.path.basename(sys_path))
+
+    return None
+
+
+def windows_volume_serial(path):
+    """
+    Returns the serial number of the Windows volume containing a path.
+
+    Parameters
+    ----------
+    path : str
+        A path on the volume.
+
+    Returns
+    -------
+    str or None
+        The hex encoded volume serial number, or `None` if it cannot be read.
+    """
+    import ctypes
+
+    kernel32 = ctypes.windll.kernel32
+    volume_path = ctypes.create_unicode_buffer(261)
+    serial = ctypes.c_uint32()
+    if not kernel32.GetVolumePathNameW(os.path.abspath(path), volume_path, len(volume_path)):
+        return None
+    if not kernel32.GetVolumeInformationW(volume_path.value, None, 0, ctypes.byref(serial), None, None, None, 0):
+        return None
+    return f"{serial.value:08X}"
+
+
+def unescape_mountinfo(value):
+    """
+    Decodes the octal escapes (e.g. `\\040` for a space) used by the kernel in `/proc/self/mountinfo`.
+
+    Parameters
+    ----------
+    value : str
+        The escaped value.
+
+    Returns
+    -------
+    str
+        The decoded value.
+    """
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), value)
+
+
+def unescape_udev(value):
+    """
+    Decodes the hex escapes (e.g. `\\x20` for a space) used by udev in the names of `/dev/disk/by-label` links.
+
+    Parameters
+    ----------
+    value : str
+        The escaped value.
+
+    Returns
+    -------
+    str
+        The decoded value.
+    """
+    raw = re.sub(rb"\\x([0-9a-fA-F]{2})", lambda match: bytes([int(match.group(1), 16)]),
+                 os.fsencode(value))
+    return raw.decode("utf-8", errors="replace")
+
+
+def read_disk_links(directory, unescape=None):
+    """
+    Maps device names to the names of the links pointing to them in a `/dev/disk/by-*` directory.
+
+    Parameters
+    ----------
+    directory : str
+        The directory with the links, e.g. `/dev/disk/by-uuid`.
+    unescape : callable, optional
+        The function decoding the link names.
+
+    Returns
+    -------
+    dict
+        The link names keyed by device name. Empty if the directory does not exist.
+    """
+    links = {}
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return links
+    for entry in entries:
+        try:
+            device_name = os.path.basename(os.readlink(entry.path))
+        except OSError:
+            continue
+        links[device_name] = unescape(entry.name) if unescape else entry.name
+    return links
+
+
+def read_sysfs_value(path):
+    """
+    Reads a single value from a sysfs attribute file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the attribute file.
+
+    Returns
+    -------
+    str or None
+        The stripped content of the file, or `None` if it cannot be read.
+    """
+    try:
+        with open(path) as attribute_file:
+            return attribute_file.read().strip()
+    except OSError:
+        return None
+
+
+def is_usb_block_device(sys_path):
+    """
+    Checks if a block device is removable or attached through USB.
+
+    Parameters
+    ----------
+    sys_path : str
+        The resolved sysfs path of the block device or partition.
+
+    Returns
+    -------
+    bool
+        `True` if the device (or the disk containing the partition) is removable or connected through a USB bus.
+    """
+    disk_path = os.path.dirname(sys_path) if os.path.exists(os.path.join(sys_path, "partition")) else sys_path
+    disk_name = os.path.basename(disk_path)
+    return read_sysfs_value(os.path.join(SYS_BLOCK, disk_name, "removable")) == "1" or "/usb" in disk_path
+
+
+def detect_linux_devices():
+    """
+    Detects mounted USB devices on Linux using `/proc/self/mountinfo` and sysfs, without spawning any process.
+
+    Returns
+    -------
+    list of UsbDevice
+        The detected devices, each listed once with its first mount point.
+
+    Raises
+    ------
+    OSError
+        If `/proc/self/mountinfo` or `/sys/dev/block` is not available.
+    """
+    with open(MOUNTINFO_PATH, encoding="utf-8", errors="surrogateescape") as mountinfo:
+        lines = mountinfo.read().splitlines()
+    if not os.path.isdir(SYS_DEV_BLOCK):
+        raise OSError(f"{SYS_DEV_BLOCK} is not available")
+
+    uuids = read_disk_links(DISK_BY_UUID)
+    labels = read_disk_links(DISK_BY_LABEL, unescape_udev)
+
+    usb_devices = []
+    seen = set()
+    for line in lines:
+        fields = line.split(" ")
+        if len(fields) < 5 or fields[2] in seen:
+            continue
+
+        sys_path = os.path.realpath(os.path.join(SYS_DEV_BLOCK, fields[2]))
+        if not os.path.isdir(sys_path) or not is_usb_block_device(sys_path):
+            continue
+        seen.add(fields[2])
+
+        name = os.path.basename(sys_path)
+        sectors = read_sysfs_value(os.path.join(sys_path, "size"))
+        usb_devices.append(UsbDevice(
+            name=name,
+            mountpoint=unescape_mountinfo(fields[4]),
+            uuid=uuids.get(name),
+            label=labels.get(name),
+            size=int(sectors) * SECTOR_SIZE if sectors and sectors.isdigit() else None,
+        ))
+    return usb_devices
+
+
+def detect_lsblk_devices():
+    """
+    Detects mounted USB devices on Linux with `lsblk --json`. Used only when the kernel interfaces are not available.
+
+    Returns
+    -------
+    list of UsbDevice
+        The detected devices.
+    """
+    try:
+        result = subprocess.run(["lsblk", "--json", "--bytes", "-o", "NAME,LABEL,UUID,MOUNTPOINT,SIZE,RM,TRAN"],
+                                capture_output=True, text=True)
+        block_devices = json.loads(result.stdout).get("blockdevices", [])
+    except (OSError, ValueError):
+        return []
+
+    usb_devices = []
+
+    def visit(devices, parent_is_usb):
+        for device in devices:
+            is_usb = parent_is_usb or device.get("rm") in (True, "1") or device.get("tran") == "usb"
+            if is_usb and device.get("mountpoint"):
+                size = device.get("size")
+                usb_devices.append(UsbDevice(device["name"], device["mountpoint"], device.get("uuid"),
+                                             device.get("label"), int(size) if size is not None else None))
+            visit(device.get("children", []), is_usb)
+
+    visit(block_devices, False)
+    return usb_devices
@@ -1,26 +1,28 @@
+import hashlib
+import mmap
 import os
 
-from Crypto.Cipher import AES
-from Crypto.Hash import SHA256
-from Crypto.Util.Padding import unpad
-from PyQt5.QtWidgets import QFileDialog, QMessageBox
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.primitives import hashes, serialization
+from src.atomic_write import create_temp_file
+from src.file_copy import copy_file
+from src.key_algorithms import key_algorithm, public_key_fingerprint, sign_digest
+from src.key_cache import UnlockedKeyCache
+from src.key_container import decrypt_private_key as decrypt_key_container
+from src.keystore import locate_private_key
+from src.verify_signature import hash_regions
 
-from src.find_keys import find_private_key
-
-RANDOM_BYTES_NUMBER = 16
+CHUNK_SIZE = 1024 * 1024
+SIGNATURE_PLACEHOLDER_SIZE = 1024
 
 
 def decrypt_private_key(encrypted_key_path, pin):
     """
     Decrypts a private key that has been encrypted using AES encryption with a PIN.
 
-    This function reads the encrypted private key from the specified file, extracts the initialization vector (IV)
-    and encrypted key data, and then decrypts the key using the AES algorithm. The PIN is hashed using SHA256 to
-    generate the encryption key. If the decryption is successful, the private key is returned.
+    This function reads the key file and decrypts it with `src.key_container.decrypt_private_key`. Version 2 key
+    containers are encrypted with AES-GCM, so a wrong PIN is rejected by the authentication tag. Version 1 files (the
+    IV followed by the AES-CBC encrypted PEM) are still supported.
 
-    If the provided PIN is incorrect, a `ValueError` is raised.
+    If the provided PIN is incorrect, a `src.key_container.WrongPinError` (a `ValueError`) is raised.
 
     Parameters
     ----------
@@ -31,7 +33,7 @@ def decrypt_private_key(encrypted_key_path, pin):
 
     Returns
     -------
-    private_key : RSA key
+    private_key : private key
         The decrypted private key.
 
     Raises
@@ -41,30 +43,22 @@ def decrypt_private_key(encrypted_key_path, pin):
     """
     with open(encrypted_key_path, "rb") as key_file:
         encrypted_data = key_file.read()
-        iv, encrypted_key = encrypted_data[:RANDOM_BYTES_NUMBER], encrypted_data[RANDOM_BYTES_NUMBER:]
 
-    hashed_pin = SHA256.new(pin.encode()).digest()
-    cipher = AES.new(hashed_pin, AES.MODE_CBC, iv)
+    return decrypt_key_container(encrypted_data, pin)
 
-    try:
-        private_key_pem = unpad(cipher.decrypt(encrypted_key), AES.block_size)
-    except ValueError:
-        raise ValueError("Niepoprawny PIN.")
 
-    private_key = serialization.load_pem_private_key(
-        private_key_pem, password=None
-    )
-    return private_key
+# Unlocked keys are reused by the following signatures in the same session, see `UnlockedKeyCache`.
+unlocked_keys = UnlockedKeyCache(decrypt_private_key)
 
 
 def sign_pdf(usb_path, pdf_path, pin):
     """
     Signs a PDF file using a private key stored on a USB device.
 
-    This function first locates the encrypted private key on the USB device, decrypts it using the provided PIN,
-    and then signs the specified PDF file. The signed PDF file is saved at a location chosen by the user.
+    This function asks the user where the signed PDF file should be saved and then signs the document with
+    `sign_pdf_to`.
 
-    If the PDF path or the private key cannot be found, appropriate error messages are returned.
+    If the PDF path, the output path or the private key cannot be found, appropriate error messages are returned.
 
     Parameters
     ----------
@@ -82,18 +76,14 @@ def sign_pdf(usb_path, pdf_path, pin):
 
     Raises
     ------
-    FileNotFoundError
-        If the encrypted private key is not found on the USB device.
+    ValueError
+        If the PIN is incorrect or the decryption fails.
     """
-    encrypted_key_path = find_private_key(usb_path)
-
     if not pdf_path:
         return "Nie wybrano pliku."
 
-    if not os.path.exists(encrypted_key_path):
-        return "Nie znaleziono klucza prywatnego na pendrive."
-
-    private_key = decrypt_private_key(encrypted_key_path, pin)
+    # Imported here so that the signing functions can be used without Qt, e.g. by the batch signing engine.
+    from PyQt5.QtWidgets import QFileDialog
 
     save_file_dialog = QFileDialog()
     save_file_dialog.setDefaultSuffix('pdf')
@@ -103,30 +93,303 @@ def sign_pdf(usb_path, pdf_path, pin):
     if not output_pdf_path:
         return "Nie wybrano ścieżki zapisu."
 
-    with open(pdf_path, "rb") as f:
-        pdf_data = f.read()
+    return sign_pdf_to(usb_path, pdf_path, pin, output_pdf_path)
 
-    signature = private_key.sign(
-        pdf_data,
-        padding.PKCS1v15(),
-        hashes.SHA256()
-    )
 
-    signature_hex = signature.hex()
-    byte_range = f"[0 {len(pdf_data)} {len(pdf_data)} 0]"
+def sign_pdf_to(usb_path, pdf_path, pin, output_pdf_path, progress=None, key_id=None):
+    """
+    Signs a PDF file using a private key stored on a USB device and saves it at the given path.
+
+    This function first locates the encrypted private key on the USB device, decrypts it using the provided PIN
+    (or reuses the key unlocked earlier in the same session), and then signs the specified PDF file. It does not use
+    any dialogs, so it can be run outside of the GUI thread.
 
-    sig_dict = (
-        "<<\n"
-        "/Type /Sig\n"
-        "/Filter /Adobe.PPKLite\n"
-        "/SubFilter /adbe.pkcs7.detached\n"
-        f"/ByteRange {byte_range}\n"
-        f"/Contents <{signature_hex}>\n"
-        ">>"
-    )
+    Parameters
+    ----------
+    usb_path : str
+        The path to the USB device where the private key is stored.
+    pdf_path : str
+        The path to the PDF file to be signed.
+    pin : str
+        The PIN used to decrypt the private key.
+    output_pdf_path : str
+        The path where the signed PDF file will be saved.
+    progress : callable, optional
+        Called as `progress(done, total)` with the number of bytes processed so far, see `write_signed_pdf`.
+    key_id : str, optional
+        The ID of the key in the keystore of the USB device. Defaults to the most recently created key, see
+        `src.keystore.locate_private_key`.
 
-    new_pdf_data = pdf_data + b"\n" + sig_dict.encode('ascii')
-    with open(output_pdf_path, 'wb') as f:
-        f.write(new_pdf_data)
+    Returns
+    -------
+    str
+        A message indicating the result of the signing operation. This can be a success message or an error message.
+
+    Raises
+    ------
+    ValueError
+        If the PIN is incorrect or the decryption fails.
+    """
+    if not pdf_path:
+        return "Nie wybrano pliku."
+
+    encrypted_key_path = locate_private_key(usb_path, key_id)
+    if not encrypted_key_path or not os.path.exists(encrypted_key_path):
+        return "Nie znaleziono klucza prywatnego na pendrive."
+
+    private_key = unlocked_keys.get(encrypted_key_path, pin)
+
+    write_signed_pdf(pdf_path, output_pdf_path, private_key, progress=progress)
 
     return f"Plik PDF został podpisany i zapisany jako {output_pdf_path}"
+
+
+def build_signature_dictionary(signature, data_length, algorithm, key_id):
+    """
+    Builds the signature dictionary appended to the end of a signed PDF file.
+
+    The signature is stored in a `/Contents` field of a fixed size, `SIGNATURE_PLACEHOLDER_SIZE` bytes hex encoded and
+    padded with zeros, so the layout of the dictionary does not depend on the signature. The `/ByteRange` field
+    `[0 a b c]` describes that layout: the signature covers the `a` bytes before the `<` of `/Contents` and the `c`
+    bytes from the offset `b` after its `>` to the end of the file, i.e. the document, the newline separating it from
+    the dictionary and the whole dictionary except the signature itself.
+
+    Parameters
+    ----------
+    signature : bytes or None
+        The raw signature of the document, or `None` for a dictionary with an empty placeholder.
+    data_length : int
+        The number of bytes of the original document. The dictionary is placed after them and a newline.
+    algorithm : str
+        The algorithm of the signing key, recorded in the `/KeyAlgorithm` field.
+    key_id : str
+        The hex encoded fingerprint of the signing key (see `src.key_algorithms.public_key_fingerprint`), recorded in
+        the `/KeyID` field so the verifier can look the public key up in a trust store.
+
+    Returns
+    -------
+    dictionary : bytes
+        The ASCII encoded signature dictionary.
+    byte_range : tuple of int
+        The four values of the `/ByteRange` field.
+
+    Raises
+    ------
+    ValueError
+        If the signature does not fit in the placeholder.
+    """
+    contents = (signature or b"").hex()
+    if len(contents) > 2 * SIGNATURE_PLACEHOLDER_SIZE:
+        raise ValueError("Podpis nie mieści się w polu /Contents.")
+    contents = contents.ljust(2 * SIGNATURE_PLACEHOLDER_SIZE, "0")
+    tail = "\n>>"
+
+    byte_range = None
+    layout = (0, 0, 0, 0)
+    while layout != byte_range:
+        byte_range = layout
+        head = (
+            "<<\n"
+            "/Type /Sig\n"
+            "/Filter /Adobe.PPKLite\n"
+            "/SubFilter /adbe.pkcs7.detached\n"
+            f"/KeyAlgorithm /{algorithm}\n"
+            f"/KeyID <{key_id}>\n"
+            "/ByteRange [{} {} {} {}]\n"
+            "/Contents "
+        ).format(*byte_range)
+        contents_start = data_length + 1 + len(head)
+        layout = (0, contents_start, contents_start + len(contents) + 2, len(tail))
+
+    return f"{head}<{contents}>{tail}".encode('ascii'), byte_range
+
+
+def sign_trailer(digest, data_length, private_key):
+    """
+    Builds the signature dictionary of a hashed document and signs the document.
+
+    The parts of the dictionary declared by its `/ByteRange` are added to the digest of the document, so the digest
+    covers exactly the signed byte ranges of the output file.
+
+    Parameters
+    ----------
+    digest : hashlib.sha256
+        The incremental hash of the whole original document.
+    data_length : int
+        The number of bytes of the original document.
+    private_key : private key
+        The private key used to sign the document: RSA, ECDSA P-256 or Ed25519.
+
+    Returns
+    -------
+    signature : bytes
+        The raw signature, to be written into the placeholder with `patch_signature`.
+    trailer : bytearray
+        The newline and the signature dictionary with an empty placeholder, appended to the document.
+    byte_range : tuple of int
+        The values of the `/ByteRange` field, as offsets in the output file.
+    """
+    dictionary, byte_range = build_signature_dictionary(None, data_length, key_algorithm(private_key),
+                                                        public_key_fingerprint(private_key.public_key()))
+    trailer = bytearray(b"\n" + dictionary)
+    digest.update(trailer[:byte_range[1] - data_length])
+    digest.update(trailer[byte_range[2] - data_length:])
+    return sign_digest(private_key, digest.digest()), trailer, byte_range
+
+
+def patch_signature(buffer, byte_range, signature, offset=0):
+    """
+    Writes a signature into the `/Contents` placeholder of a signed document, in place.
+
+    Parameters
+    ----------
+    buffer : writable bytes-like
+        The signed document or its end, e.g. a memory-mapped output file or the trailer returned by `sign_trailer`.
+    byte_range : tuple of int
+        The values of the `/ByteRange` field of the document.
+    signature : bytes
+        The raw signature.
+    offset : int, optional
+        The offset of the start of the buffer in the document.
+
+    Returns
+    -------
+    None.
+    """
+    contents = signature.hex().encode('ascii')
+    start = byte_range[1] + 1 - offset
+    buffer[start:start + len(contents)] = contents
+
+
+def write_signed_pdf(pdf_path, output_pdf_path, private_key, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Signs a PDF file and writes the signed copy to the output path.
+
+    The document is copied to a uniquely named temporary file created next to the output file inside the kernel, with
+    `src.file_copy.copy_file`: on reflink filesystems (btrfs, XFS) the copy only shares the data blocks of the
+    document, elsewhere `copy_file_range` or `sendfile` copy them without passing them through Python. Only the
+    signature dictionary with an empty `/Contents` placeholder is written from Python. The byte ranges it declares
+    are then hashed through a memory map of the temporary file, so exactly the data of the output file is signed, and
+    the signature is written into the placeholder in place. The temporary file atomically replaces the output file,
+    which also makes it safe to overwrite the input document.
+
+    For RSA and ECDSA keys the produced signature is the same as when signing the byte ranges of the output file at
+    once. Ed25519 keys sign the digest, see `src.key_algorithms.sign_digest`.
+
+    Parameters
+    ----------
+    pdf_path : str
+        The path to the PDF file to be signed.
+    output_pdf_path : str
+        The path where the signed PDF file will be saved.
+    private_key : private key
+        The private key used to sign the document: RSA, ECDSA P-256 or Ed25519.
+    chunk_size : int, optional
+        The number of bytes hashed at a time.
+    progress : callable, optional
+        Called as `progress(done, total)` after every hashed chunk with the number of bytes hashed so far and the size
+        of the signed data. An exception raised by the callback aborts signing and removes the partial output, which is
+        how long-running operations are cancelled.
+
+    Returns
+    -------
+    int
+        The number of bytes of the original document covered by the signature.
+    """
+    target, temp_path = create_temp_file(output_pdf_path)
+    try:
+        with target, open(pdf_path, "rb") as source:
+            data_length, _ = copy_file(source, target)
+            dictionary, byte_range = build_signature_dictionary(None, data_length, key_algorithm(private_key),
+                                                                public_key_fingerprint(private_key.public_key()))
+            target.write(b"\n" + dictionary)
+            target.flush()
+            with mmap.mmap(target.fileno(), 0) as signed_pdf:
+                regions = [(0, byte_range[1]), (byte_range[2], byte_range[2] + byte_range[3])]
+                digest = hash_regions(signed_pdf, regions, chunk_size, progress, trailer=b"")
+                patch_signature(signed_pdf, byte_range, sign_digest(private_key, digest))
+        os.replace(temp_path, output_pdf_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return data_length
+
+
+def sign_stream(source, target, private_key, chunk_size=CHUNK_SIZE, progress=None, total=None):
+    """
+    Copies a PDF document from one stream to another in a single pass and appends its signature.
+
+    The document is read in fixed-size chunks into a reusable buffer, and every chunk is fed to an incremental
+    SHA-256 hash and written to the target, so neither stream has to be seekable and e.g. a pipe can be signed into
+    another pipe with constant memory use. The target cannot be patched afterwards, so the signature is written into
+    the placeholder of the trailer before the trailer is written.
+
+    Parameters
+    ----------
+    source : file object
+        The document opened for reading in binary mode.
+    target : file object
+        The stream where the signed document is written, opened in binary mode.
+    private_key : private key
+        The private key used to sign the document: RSA, ECDSA P-256 or Ed25519.
+    chunk_size : int, optional
+        The number of bytes read from the document at a time.
+    progress : callable, optional
+        Called as `progress(done, total)` after every chunk, see `write_signed_pdf`.
+    total : int, optional
+        The size of the document reported to `progress`, if known.
+
+    Returns
+    -------
+    int
+        The number of bytes of the original document covered by the signature.
+    """
+    digest, data_length = _copy_and_hash(source, target, chunk_size, progress, total)
+    signature, trailer, byte_range = sign_trailer(digest, data_length, private_key)
+    patch_signature(trailer, byte_range, signature, offset=data_length)
+    target.write(trailer)
+    return data_length
+
+
+def _copy_and_hash(source, target, chunk_size, progress, total):
+    """
+    Copies a document from one stream to another in chunks and hashes it on the way.
+
+    Parameters
+    ----------
+    source : file object
+        The document opened for reading in binary mode.
+    target : file object
+        The stream where the document is written, opened in binary mode.
+    chunk_size : int
+        The number of bytes read from the document at a time.
+    progress : callable or None
+        Called as `progress(done, total)` after every chunk.
+    total : int or None
+        The size of the document reported to `progress`, if known.
+
+    Returns
+    -------
+    digest : hashlib.sha256
+        The incremental SHA-256 hash of the document.
+    data_length : int
+        The number of bytes copied.
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    data_length = 0
+
+    while True:
+        read = source.readinto(buffer)
+        if not read:
+            break
+        digest.update(view[:read])
+        target.write(view[:read])
+        data_length += read
+        if progress is not None:
+            progress(data_length, total)
+
+    return digest, data_length
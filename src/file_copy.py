@@ -0,0 +1,127 @@
+import errno
+import os
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+FICLONE = 0x40049409
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+FALLBACK_CHUNK_SIZE = 1024 * 1024
+UNSUPPORTED_ERRORS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS,
+                      errno.EBADF, errno.EPERM}
+
+METHOD_CLONE = "clone"
+METHOD_COPY_FILE_RANGE = "copy_file_range"
+METHOD_SENDFILE = "sendfile"
+METHOD_COPY = "copy"
+
+
+def _clone(source_fd, target_fd):
+    """
+    Clones the content of a file with the `FICLONE` ioctl, which shares the data blocks of both files on reflink
+    filesystems (btrfs, XFS) instead of copying them.
+
+    Parameters
+    ----------
+    source_fd, target_fd : int
+        The file descriptors of the source and the empty target file.
+
+    Returns
+    -------
+    bool
+        `True` if the file was cloned, `False` if the filesystem or the platform does not support cloning.
+    """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        fcntl.ioctl(target_fd, FICLONE, source_fd)
+    except OSError as e:
+        if e.errno in UNSUPPORTED_ERRORS:
+            return False
+        raise
+    return True
+
+
+def copy_file(source, target, length=None):
+    """
+    Copies the content of an open file to an empty open file inside the kernel.
+
+    The fastest method available is used: cloning the file (`FICLONE`), `os.copy_file_range` (which itself may share
+    or copy the blocks on the server or the device) and `os.sendfile`. The data does not pass through Python buffers
+    in any of them. Where none is supported, e.g. on other systems or between some filesystems, the file is read and
+    written in chunks. Every method continues where the previous one stopped.
+
+    Parameters
+    ----------
+    source : file object
+        The source file, opened in binary mode.
+    target : file object
+        The empty target file, opened for writing in binary mode. Its position is set to the end of the copied data.
+    length : int, optional
+        The number of bytes to copy. Defaults to the size of the source file.
+
+    Returns
+    -------
+    length : int
+        The number of bytes copied, less than requested only if the source file was truncated in the meantime.
+    method : str
+        The method which copied the data: one of the `METHOD_*` names.
+    """
+    source_fd = source.fileno()
+    target_fd = target.fileno()
+    target.flush()
+    if length is None:
+        length = os.fstat(source_fd).st_size
+
+    if length == os.fstat(source_fd).st_size and _clone(source_fd, target_fd):
+        target.seek(length)
+        return length, METHOD_CLONE
+
+    offset = 0
+    method = METHOD_COPY_FILE_RANGE
+    while offset < length and hasattr(os, "copy_file_range"):
+        try:
+            copied = os.copy_file_range(source_fd, target_fd, min(length - offset, COPY_CHUNK_SIZE), offset, offset)
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRORS:
+                raise
+            break
+        if not copied:
+            target.seek(offset)
+            return offset, method
+        offset += copied
+
+    if offset < length and sys.platform.startswith("linux"):
+        method = METHOD_SENDFILE
+        os.lseek(target_fd, offset, os.SEEK_SET)
+        while offset < length:
+            try:
+                copied = os.sendfile(target_fd, source_fd, offset, min(length - offset, COPY_CHUNK_SIZE))
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRORS:
+                    raise
+                break
+            if not copied:
+                target.seek(offset)
+                return offset, method
+            offset += copied
+
+    if offset < length:
+        method = METHOD_COPY
+        source.seek(offset)
+        target.seek(offset)
+        remaining = length - offset
+        while remaining > 0:
+            chunk = source.read(min(remaining, FALLBACK_CHUNK_SIZE))
+            if not chunk:
+                break
+            target.write(chunk)
+            remaining -= len(chunk)
+        offset = length - remaining
+        target.flush()
+
+    target.seek(offset)
+    return offset, method
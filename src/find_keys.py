@@ -1,4 +1,339 @@
+import json
 import os
+import stat
+import threading
+from collections import namedtuple
+
+from src.atomic_write import write_atomically
+from src.detecting_usb import volume_uuid
+
+PUBLIC_KEY_NAME = "public_key.pubk"
+PRIVATE_KEY_NAME = "encrypted_private_key.pk"
+KEY_FILE_NAMES = (PUBLIC_KEY_NAME, PRIVATE_KEY_NAME)
+
+DEFAULT_MAX_DEPTH = None
+DEFAULT_MAX_CACHED_VOLUMES = 64
+
+KeyLocations = namedtuple("KeyLocations", ["public_key", "private_key"])
+
+
+def default_cache_path():
+    """
+    Returns the path of the key location cache file in the user's cache directory.
+
+    Returns
+    -------
+    str
+        The path to `key_locations.json` in `$XDG_CACHE_HOME` (or `~/.cache`).
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "qualified-electronic-signature", "key_locations.json")
+
+
+def volume_root(path):
+    """
+    Returns the mount point of the file system containing a path.
+
+    Parameters
+    ----------
+    path : str
+        A path on the file system.
+
+    Returns
+    -------
+    str
+        The resolved path of the mount point.
+    """
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def scan_for_keys(directory, names=KEY_FILE_NAMES, max_depth=DEFAULT_MAX_DEPTH, cancel=None):
+    """
+    Searches a directory for key files in a single breadth-first pass.
+
+    The directory is read level by level with `os.scandir`, so keys stored near the root of the volume are found
+    without reading the rest of it, and the search stops as soon as all the requested files have been found.
+    Symbolic links to directories are not followed.
+
+    Parameters
+    ----------
+    directory : str
+        The path to the directory to search.
+    names : iterable of str, optional
+        The names of the key files to find.
+    max_depth : int or None, optional
+        The number of directory levels below `directory` to search. `0` searches only `directory` itself and `None`
+        removes the limit.
+    cancel : threading.Event, optional
+        When set, the search stops and the files found so far are returned.
+
+    Returns
+    -------
+    dict
+        The paths of the found files keyed by file name. Files which were not found are missing from the dictionary.
+    """
+    wanted = set(names)
+    found = {}
+    level = [directory]
+    depth = 0
+
+    while level and wanted:
+        next_level = []
+        for path in level:
+            if cancel is not None and cancel.is_set():
+                return found
+            try:
+                with os.scandir(path) as entries:
+                    entries = sorted(entries, key=lambda entry: entry.name)
+            except OSError:
+                continue
+
+            for entry in entries:
+                try:
+                    if entry.name in wanted and entry.is_file():
+                        found[entry.name] = entry.path
+                        wanted.discard(entry.name)
+                    elif entry.is_dir(follow_symlinks=False):
+                        next_level.append(entry.path)
+                except OSError:
+                    continue
+            if not wanted:
+                break
+
+        depth += 1
+        if max_depth is not None and depth > max_depth:
+            break
+        level = next_level
+
+    return found
+
+
+class KeyLocationCache:
+    """
+    Persistent cache of the locations where the key files were last found.
+
+    The locations are stored in a small JSON file, keyed by the UUID of the volume and the path of the searched
+    directory relative to the volume's mount point, so they survive the volume being mounted under another path.
+    Every remembered file is stored with its size and modification time, and is used only if a single `stat()` shows
+    that it has not changed; otherwise the directory has to be searched again. At most `max_volumes` directories are
+    remembered, the one searched longest ago being dropped first.
+    """
+
+    def __init__(self, cache_path=None, max_volumes=DEFAULT_MAX_CACHED_VOLUMES):
+        """
+        Parameters
+        ----------
+        cache_path : str, optional
+            The path to the JSON cache file. Defaults to `default_cache_path()`.
+        max_volumes : int, optional
+            The maximum number of remembered directories.
+        """
+        self.cache_path = cache_path or default_cache_path()
+        self.max_volumes = max_volumes
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def cache_key(self, directory):
+        """
+        Returns the key under which the key locations of a directory are remembered.
+
+        Parameters
+        ----------
+        directory : str
+            The searched directory.
+
+        Returns
+        -------
+        str or None
+            The volume UUID joined with the path of the directory relative to the volume's mount point, or `None` if
+            the volume has no known UUID and the directory cannot be cached.
+        """
+        uuid = volume_uuid(directory)
+        if uuid is None:
+            return None
+        relative_path = os.path.relpath(os.path.realpath(directory), volume_root(directory))
+        return f"{uuid}:{relative_path}"
+
+    def lookup(self, key, directory, name):
+        """
+        Returns the remembered path of a key file if the file has not changed.
+
+        Parameters
+        ----------
+        key : str
+            The cache key of the directory, as returned by `cache_key`.
+        directory : str
+            The searched directory.
+        name : str
+            The name of the key file.
+
+        Returns
+        -------
+        str or None
+            The full path to the key file, or `None` if it is not remembered or has changed.
+        """
+        with self._lock:
+            entry = self._load().get(key, {}).get(name)
+        if entry is None:
+            return None
+
+        path = os.path.join(directory, entry["path"])
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(file_stat.st_mode) or [file_stat.st_size, file_stat.st_mtime_ns] != entry["stat"]:
+            return None
+        return path
+
+    def store(self, key, directory, found):
+        """
+        Remembers the locations of the key files found in a directory and saves the cache file.
+
+        The locations of other key files remembered for the directory are kept, so searching for one key does not
+        forget where the other one was found.
+
+        Parameters
+        ----------
+        key : str
+            The cache key of the directory, as returned by `cache_key`.
+        directory : str
+            The searched directory.
+        found : dict
+            The paths of the found key files keyed by file name.
+
+        Returns
+        -------
+        None.
+        """
+        locations = {}
+        for name, path in found.items():
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+            locations[name] = {
+                "path": os.path.relpath(path, directory),
+                "stat": [file_stat.st_size, file_stat.st_mtime_ns],
+            }
+
+        with self._lock:
+            entries = self._load()
+            locations = {**entries.pop(key, {}), **locations}
+            entries[key] = locations
+            while len(entries) > self.max_volumes:
+                del entries[next(iter(entries))]
+            self._save(entries)
+
+    def clear(self):
+        """
+        Forgets all the remembered locations and removes the cache file.
+
+        Returns
+        -------
+        None.
+        """
+        with self._lock:
+            self._entries = {}
+            try:
+                os.remove(self.cache_path)
+            except OSError:
+                pass
+
+    def _load(self):
+        """
+        Reads the cache file on first use. A missing or damaged file is treated as an empty cache.
+
+        Returns
+        -------
+        dict
+            The remembered locations keyed by cache key.
+        """
+        if self._entries is None:
+            try:
+                with open(self.cache_path, encoding="utf-8") as cache_file:
+                    self._entries = json.load(cache_file)
+                if not isinstance(self._entries, dict):
+                    self._entries = {}
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self, entries):
+        """
+        Atomically writes the cache file through a unique temporary file (see `src.atomic_write`). Failures are
+        ignored, as the cache only speeds up the search.
+
+        Parameters
+        ----------
+        entries : dict
+            The remembered locations keyed by cache key.
+
+        Returns
+        -------
+        None.
+        """
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            write_atomically(self.cache_path, json.dumps(entries).encode("utf-8"))
+        except OSError:
+            pass
+
+
+key_locations = KeyLocationCache()
+
+
+def find_keys(directory, names=KEY_FILE_NAMES, max_depth=DEFAULT_MAX_DEPTH, cancel=None, cache=key_locations):
+    """
+    Finds the public key file (`public_key.pubk`) and the private key file (`encrypted_private_key.pk`) in the
+    specified directory and its subdirectories.
+
+    The locations of the requested keys remembered in the cache are checked first, so in the common case finding a
+    key costs a single `stat()` of the key file. Otherwise the requested keys which are not cached are searched for
+    in one pass over the directory (see `scan_for_keys`), which stops as soon as they are all found, and the results
+    are remembered for the next time.
+
+    Parameters
+    ----------
+    directory : str
+        The path to the directory where the search for the keys will be performed.
+    names : iterable of str, optional
+        The names of the key files which are needed. The directory is searched only if any of them is not cached.
+    max_depth : int or None, optional
+        The number of directory levels below `directory` to search. `None`, the default, removes the limit.
+    cancel : threading.Event, optional
+        When set, the search stops and the keys found so far are returned.
+    cache : KeyLocationCache or None, optional
+        The cache of key locations. `None` disables caching.
+
+    Returns
+    -------
+    KeyLocations
+        The full paths to the public and private key files, each `None` if not found. A key which was not requested
+        in `names` is `None` even if it exists.
+    """
+    key = cache.cache_key(directory) if cache is not None else None
+
+    found = {}
+    if key is not None:
+        for name in names:
+            path = cache.lookup(key, directory, name)
+            if path is not None:
+                found[name] = path
+
+    missing = [name for name in names if name not in found]
+    if missing:
+        found.update(scan_for_keys(directory, missing, max_depth=max_depth, cancel=cancel))
+        if key is not None and not (cancel is not None and cancel.is_set()):
+            cache.store(key, directory, found)
+
+    return KeyLocations(found.get(PUBLIC_KEY_NAME), found.get(PRIVATE_KEY_NAME))
 
 
 def find_public_key(directory):
@@ -6,7 +341,7 @@ def find_public_key(directory):
     Finds the public key file (`public_key.pubk`) in the specified directory and its subdirectories.
 
     This function searches through the directory and its subdirectories to find a file named `public_key.pubk`.
-    If the file is found, the full path to the file is returned. Otherwise, `None` is returned.
+    If the file is found, the full path to the file is returned. Otherwise, `None` is returned. See `find_keys`.
 
     Parameters
     ----------
@@ -18,10 +353,7 @@ def find_public_key(directory):
     str or None
         The full path to the public key file if found, otherwise `None`.
     """
-    for root, _, files in os.walk(directory):
-        if "public_key.pubk" in files:
-            return os.path.join(root, "public_key.pubk")
-    return None
+    return find_keys(directory, (PUBLIC_KEY_NAME,)).public_key
 
 
 def find_private_key(directory):
@@ -29,7 +361,7 @@ def find_private_key(directory):
     Finds the private key file (`encrypted_private_key.pk`) in the specified directory and its subdirectories.
 
     This function searches through the directory and its subdirectories to find a file named `encrypted_private_key.pk`.
-    If the file is found, the full path to the file is returned. Otherwise, `None` is returned.
+    If the file is found, the full path to the file is returned. Otherwise, `None` is returned. See `find_keys`.
 
     Parameters
     ----------
@@ -41,7 +373,4 @@ def find_private_key(directory):
     str or None
         The full path to the private key file if found, otherwise `None`.
     """
-    for root, _, files in os.walk(directory):
-        if "encrypted_private_key.pk" in files:
-            return os.path.join(root, "encrypted_private_key.pk")
-    return None
+    return find_keys(directory, (PRIVATE_KEY_NAME,)).private_key
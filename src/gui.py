@@ -1,13 +1,18 @@
 import sys
 from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QLabel, QVBoxLayout, QHBoxLayout, QFileDialog, \
-    QListWidget, QMessageBox, QTextEdit, QInputDialog, QCheckBox, QLineEdit
+    QListWidget, QListWidgetItem, QMessageBox, QTextEdit, QInputDialog, QCheckBox, QLineEdit
 from PyQt5.QtGui import QIcon
 from PyQt5.QtCore import Qt
 
-from src.detecting_usb import detect_usb_devices
-from src.document_signing import sign_pdf
+from src.detecting_usb import format_device
+from src.document_signing import sign_pdf_to, unlocked_keys
 from src.find_keys import find_public_key
-from src.verify_signature import verify_signature
+from src.key_cache import public_keys
+from src.key_container import WrongPinError
+from src.keystore import Keystore, format_key_entry, newest_first
+from src.mount_watcher import MountWatcher
+from src.verify_signature import STATUS_MESSAGES, check_signature
+from src.workers import Worker, cancel_workers, start_worker
 
 
 def select_folder_pub_key(status_label, window):
@@ -130,58 +135,75 @@ def select_file(window, file_preview, status_label, button_sign_document, button
             button_sign_document.setVisible(False)
 
 
-def refresh_usb(status_label, app, usb_list, window, button_sign_document, checkbox_same_folder, button_verify_signature, pub_key_button, folder_label):
+def update_usb_devices(added, removed, status_label, usb_list, window, button_sign_document, checkbox_same_folder, button_verify_signature, pub_key_button, folder_label):
     """
-    Refreshes the list of detected USB devices.
+    Updates the list of USB devices after the mount watcher has detected a change.
 
-    This function searches for connected USB devices and updates the list in the user interface. It provides status updates
-    to the user, indicating whether devices were detected or if no devices were found. If devices are detected, the user
-    can select one from the list, which will then enable the functionality to sign or verify the document.
+    Only the devices which were removed or added are taken out of or put into the list, so the selection of a device
+    which is still connected is preserved. A device whose record changed (e.g. its label) is reported as removed and
+    added again; its list item is updated in place, so it stays selected. If the selected device has been removed,
+    the selection is cleared and the buttons requiring it are hidden.
 
     Parameters
     ----------
+    added : list of UsbDevice
+        The devices connected since the previous scan. The mount point of every device is stored in its list item,
+        so it can be used as the path of the selected device.
+    removed : list of UsbDevice
+        The devices disconnected since the previous scan.
     status_label : QLabel
         The label in the user interface that provides status updates and prompts the user for further actions.
-    app : QApplication
-        The main application instance responsible for managing the application's event loop and updating the interface.
     usb_list : QListWidget
         The list widget that displays the detected USB devices for the user to select.
     window : QWidget
         The main application window used for displaying and interacting with the user interface.
     button_sign_document : QPushButton
         The button that allows the user to sign the document, visible once a USB device is selected.
-    pub_key_button : QPushButton
-        The button to select the public key folder for document signature or verification.
     checkbox_same_folder : QCheckBox
         The checkbox that determines if the private and public key should be stored in the same folder.
-    folder_label: QLabel
-        The label of selected public ket path
     button_verify_signature : QPushButton
         The button that allows the user to verify the signature of the PDF document once both the file and USB drive are selected.
+    pub_key_button : QPushButton
+        The button to select the public key folder for document signature or verification.
+    folder_label: QLabel
+        The label of selected public ket path
 
     Returns
     -------
     None.
     """
-    status_label.setText("Wyszukiwanie nośników USB...")
-    status_label.setStyleSheet("""
-        font-family: 'Verdana', sans-serif;
-        font-size: 14px;
-        color: #FF6600;
-        padding: 5px;
-        border-radius: 5px;
-        background-color: #FFF3E6;
-        margin-top: 10px;
-        font-weight: normal;
-    """)
-    app.processEvents()
-
-    usb_list.clear()
-    devices = detect_usb_devices()
-    usb_list.addItems([f"{dev}" for dev in devices])
-
-    if devices:
-        status_label.setText(f"Liczba wykrytych nośników USB: {len(devices)}. Wybierz jeden z listy.")
+    added_devices = {device.mountpoint: device for device in added}
+    removed_mountpoints = {device.mountpoint for device in removed} - set(added_devices)
+    for row in reversed(range(usb_list.count())):
+        item = usb_list.item(row)
+        mountpoint = item.data(Qt.UserRole)
+        if mountpoint in added_devices:
+            item.setText(format_device(added_devices.pop(mountpoint)))
+        elif mountpoint in removed_mountpoints:
+            usb_list.takeItem(row)
+
+    for device in added_devices.values():
+        item = QListWidgetItem(format_device(device))
+        item.setData(Qt.UserRole, device.mountpoint)
+        usb_list.addItem(item)
+
+    selection_lost = window.selected_pendrive is not None and window.selected_pendrive in removed_mountpoints
+    if selection_lost:
+        window.selected_pendrive = None
+        usb_list.clearSelection()
+        button_sign_document.setVisible(False)
+        if checkbox_same_folder.isChecked():
+            button_verify_signature.setVisible(False)
+            pub_key_button.setVisible(False)
+            folder_label.setVisible(False)
+    elif window.selected_pendrive is not None:
+        return
+
+    if usb_list.count():
+        message = f"Liczba wykrytych nośników USB: {usb_list.count()}. Wybierz jeden z listy."
+        if selection_lost:
+            message = f"Wybrany nośnik USB został odłączony. {message}"
+        status_label.setText(message)
         status_label.setStyleSheet("""
             font-family: 'Verdana', sans-serif;
             font-size: 14px;
@@ -193,7 +215,7 @@ def refresh_usb(status_label, app, usb_list, window, button_sign_document, check
             font-weight: normal;
         """)
     else:
-        status_label.setText("Nie wykryto żadnych nośników USB. Podłącz nośnik i odśwież listę.")
+        status_label.setText("Nie wykryto żadnych nośników USB. Podłącz nośnik, a lista odświeży się automatycznie.")
         status_label.setStyleSheet("""
             font-family: 'Verdana', sans-serif;
             font-size: 14px;
@@ -204,12 +226,6 @@ def refresh_usb(status_label, app, usb_list, window, button_sign_document, check
             margin-top: 10px;
             font-weight: normal;
         """)
-    window.selected_pendrive = None
-    button_sign_document.setVisible(False)
-    if checkbox_same_folder.isChecked():
-        button_verify_signature.setVisible(False)
-        pub_key_button.setVisible(False)
-        folder_label.setVisible(False)
 
 
 def select_usb_device(window, usb_list, button_sign_document, button_verify_signature, pub_key_button, checkbox_same_folder, status_label, folder_label):
@@ -242,7 +258,7 @@ def select_usb_device(window, usb_list, button_sign_document, button_verify_sign
     -------
     None.
     """
-    window.selected_pendrive = usb_list.currentItem().text()
+    window.selected_pendrive = usb_list.currentItem().data(Qt.UserRole)
 
     if window.selected_file and window.selected_pendrive:
         button_verify_signature.setVisible(True)
@@ -296,12 +312,15 @@ def select_usb_device(window, usb_list, button_sign_document, button_verify_sign
                    """)
 
 
-def sign_document(window, status_label, app):
+def sign_document(window, status_label, button_cancel):
     """
     Handles the document signing process.
 
-    This function opens a dialog to input the PIN, then processes the selected PDF file using the private key from the
-    selected USB device. The user interface status is updated during the signing process.
+    If the keystore of the selected USB device holds more than one key, the user first chooses the key to sign with.
+    This function opens a dialog to input the PIN and a dialog to choose where the signed file should be saved, then
+    signs the selected PDF file using the private key from the selected USB device in a background worker. The window
+    stays responsive during signing, so the user can queue further documents or cancel the operation. The user
+    interface status is updated during the signing process.
 
     Parameters
     ----------
@@ -309,70 +328,59 @@ def sign_document(window, status_label, app):
         The main application window used for displaying and interacting with the user interface.
     status_label : QLabel
         The label in the user interface that provides status updates and prompts the user for further actions.
-    app : QApplication
-        The main application instance responsible for managing the application's event loop and updating the interface.
+    button_cancel : QPushButton
+        The button cancelling the running operations, visible while any operation is running.
 
     Returns
     -------
     None.
     """
+    try:
+        keys = Keystore(window.selected_pendrive).entries()
+    except (OSError, ValueError):
+        keys = {}
+
+    key_id = None
+    if len(keys) > 1:
+        key_ids = newest_first(keys)
+        items = [format_key_entry(candidate, keys[candidate]) for candidate in key_ids]
+        item, ok = QInputDialog.getItem(window, 'Wybierz klucz', 'Klucz do podpisu:', items, 0, False)
+        if not ok:
+            show_error(status_label, "Nie wybrano klucza.")
+            return
+        key_id = key_ids[items.index(item)]
 
     pin, ok = QInputDialog.getText(window, 'Wprowadź PIN', 'Podaj PIN do klucza:', QLineEdit.EchoMode.Password)
 
     if ok and pin:
-        try:
-            status_label.setText("Podpisywanie dokumentu...")
-            status_label.setStyleSheet("""
-                font-family: 'Verdana', sans-serif;
-                font-size: 14px;
-                color: #FF6600;
-                padding: 5px;
-                border-radius: 5px;
-                background-color: #FFF3E6;
-                margin-top: 10px;
-                font-weight: normal;
-            """)
-            app.processEvents()
+        save_file_dialog = QFileDialog()
+        save_file_dialog.setDefaultSuffix('pdf')
+        output_pdf_path, _ = save_file_dialog.getSaveFileName(
+            None, 'Zapisz podpisany plik PDF', '', 'PDF Files (*.pdf)')
 
+        if not output_pdf_path:
+            show_error(status_label, "Nie wybrano ścieżki zapisu.")
+            return
 
-            pin = str(pin)
-            mess = sign_pdf(window.selected_pendrive, window.selected_file, pin)
+        status_label.setText("Podpisywanie dokumentu...")
+        status_label.setStyleSheet("""
+            font-family: 'Verdana', sans-serif;
+            font-size: 14px;
+            color: #FF6600;
+            padding: 5px;
+            border-radius: 5px;
+            background-color: #FFF3E6;
+            margin-top: 10px;
+            font-weight: normal;
+        """)
 
-            status_label.setText(mess)
-            status_label.setStyleSheet("""
-                font-family: 'Verdana', sans-serif;
-                font-size: 14px;
-                color: #006600;
-                padding: 5px;
-                border-radius: 5px;
-                background-color: #E6FFE6;
-                margin-top: 10px;
-                font-weight: normal;
-            """)
-        except ValueError:
-            status_label.setText("Błąd! Nieprawidłowy PIN.")
-            status_label.setStyleSheet("""
-                font-family: 'Verdana', sans-serif;
-                font-size: 14px;
-                color: #CC0000;
-                padding: 5px;
-                border-radius: 5px;
-                background-color: #FFEEEE;
-                margin-top: 10px;
-                font-weight: normal;
-            """)
-        except Exception as e:
-            status_label.setText(f"Błąd podczas podpisywania: {str(e)}")
-            status_label.setStyleSheet("""
-                font-family: 'Verdana', sans-serif;
-                font-size: 14px;
-                color: #CC0000;
-                padding: 5px;
-                border-radius: 5px;
-                background-color: #FFEEEE;
-                margin-top: 10px;
-                font-weight: normal;
-            """)
+        worker = Worker(sign_pdf_to, window.selected_pendrive, window.selected_file, str(pin), output_pdf_path,
+                        key_id=key_id)
+        worker.signals.progress.connect(lambda percent: status_label.setText(f"Podpisywanie dokumentu... {percent}%"))
+        worker.signals.result.connect(lambda mess: show_success(status_label, mess))
+        worker.signals.error.connect(lambda e: show_error(status_label, "Błąd! Nieprawidłowy PIN." if isinstance(e, WrongPinError) else f"Błąd podczas podpisywania: {str(e)}"))
+        worker.signals.cancelled.connect(lambda: show_error(status_label, "Podpisywanie zostało anulowane."))
+        run_worker(window, worker, button_cancel)
     else:
         status_label.setText("Błąd! PIN nie został wprowadzony.")
         status_label.setStyleSheet("""
@@ -388,85 +396,165 @@ def sign_document(window, status_label, app):
         QMessageBox.warning(window, 'Błąd', 'PIN nie został wprowadzony.')
 
 
-def signature_verification(status_label, app, checkbox_same_folder, window, selected_folder_pub_key):
+def verify_with_key_folder(pdf_path, directory, progress=None):
+    """
+    Verifies the signature of a PDF file with the public key found in the given directory.
+
+    The key is loaded through the shared `public_keys` cache, so verifying more documents with the same key folder does
+    not parse the key again. This function is run by a background worker started by `signature_verification`, off
+    the GUI thread, so it takes no widgets.
+
+    Parameters
+    ----------
+    pdf_path : str
+        The path to the signed PDF file.
+    directory : str
+        The path to the directory where the public key is searched for.
+    progress : callable, optional
+        Called as `progress(done, total)` while the document is hashed.
+
+    Returns
+    -------
+    str
+        A message indicating whether the signature is valid or not.
+    """
+    public_key_path = find_public_key(directory)
+    if not public_key_path:
+        return f"Nie znaleziono klucza publicznego w {directory}"
+    return STATUS_MESSAGES[check_signature(pdf_path, public_keys.load(public_key_path), progress)]
+
+
+def signature_verification(status_label, checkbox_same_folder, window, selected_folder_pub_key, button_cancel):
     """
     Handles the document signature verification process.
 
-    This function verifies the electronic signature in the selected PDF document. The result of the verification is displayed
-    on the user interface. It returns a message indicating whether the verification was successful or failed.
+    This function verifies the electronic signature in the selected PDF document in a background worker, so the window
+    stays responsive. The result of the verification is displayed on the user interface once the worker finishes.
 
     Parameters
     ----------
     status_label : QLabel
         The label in the user interface that provides status updates and prompts the user for further actions.
-    app : QApplication
-        The main application instance responsible for managing the application's event loop and updating the interface.
     checkbox_same_folder : QCheckBox
         The checkbox indicating whether the public key is located in the same folder as the private key on the USB device.
     window : QWidget
         The main application window used for displaying and interacting with the user interface.
     selected_folder_pub_key : str
         The folder path where the public key is located if it was selected by the user.
+    button_cancel : QPushButton
+        The button cancelling the running operations, visible while any operation is running.
 
     Returns
     -------
     None.
     """
-    try:
-        status_label.setText("Weryfikacja podpisu...")
-        status_label.setStyleSheet("""
-            font-family: 'Verdana', sans-serif;
-            font-size: 14px;
-            color: #FF6600;
-            padding: 5px;
-            border-radius: 5px;
-            background-color: #FFF3E6;
-            margin-top: 10px;
-            font-weight: normal;
-        """)
-        app.processEvents()
-
-        if not window.selected_file:
-            mess = "Wybierz plik"
-        elif checkbox_same_folder.isChecked():
-            public_key = find_public_key(window.selected_pendrive)
-            if not public_key:
-                mess = f"Nie znaleziono klucza publicznego w {window.selected_pendrive}"
-            else:
-                mess = verify_signature(window.selected_file, public_key)
-        else:
-            if selected_folder_pub_key == "":
-                mess = "Nie wybrano folderu z kluczem publicznym"
-            else:
-                public_key = find_public_key(selected_folder_pub_key)
-                if not public_key:
-                    mess = f"Nie znaleziono klucza publicznego w {selected_folder_pub_key}"
-                else:
-                    mess = verify_signature(window.selected_file, public_key)
+    if not window.selected_file:
+        show_success(status_label, "Wybierz plik")
+        return
 
-        status_label.setText(mess)
-        status_label.setStyleSheet("""
-            font-family: 'Verdana', sans-serif;
-            font-size: 14px;
-            color: #006600;
-            padding: 5px;
-            border-radius: 5px;
-            background-color: #E6FFE6;
-            margin-top: 10px;
-            font-weight: normal;
-        """)
-    except Exception as e:
-        status_label.setText(f"Błąd podczas weryfikacji podpisu: {str(e)}")
-        status_label.setStyleSheet("""
-            font-family: 'Verdana', sans-serif;
-            font-size: 14px;
-            color: #CC0000;
-            padding: 5px;
-            border-radius: 5px;
-            background-color: #FFEEEE;
-            margin-top: 10px;
-            font-weight: normal;
-        """)
+    if checkbox_same_folder.isChecked():
+        directory = window.selected_pendrive
+    elif selected_folder_pub_key == "":
+        show_success(status_label, "Nie wybrano folderu z kluczem publicznym")
+        return
+    else:
+        directory = selected_folder_pub_key
+
+    status_label.setText("Weryfikacja podpisu...")
+    status_label.setStyleSheet("""
+        font-family: 'Verdana', sans-serif;
+        font-size: 14px;
+        color: #FF6600;
+        padding: 5px;
+        border-radius: 5px;
+        background-color: #FFF3E6;
+        margin-top: 10px;
+        font-weight: normal;
+    """)
+
+    worker = Worker(verify_with_key_folder, window.selected_file, directory)
+    worker.signals.progress.connect(lambda percent: status_label.setText(f"Weryfikacja podpisu... {percent}%"))
+    worker.signals.result.connect(lambda mess: show_success(status_label, mess))
+    worker.signals.error.connect(lambda e: show_error(status_label, f"Błąd podczas weryfikacji podpisu: {str(e)}"))
+    worker.signals.cancelled.connect(lambda: show_error(status_label, "Weryfikacja została anulowana."))
+    run_worker(window, worker, button_cancel)
+
+
+def run_worker(window, worker, button_cancel):
+    """
+    Starts a background worker and shows the cancel button while any worker is running.
+
+    Parameters
+    ----------
+    window : QWidget
+        The main application window keeping the list of running workers.
+    worker : Worker
+        The worker to start.
+    button_cancel : QPushButton
+        The button cancelling the running operations.
+
+    Returns
+    -------
+    None.
+    """
+    start_worker(window, worker, on_finished=lambda: button_cancel.setVisible(len(window.workers) > 0))
+    button_cancel.setVisible(True)
+
+
+def show_success(status_label, message):
+    """
+    Displays the result of a finished operation in the status label.
+
+    Parameters
+    ----------
+    status_label : QLabel
+        The label in the user interface that provides status updates and prompts the user for further actions.
+    message : str
+        The message to display.
+
+    Returns
+    -------
+    None.
+    """
+    status_label.setText(message)
+    status_label.setStyleSheet("""
+        font-family: 'Verdana', sans-serif;
+        font-size: 14px;
+        color: #006600;
+        padding: 5px;
+        border-radius: 5px;
+        background-color: #E6FFE6;
+        margin-top: 10px;
+        font-weight: normal;
+    """)
+
+
+def show_error(status_label, message):
+    """
+    Displays an error message in the status label.
+
+    Parameters
+    ----------
+    status_label : QLabel
+        The label in the user interface that provides status updates and prompts the user for further actions.
+    message : str
+        The error message to display.
+
+    Returns
+    -------
+    None.
+    """
+    status_label.setText(message)
+    status_label.setStyleSheet("""
+        font-family: 'Verdana', sans-serif;
+        font-size: 14px;
+        color: #CC0000;
+        padding: 5px;
+        border-radius: 5px;
+        background-color: #FFEEEE;
+        margin-top: 10px;
+        font-weight: normal;
+    """)
 
 
 def create_gui():
@@ -486,6 +574,7 @@ def create_gui():
     None.
     """
     app = QApplication(sys.argv)
+    app.aboutToQuit.connect(unlocked_keys.lock)
     window = QWidget()
 
     window.setWindowIcon(QIcon('src/key.png'))
@@ -495,6 +584,8 @@ def create_gui():
 
     window.selected_file = None
     window.selected_pendrive = None
+    window.workers = []
+    app.aboutToQuit.connect(lambda: cancel_workers(window))
 
     button_select_file = QPushButton('✧ Wybierz plik PDF ✧', window)
     file_preview = QTextEdit(window)
@@ -551,9 +642,6 @@ def create_gui():
     usb_label = QLabel('🔌 Wykryte nośniki: ', window)
     usb_list = QListWidget(window)
     usb_list.setSelectionMode(QListWidget.SingleSelection)
-    button_refresh_usb = QPushButton('🔄 Odśwież listę USB', window)
-
-    button_refresh_usb.clicked.connect(lambda: refresh_usb(status_label, app, usb_list, window, button_sign_document, checkbox_same_folder, button_verify_signature, pub_key_button, folder_label))
 
     button_sign_document = QPushButton('Podpisz dokument', window)
     button_sign_document.setVisible(False)
@@ -572,24 +660,32 @@ def create_gui():
 
 
     usb_list.itemClicked.connect(lambda: select_usb_device(window, usb_list, button_sign_document, button_verify_signature, pub_key_button, checkbox_same_folder, status_label, folder_label))
-    button_sign_document.clicked.connect(lambda: sign_document(window, status_label, app))
+    window.mount_watcher = MountWatcher(window)
+    window.mount_watcher.changed.connect(lambda added, removed: update_usb_devices(added, removed, status_label, usb_list, window, button_sign_document, checkbox_same_folder, button_verify_signature, pub_key_button, folder_label))
+    window.mount_watcher.error.connect(lambda e: show_error(status_label, f"Błąd podczas wyszukiwania nośników USB: {str(e)}"))
+    app.aboutToQuit.connect(window.mount_watcher.stop)
+    button_cancel = QPushButton('Anuluj', window)
+    button_cancel.setVisible(False)
+    button_cancel.clicked.connect(lambda: cancel_workers(window))
+
+    button_sign_document.clicked.connect(lambda: sign_document(window, status_label, button_cancel))
 
     def select_folder_priv_pub_clicked():
         nonlocal selected_folder_pub_key
         selected_folder_pub_key = select_folder_pub_key(status_label, window)
         folder_label.setText(f"Ścieżka wybranego folderu: {selected_folder_pub_key}")
 
-    button_verify_signature.clicked.connect(lambda: signature_verification(status_label, app, checkbox_same_folder, window, selected_folder_pub_key))
+    button_verify_signature.clicked.connect(lambda: signature_verification(status_label, checkbox_same_folder, window, selected_folder_pub_key, button_cancel))
     pub_key_button.clicked.connect(select_folder_priv_pub_clicked)
 
     right_layout = QVBoxLayout()
     right_layout.addWidget(usb_label)
     right_layout.addWidget(usb_list)
-    right_layout.addWidget(button_refresh_usb)
     right_layout.addWidget(button_sign_document)
     right_layout.addWidget(button_verify_signature)
     right_layout.addWidget(pub_key_button)
     right_layout.addWidget(folder_label)
+    right_layout.addWidget(button_cancel)
 
     main_layout = QHBoxLayout()
     main_layout.addLayout(left_layout)
@@ -601,7 +697,7 @@ def create_gui():
 
     window.setLayout(final_layout)
 
-    right_layout.insertWidget(3, checkbox_same_folder)
+    right_layout.insertWidget(2, checkbox_same_folder)
 
     window.setStyleSheet("""
         QWidget {
@@ -641,4 +737,5 @@ def create_gui():
     """)
 
     window.show()
+    window.mount_watcher.start()
     sys.exit(app.exec_())
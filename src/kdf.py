@@ -0,0 +1,255 @@
+import argparse
+import hashlib
+import math
+import os
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from cryptography.exceptions import UnsupportedAlgorithm
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+KDF_SHA256 = 0
+KDF_SCRYPT = 1
+KDF_PBKDF2 = 2
+KDF_NAMES = {KDF_SHA256: "sha256", KDF_SCRYPT: "scrypt", KDF_PBKDF2: "pbkdf2"}
+
+KEY_SIZE = 32
+SALT_SIZE = 16
+DEFAULT_TARGET_LATENCY = 0.25
+
+SCRYPT_PARAMS_FORMAT = ">16sBBB"
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_PROBE_LOG2_N = 12
+MIN_SCRYPT_LOG2_N = 14
+MAX_SCRYPT_LOG2_N = 18
+
+PBKDF2_PARAMS_FORMAT = ">16sI"
+PBKDF2_PROBE_ITERATIONS = 20_000
+MIN_PBKDF2_ITERATIONS = 100_000
+MAX_PBKDF2_ITERATIONS = 5_000_000
+
+KdfCost = namedtuple("KdfCost", ["kdf", "cost"])
+
+_calibrated_costs = {}
+_calibration_lock = threading.Lock()
+
+
+def scrypt_available():
+    """
+    Checks if the OpenSSL library used by `cryptography` supports scrypt.
+
+    Returns
+    -------
+    bool
+    """
+    try:
+        Scrypt(salt=bytes(SALT_SIZE), length=KEY_SIZE, n=2, r=1, p=1)
+    except UnsupportedAlgorithm:
+        return False
+    return True
+
+
+def encode_kdf_params(kdf, cost, salt=None):
+    """
+    Encodes the parameters of a key derivation function for the header of a key container.
+
+    Parameters
+    ----------
+    kdf : int
+        The key derivation function, `KDF_SCRYPT`, `KDF_PBKDF2` or `KDF_SHA256`.
+    cost : int or None
+        The cost of the function: the base 2 logarithm of the scrypt `n` parameter or the number of PBKDF2
+        iterations. Ignored for `KDF_SHA256`.
+    salt : bytes, optional
+        The 16-byte salt. A random salt is generated by default.
+
+    Returns
+    -------
+    bytes
+        The encoded parameters: the salt followed by `log2(n)`, `r` and `p` for scrypt, or the salt followed by the
+        number of iterations for PBKDF2. Empty for `KDF_SHA256`, which has no parameters.
+
+    Raises
+    ------
+    ValueError
+        If the function is not supported or the cost is out of range.
+    """
+    if kdf == KDF_SHA256:
+        return b""
+    salt = os.urandom(SALT_SIZE) if salt is None else salt
+    if kdf == KDF_SCRYPT and MIN_SCRYPT_LOG2_N <= cost <= MAX_SCRYPT_LOG2_N:
+        return struct.pack(SCRYPT_PARAMS_FORMAT, salt, cost, SCRYPT_R, SCRYPT_P)
+    if kdf == KDF_PBKDF2 and MIN_PBKDF2_ITERATIONS <= cost <= MAX_PBKDF2_ITERATIONS:
+        return struct.pack(PBKDF2_PARAMS_FORMAT, salt, cost)
+    raise ValueError(f"Niepoprawne parametry funkcji wyprowadzania klucza: {KDF_NAMES.get(kdf, kdf)} {cost}")
+
+
+def derive_key(pin, kdf, kdf_params):
+    """
+    Derives the 256-bit encryption key of a key container from the PIN.
+
+    Parameters
+    ----------
+    pin : str
+        The PIN protecting the private key.
+    kdf : int
+        The identifier of the key derivation function stored in the container header.
+    kdf_params : bytes
+        The parameters of the key derivation function stored in the container header (see `encode_kdf_params`).
+        The header is read before the PIN is verified, so the cost is bounded: scrypt up to `MAX_SCRYPT_LOG2_N`
+        (256 MiB of memory) and PBKDF2 up to `MAX_PBKDF2_ITERATIONS`, which takes about as long as the largest scrypt
+        cost. A damaged or crafted header can neither exhaust the memory nor make unlocking the key run for hours.
+
+    Returns
+    -------
+    bytes
+        The 32-byte encryption key.
+
+    Raises
+    ------
+    ValueError
+        If the key derivation function is not supported or its parameters are damaged.
+    """
+    secret = pin.encode()
+    try:
+        if kdf == KDF_SHA256:
+            return hashlib.sha256(secret).digest()
+        if kdf == KDF_SCRYPT:
+            salt, log2_n, r, p = struct.unpack(SCRYPT_PARAMS_FORMAT, kdf_params)
+            if not MIN_SCRYPT_LOG2_N <= log2_n <= MAX_SCRYPT_LOG2_N or (r, p) != (SCRYPT_R, SCRYPT_P):
+                raise ValueError("Niepoprawne parametry funkcji scrypt.")
+            return Scrypt(salt=salt, length=KEY_SIZE, n=2 ** log2_n, r=r, p=p).derive(secret)
+        if kdf == KDF_PBKDF2:
+            salt, iterations = struct.unpack(PBKDF2_PARAMS_FORMAT, kdf_params)
+            if not MIN_PBKDF2_ITERATIONS <= iterations <= MAX_PBKDF2_ITERATIONS:
+                raise ValueError("Niepoprawne parametry funkcji PBKDF2.")
+            return PBKDF2HMAC(algorithm=hashes.SHA256(), length=KEY_SIZE, salt=salt,
+                              iterations=iterations).derive(secret)
+    except struct.error:
+        raise ValueError("Uszkodzone parametry funkcji wyprowadzania klucza.")
+    except UnsupportedAlgorithm:
+        raise ValueError(f"Funkcja {KDF_NAMES[kdf]} nie jest dostępna w bibliotece OpenSSL.")
+    raise ValueError(f"Nieobsługiwana funkcja wyprowadzania klucza: {kdf}")
+
+
+def measure_kdf(kdf, cost, repeat=2):
+    """
+    Measures how long a key derivation takes on the current host.
+
+    Parameters
+    ----------
+    kdf : int
+        The key derivation function, `KDF_SCRYPT` or `KDF_PBKDF2`.
+    cost : int
+        The base 2 logarithm of the scrypt `n` parameter or the number of PBKDF2 iterations. It is not checked
+        against the minimum, so cheap probes can be measured.
+    repeat : int, optional
+        The number of measurements; the fastest one is returned, so the first run warming up the caches does not
+        distort the result.
+
+    Returns
+    -------
+    float
+        The time of a single derivation in seconds.
+    """
+    salt = bytes(SALT_SIZE)
+    timings = []
+    for _ in range(repeat):
+        if kdf == KDF_SCRYPT:
+            function = Scrypt(salt=salt, length=KEY_SIZE, n=2 ** cost, r=SCRYPT_R, p=SCRYPT_P)
+        else:
+            function = PBKDF2HMAC(algorithm=hashes.SHA256(), length=KEY_SIZE, salt=salt, iterations=cost)
+        start = time.perf_counter()
+        function.derive(b"calibration")
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def calibrate_kdf(target_latency=DEFAULT_TARGET_LATENCY, kdf=None):
+    """
+    Chooses the cost of the key derivation function so that unlocking a key takes about `target_latency` on the
+    current host.
+
+    A cheap derivation is measured and the cost is extrapolated from it, as the time of both functions grows linearly
+    with their cost. The scrypt cost can only be doubled, so the power of two closest to the target is chosen. The
+    cost never drops below `MIN_SCRYPT_LOG2_N` (16 MiB of memory) or `MIN_PBKDF2_ITERATIONS`, so on a very slow host
+    the unlock takes longer than the target instead of becoming weak, and it is capped at `MAX_SCRYPT_LOG2_N` or
+    `MAX_PBKDF2_ITERATIONS`, the largest costs accepted when a key is unlocked. The result is cached for the process,
+    so generating many keys calibrates only once.
+
+    Parameters
+    ----------
+    target_latency : float, optional
+        The desired time of unlocking a key, in seconds. 250 ms by default.
+    kdf : int, optional
+        The key derivation function. Defaults to scrypt, or to PBKDF2 if scrypt is not available.
+
+    Returns
+    -------
+    KdfCost
+        The key derivation function and its cost, to be passed to `encode_kdf_params`.
+    """
+    if kdf is None:
+        kdf = KDF_SCRYPT if scrypt_available() else KDF_PBKDF2
+
+    with _calibration_lock:
+        cached = _calibrated_costs.get((kdf, target_latency))
+        if cached is not None:
+            return cached
+
+        if kdf == KDF_SCRYPT:
+            probe = measure_kdf(KDF_SCRYPT, SCRYPT_PROBE_LOG2_N)
+            log2_n = SCRYPT_PROBE_LOG2_N + round(math.log2(max(target_latency / probe, 1)))
+            cost = KdfCost(KDF_SCRYPT, min(max(log2_n, MIN_SCRYPT_LOG2_N), MAX_SCRYPT_LOG2_N))
+        elif kdf == KDF_PBKDF2:
+            probe = measure_kdf(KDF_PBKDF2, PBKDF2_PROBE_ITERATIONS)
+            iterations = int(PBKDF2_PROBE_ITERATIONS * target_latency / probe)
+            cost = KdfCost(KDF_PBKDF2, min(max(iterations, MIN_PBKDF2_ITERATIONS), MAX_PBKDF2_ITERATIONS))
+        else:
+            raise ValueError(f"Nie można skalibrować funkcji wyprowadzania klucza: {KDF_NAMES.get(kdf, kdf)}")
+
+        _calibrated_costs[(kdf, target_latency)] = cost
+        return cost
+
+
+def main(argv=None):
+    """
+    Entry point of the calibration command, which shows the key derivation cost chosen on the current host.
+
+    Usage: `python -m src.kdf [--target MS] [--kdf scrypt|pbkdf2]`
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments. Defaults to `sys.argv[1:]`.
+
+    Returns
+    -------
+    int
+        The exit code: 0 on success.
+    """
+    parser = argparse.ArgumentParser(description="Kalibracja funkcji wyprowadzania klucza z PIN-u.")
+    parser.add_argument("--target", type=float, default=DEFAULT_TARGET_LATENCY * 1000,
+                        help="Docelowy czas odblokowania klucza w milisekundach.")
+    parser.add_argument("--kdf", choices=[KDF_NAMES[KDF_SCRYPT], KDF_NAMES[KDF_PBKDF2]],
+                        help="Funkcja wyprowadzania klucza (domyślnie scrypt, jeśli jest dostępny).")
+    args = parser.parse_args(argv)
+
+    kdf = {name: kdf for kdf, name in KDF_NAMES.items()}.get(args.kdf)
+    cost = calibrate_kdf(args.target / 1000, kdf)
+    if cost.kdf == KDF_SCRYPT:
+        description = f"scrypt n=2^{cost.cost} r={SCRYPT_R} p={SCRYPT_P}"
+    else:
+        description = f"pbkdf2-sha256 iterations={cost.cost}"
+    print(f"{description}: {measure_kdf(cost.kdf, cost.cost, repeat=1) * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import hashlib
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+
+ALGORITHM_RSA = "RSA"
+ALGORITHM_ECDSA_P256 = "ECDSA-P256"
+ALGORITHM_ED25519 = "Ed25519"
+ALGORITHMS = (ALGORITHM_RSA, ALGORITHM_ECDSA_P256, ALGORITHM_ED25519)
+DEFAULT_ALGORITHM = ALGORITHM_RSA
+
+RSA_KEY_SIZE = 4096
+PUBLIC_EXPONENT = 65537
+
+
+def generate_private_key(algorithm=DEFAULT_ALGORITHM):
+    """
+    Generates a private key for the given signature algorithm.
+
+    Parameters
+    ----------
+    algorithm : str, optional
+        One of `ALGORITHMS`: 4096-bit RSA, ECDSA on the P-256 curve or Ed25519.
+
+    Returns
+    -------
+    private_key : private key
+        The generated private key.
+
+    Raises
+    ------
+    ValueError
+        If the algorithm is not supported.
+    """
+    if algorithm == ALGORITHM_RSA:
+        return rsa.generate_private_key(public_exponent=PUBLIC_EXPONENT, key_size=RSA_KEY_SIZE)
+    if algorithm == ALGORITHM_ECDSA_P256:
+        return ec.generate_private_key(ec.SECP256R1())
+    if algorithm == ALGORITHM_ED25519:
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Nieobsługiwany algorytm klucza: {algorithm}")
+
+
+def key_algorithm(key):
+    """
+    Returns the signature algorithm of a private or public key.
+
+    Parameters
+    ----------
+    key : private or public key
+        The key to inspect.
+
+    Returns
+    -------
+    str
+        One of `ALGORITHMS`.
+
+    Raises
+    ------
+    ValueError
+        If the key type is not supported.
+    """
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return ALGORITHM_RSA
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)) and key.curve.name == "secp256r1":
+        return ALGORITHM_ECDSA_P256
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return ALGORITHM_ED25519
+    raise ValueError("Nieobsługiwany typ klucza.")
+
+
+def sign_digest(private_key, digest):
+    """
+    Signs the SHA-256 digest of a document.
+
+    RSA keys sign the prehashed digest with PKCS#1 v1.5 and ECDSA keys sign it with ECDSA, so the signatures are the
+    same as if the whole document had been signed. Ed25519 does not support prehashed messages, so the 32-byte digest
+    itself is signed as the message.
+
+    Parameters
+    ----------
+    private_key : private key
+        The private key used to sign the digest.
+    digest : bytes
+        The SHA-256 digest of the signed data.
+
+    Returns
+    -------
+    bytes
+        The signature.
+    """
+    algorithm = key_algorithm(private_key)
+    if algorithm == ALGORITHM_RSA:
+        return private_key.sign(digest, padding.PKCS1v15(), Prehashed(hashes.SHA256()))
+    if algorithm == ALGORITHM_ECDSA_P256:
+        return private_key.sign(digest, ec.ECDSA(Prehashed(hashes.SHA256())))
+    return private_key.sign(digest)
+
+
+def verify_digest(public_key, signature, digest):
+    """
+    Verifies the signature of the SHA-256 digest of a document, as produced by `sign_digest`.
+
+    Parameters
+    ----------
+    public_key : public key
+        The public key used to verify the signature.
+    signature : bytes
+        The signature to verify.
+    digest : bytes
+        The SHA-256 digest of the signed data.
+
+    Returns
+    -------
+    None.
+
+    Raises
+    ------
+    cryptography.exceptions.InvalidSignature
+        If the signature is not valid.
+    """
+    algorithm = key_algorithm(public_key)
+    if algorithm == ALGORITHM_RSA:
+        public_key.verify(signature, digest, padding.PKCS1v15(), Prehashed(hashes.SHA256()))
+    elif algorithm == ALGORITHM_ECDSA_P256:
+        public_key.verify(signature, digest, ec.ECDSA(Prehashed(hashes.SHA256())))
+    else:
+        public_key.verify(signature, digest)
+
+
+def strip_signature_padding(public_key, contents):
+    """
+    Extracts a signature from the zero-padded `/Contents` field of a signed document.
+
+    RSA and Ed25519 signatures have a fixed length given by the key, and ECDSA signatures are DER encoded sequences
+    which carry their own length, so the padding is removed without relying on the value of the signature.
+
+    Parameters
+    ----------
+    public_key : public key
+        The public key used to verify the signature.
+    contents : bytes
+        The decoded `/Contents` field.
+
+    Returns
+    -------
+    bytes
+        The signature.
+    """
+    algorithm = key_algorithm(public_key)
+    if algorithm == ALGORITHM_RSA:
+        length = (public_key.key_size + 7) // 8
+    elif algorithm == ALGORITHM_ECDSA_P256:
+        length = contents[1] + 2 if len(contents) > 1 else len(contents)
+    else:
+        length = 64
+    return contents[:length]
+
+
+def public_key_fingerprint(public_key):
+    """
+    Computes the fingerprint of a public key as the SHA-256 digest of its DER encoded SubjectPublicKeyInfo.
+
+    The fingerprint identifies the key: it is embedded in signed documents as the `/KeyID` field and used as the key
+    of the trust store index.
+
+    Parameters
+    ----------
+    public_key : public key
+        The public key to fingerprint.
+
+    Returns
+    -------
+    str
+        The hex encoded fingerprint.
+    """
+    der = public_key.public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return hashlib.sha256(der).hexdigest()
@@ -0,0 +1,264 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cryptography.hazmat.primitives import serialization
+
+DEFAULT_KEY_TTL = 300
+DEFAULT_MAX_KEYS = 4
+DEFAULT_MAX_PUBLIC_KEYS = 64
+
+
+def file_identity(path):
+    """
+    Returns the identity of a file: its resolved path together with the device, inode, modification time and size.
+
+    Two calls return the same identity only if the path still points to the same, unmodified file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the file.
+
+    Returns
+    -------
+    tuple
+        The `(real_path, device, inode, mtime_ns, size)` identity of the file.
+
+    Raises
+    ------
+    OSError
+        If the file does not exist or cannot be accessed.
+    """
+    real_path = os.path.realpath(path)
+    stat = os.stat(real_path)
+    return real_path, stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class UnlockedKeyCache:
+    """
+    In-process session cache of unlocked private keys.
+
+    Decrypting and parsing a private key is expensive, so an unlocked key is kept in memory and reused by the following
+    signatures. Entries are keyed by the key file identity (path, device, inode, modification time and size), so replacing
+    or modifying the key file invalidates the cached key. The PIN is never stored: only its HMAC under a random
+    per-cache secret is kept, and a cached key is returned only for the same PIN.
+
+    A key that has not been used for `ttl` seconds is dropped by a background timer, and at most `max_entries` keys
+    are kept, the least recently used one being dropped first. `evict` and `lock` drop keys explicitly.
+    """
+
+    def __init__(self, unlock, ttl=DEFAULT_KEY_TTL, max_entries=DEFAULT_MAX_KEYS):
+        """
+        Parameters
+        ----------
+        unlock : callable
+            The function called as `unlock(key_path, pin)` to decrypt a key missing from the cache.
+        ttl : float, optional
+            The number of seconds after which an unused key is dropped.
+        max_entries : int, optional
+            The maximum number of unlocked keys kept in memory.
+        """
+        self.unlock = unlock
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._secret = os.urandom(32)
+        self._lock = threading.RLock()
+        self._timer = None
+
+    def _pin_tag(self, pin):
+        return hmac.new(self._secret, pin.encode(), hashlib.sha256).digest()
+
+    def get(self, key_path, pin):
+        """
+        Returns the unlocked private key stored in the given file, decrypting it only if it is not cached.
+
+        Parameters
+        ----------
+        key_path : str
+            The path to the file containing the encrypted private key.
+        pin : str
+            The PIN used to decrypt the private key.
+
+        Returns
+        -------
+        private_key : private key
+            The unlocked private key.
+
+        Raises
+        ------
+        ValueError
+            If the PIN is incorrect or the decryption fails.
+        """
+        identity = file_identity(key_path)
+        pin_tag = self._pin_tag(pin)
+
+        with self._lock:
+            self.purge_expired()
+            entry = self._entries.get(identity[0])
+            if entry is not None and entry["identity"] == identity and hmac.compare_digest(entry["pin_tag"], pin_tag):
+                entry["last_used"] = time.monotonic()
+                self._entries.move_to_end(identity[0])
+                return entry["private_key"]
+
+        private_key = self.unlock(key_path, pin)
+
+        with self._lock:
+            self._entries[identity[0]] = {
+                "identity": identity,
+                "pin_tag": pin_tag,
+                "private_key": private_key,
+                "last_used": time.monotonic(),
+            }
+            self._entries.move_to_end(identity[0])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._schedule_purge()
+
+        return private_key
+
+    def evict(self, key_path):
+        """
+        Drops the unlocked key stored in the given file from the cache.
+
+        Parameters
+        ----------
+        key_path : str
+            The path to the file containing the encrypted private key.
+
+        Returns
+        -------
+        bool
+            `True` if the key was cached, `False` otherwise.
+        """
+        with self._lock:
+            return self._entries.pop(os.path.realpath(key_path), None) is not None
+
+    def lock(self):
+        """
+        Drops all unlocked keys from the cache.
+
+        Returns
+        -------
+        None.
+        """
+        with self._lock:
+            self._entries.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def purge_expired(self):
+        """
+        Drops the keys that have not been used for longer than the TTL.
+
+        Returns
+        -------
+        None.
+        """
+        with self._lock:
+            now = time.monotonic()
+            for real_path in [path for path, entry in self._entries.items() if now - entry["last_used"] >= self.ttl]:
+                del self._entries[real_path]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _schedule_purge(self):
+        if self._timer is not None or not self._entries:
+            return
+        oldest = min(entry["last_used"] for entry in self._entries.values())
+        delay = max(0.0, oldest + self.ttl - time.monotonic())
+        self._timer = threading.Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self.purge_expired()
+            self._schedule_purge()
+
+
+class PublicKeyCache:
+    """
+    LRU cache of parsed public keys.
+
+    Entries are keyed by the resolved path of the key file and validated by its identity (device, inode, modification
+    time and size), so each request costs a single `stat()` as long as the file is unchanged. A modified or replaced
+    key file is read and parsed again. The `hits` and `misses` counters show how effective the cache is.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_PUBLIC_KEYS):
+        """
+        Parameters
+        ----------
+        max_entries : int, optional
+            The maximum number of parsed public keys kept in memory.
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, public_key_path):
+        """
+        Returns the public key stored in the given PEM file, parsing it only if it is not cached.
+
+        Parameters
+        ----------
+        public_key_path : str
+            The path to the PEM encoded public key.
+
+        Returns
+        -------
+        public_key : public key
+            The parsed public key.
+        """
+        identity = file_identity(public_key_path)
+
+        with self._lock:
+            entry = self._entries.get(identity[0])
+            if entry is not None and entry[0] == identity:
+                self._entries.move_to_end(identity[0])
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        with open(identity[0], 'rb') as key_file:
+            public_key = serialization.load_pem_public_key(key_file.read())
+
+        with self._lock:
+            self._entries[identity[0]] = (identity, public_key)
+            self._entries.move_to_end(identity[0])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return public_key
+
+    def clear(self):
+        """
+        Drops all parsed public keys from the cache and resets the counters.
+
+        Returns
+        -------
+        None.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+# Shared by the GUI, the batch commands and library callers.
+public_keys = PublicKeyCache()
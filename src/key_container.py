@@ -0,0 +1,246 @@
+import hashlib
+import os
+import struct
+from collections import namedtuple
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import unpad
+from cryptography.exceptions import InvalidTag, UnsupportedAlgorithm
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from src.kdf import calibrate_kdf, derive_key, encode_kdf_params
+from src.key_algorithms import ALGORITHM_ECDSA_P256, ALGORITHM_ED25519, ALGORITHM_RSA, key_algorithm, \
+    public_key_fingerprint
+
+MAGIC = b"QESK"
+VERSION = 2
+HEADER_FORMAT = ">4sBBB32sH"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+NONCE_SIZE = 12
+V1_IV_SIZE = 16
+
+ALGORITHM_IDS = {ALGORITHM_RSA: 1, ALGORITHM_ECDSA_P256: 2, ALGORITHM_ED25519: 3}
+ALGORITHM_NAMES = {algorithm_id: name for name, algorithm_id in ALGORITHM_IDS.items()}
+
+KeyHeader = namedtuple("KeyHeader", ["version", "kdf", "kdf_params", "algorithm", "fingerprint", "size"])
+
+
+class WrongPinError(ValueError):
+    """
+    Raised when a private key cannot be decrypted with the given PIN.
+
+    It is a `ValueError`, so callers which report every decryption failure alike keep working, while the user
+    interface can tell a mistyped PIN from other errors.
+    """
+
+
+def encrypt_private_key(private_key, pin, kdf_cost=None):
+    """
+    Encrypts a private key into a version 2 key container.
+
+    The container starts with a fixed header: the `QESK` magic, the format version, the identifiers of the key
+    derivation function and of the key algorithm, the fingerprint of the public key and the key derivation parameters
+    (salt and cost, see `src.kdf.encode_kdf_params`). It is followed by a random nonce and the DER encoded PKCS#8
+    private key encrypted with AES-256-GCM. The header is authenticated together with the payload, so tampering with
+    any of its fields, e.g. lowering the cost, is detected when the key is decrypted, and the algorithm and fingerprint
+    can be read without the PIN.
+
+    Parameters
+    ----------
+    private_key : private key
+        The private key to be encrypted: RSA, ECDSA P-256 or Ed25519.
+    pin : str
+        The PIN used to derive the encryption key.
+    kdf_cost : KdfCost, optional
+        The key derivation function and its cost. Defaults to the cost calibrated on the current host for the default
+        unlock latency (see `src.kdf.calibrate_kdf`).
+
+    Returns
+    -------
+    bytes
+        The key container.
+    """
+    kdf, cost = kdf_cost or calibrate_kdf()
+    kdf_params = encode_kdf_params(kdf, cost)
+    fingerprint = bytes.fromhex(public_key_fingerprint(private_key.public_key()))
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, kdf, ALGORITHM_IDS[key_algorithm(private_key)], fingerprint,
+                         len(kdf_params)) + kdf_params
+    nonce = os.urandom(NONCE_SIZE)
+
+    private_key_der = private_key.private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    ciphertext = AESGCM(derive_key(pin, kdf, kdf_params)).encrypt(nonce, private_key_der, header + nonce)
+    return header + nonce + ciphertext
+
+
+def read_key_header(data):
+    """
+    Parses the header of a version 2 key container without decrypting it.
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the key file, or at least its beginning.
+
+    Returns
+    -------
+    KeyHeader or None
+        The format version, key derivation function and its parameters, key algorithm, hex encoded fingerprint of the
+        public key and the size of the header. `None` for version 1 files, which have no header.
+
+    Raises
+    ------
+    ValueError
+        If the header is damaged or the version is not supported.
+    """
+    if not data.startswith(MAGIC):
+        return None
+    if len(data) < HEADER_SIZE:
+        raise ValueError("Uszkodzony nagłówek pliku klucza.")
+
+    _, version, kdf, algorithm_id, fingerprint, params_size = struct.unpack_from(HEADER_FORMAT, data)
+    if version != VERSION:
+        raise ValueError(f"Nieobsługiwana wersja pliku klucza: {version}")
+    if algorithm_id not in ALGORITHM_NAMES or len(data) < HEADER_SIZE + params_size:
+        raise ValueError("Uszkodzony nagłówek pliku klucza.")
+
+    kdf_params = bytes(data[HEADER_SIZE:HEADER_SIZE + params_size])
+    return KeyHeader(version, kdf, kdf_params, ALGORITHM_NAMES[algorithm_id], fingerprint.hex(),
+                     HEADER_SIZE + params_size)
+
+
+def read_key_file_header(key_path):
+    """
+    Reads the header of a key file without decrypting it, e.g. to show the key fingerprint before the PIN is entered.
+
+    Parameters
+    ----------
+    key_path : str
+        The path to the encrypted private key.
+
+    Returns
+    -------
+    KeyHeader or None
+        The header of the key container, or `None` for version 1 files.
+
+    Raises
+    ------
+    OSError
+        If the file cannot be read.
+    ValueError
+        If the header is damaged or the version is not supported.
+    """
+    with open(key_path, "rb") as key_file:
+        beginning = key_file.read(HEADER_SIZE)
+        if not beginning.startswith(MAGIC) or len(beginning) < HEADER_SIZE:
+            return read_key_header(beginning)
+        params_size = struct.unpack_from(HEADER_FORMAT, beginning)[-1]
+        return read_key_header(beginning + key_file.read(params_size))
+
+
+def decrypt_private_key(data, pin):
+    """
+    Decrypts a key container of version 2 or a version 1 key file.
+
+    In version 2 a wrong PIN, or any modification of the file, is rejected by the AES-GCM authentication tag before
+    anything is parsed, and the authenticated DER payload is loaded without the slow RSA key consistency checks (see
+    `load_authenticated_der_key`). Version 1 files are the 16-byte IV followed by the AES-256-CBC encrypted PKCS#8
+    PEM, with the SHA-256 hash of the PIN as the key.
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the key file.
+    pin : str
+        The PIN used to decrypt the private key.
+
+    Returns
+    -------
+    private_key : private key
+        The decrypted private key.
+
+    Raises
+    ------
+    WrongPinError
+        If the PIN is incorrect. For version 2 containers this also covers a modified file, which the authentication
+        tag cannot tell apart from a wrong PIN.
+    ValueError
+        If the file is damaged or not supported.
+    """
+    header = read_key_header(data)
+    if header is None:
+        return decrypt_v1_private_key(data, pin)
+
+    nonce = data[header.size:header.size + NONCE_SIZE]
+    try:
+        private_key_der = AESGCM(derive_key(pin, header.kdf, header.kdf_params)).decrypt(
+            nonce, data[header.size + NONCE_SIZE:], data[:header.size + NONCE_SIZE])
+    except InvalidTag:
+        raise WrongPinError("Niepoprawny PIN.")
+
+    private_key = load_authenticated_der_key(private_key_der)
+    if public_key_fingerprint(private_key.public_key()) != header.fingerprint:
+        raise ValueError("Klucz prywatny nie pasuje do odcisku w nagłówku pliku.")
+    return private_key
+
+
+def load_authenticated_der_key(private_key_der):
+    """
+    Loads a DER encoded private key whose integrity has already been verified by the AES-GCM authentication tag.
+
+    The consistency checks of RSA keys take hundreds of milliseconds for a 4096-bit key. They protect against
+    damaged or maliciously crafted keys, which the authentication tag already rules out: only the holder of the PIN
+    could have produced the payload. The checks are therefore skipped when the installed `cryptography` supports it.
+
+    Parameters
+    ----------
+    private_key_der : bytes
+        The DER encoded PKCS#8 private key.
+
+    Returns
+    -------
+    private_key : private key
+        The loaded private key.
+    """
+    try:
+        return serialization.load_der_private_key(private_key_der, password=None, unsafe_skip_rsa_key_validation=True)
+    except TypeError:
+        return serialization.load_der_private_key(private_key_der, password=None)
+
+
+def decrypt_v1_private_key(data, pin):
+    """
+    Decrypts a version 1 key file: the IV followed by the AES-CBC encrypted PKCS#8 PEM.
+
+    A wrong PIN is detected only by the padding or the PEM parser failing, so every such failure is reported as a
+    wrong PIN.
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the key file.
+    pin : str
+        The PIN used to decrypt the private key.
+
+    Returns
+    -------
+    private_key : private key
+        The decrypted private key.
+
+    Raises
+    ------
+    WrongPinError
+        If the PIN is incorrect or the decryption fails.
+    """
+    iv, encrypted_key = data[:V1_IV_SIZE], data[V1_IV_SIZE:]
+    cipher = AES.new(hashlib.sha256(pin.encode()).digest(), AES.MODE_CBC, iv)
+
+    try:
+        private_key_pem = unpad(cipher.decrypt(encrypted_key), AES.block_size)
+        return serialization.load_pem_private_key(private_key_pem, password=None)
+    except (ValueError, UnsupportedAlgorithm):
+        raise WrongPinError("Niepoprawny PIN.")
@@ -0,0 +1,174 @@
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from src.detecting_usb import detect_usb_devices
+from src.find_keys import KEY_FILE_NAMES, PRIVATE_KEY_NAME, PUBLIC_KEY_NAME, find_keys
+from src.key_algorithms import public_key_fingerprint
+from src.key_cache import public_keys
+from src.key_container import read_key_file_header
+from src.keystore import Keystore, newest_first
+
+KEY_TYPE_PUBLIC = "public"
+KEY_TYPE_PRIVATE = "private"
+KEY_TYPES = {PUBLIC_KEY_NAME: KEY_TYPE_PUBLIC, PRIVATE_KEY_NAME: KEY_TYPE_PRIVATE}
+
+KeyCandidate = namedtuple("KeyCandidate", ["path", "key_type", "fingerprint", "device"])
+
+
+def describe_keys(device, locations, key_types=(KEY_TYPE_PUBLIC, KEY_TYPE_PRIVATE)):
+    """
+    Turns the key files found on a device into key candidates.
+
+    Parameters
+    ----------
+    device : UsbDevice
+        The device on which the keys were found.
+    locations : KeyLocations
+        The paths of the found key files, as returned by `find_keys`.
+    key_types : iterable of str, optional
+        The types of keys to describe, `KEY_TYPE_PUBLIC` and `KEY_TYPE_PRIVATE` by default.
+
+    Returns
+    -------
+    list of KeyCandidate
+        The candidates for the found keys. The fingerprint of a public key is the SHA-256 hash of its DER encoded
+        SubjectPublicKeyInfo, or `None` if the file cannot be parsed. The fingerprint of a private key is read from
+        the header of its key container without the PIN; it is `None` for version 1 key files, which have no header.
+    """
+    candidates = []
+    if locations.public_key and KEY_TYPE_PUBLIC in key_types:
+        try:
+            fingerprint = public_key_fingerprint(public_keys.load(locations.public_key))
+        except (OSError, ValueError):
+            fingerprint = None
+        candidates.append(KeyCandidate(locations.public_key, KEY_TYPE_PUBLIC, fingerprint, device))
+    if locations.private_key and KEY_TYPE_PRIVATE in key_types:
+        try:
+            header = read_key_file_header(locations.private_key)
+        except (OSError, ValueError):
+            header = None
+        fingerprint = header.fingerprint if header is not None else None
+        candidates.append(KeyCandidate(locations.private_key, KEY_TYPE_PRIVATE, fingerprint, device))
+    return candidates
+
+
+def describe_keystore(device):
+    """
+    Turns the private keys kept in the keystore of a device into key candidates.
+
+    Parameters
+    ----------
+    device : UsbDevice
+        The device whose keystore is read.
+
+    Returns
+    -------
+    list of KeyCandidate
+        The candidates for the keys listed in `keystore/index.json` whose files exist, newest first (see
+        `src.keystore.newest_first`). The fingerprint of every key is its key ID. Empty if the device has no keystore
+        or its index cannot be read.
+    """
+    keystore = Keystore(device.mountpoint)
+    try:
+        entries = keystore.entries()
+    except (OSError, ValueError):
+        return []
+
+    candidates = []
+    for key_id in newest_first(entries):
+        key_path = os.path.join(keystore.directory, entries[key_id]["file"])
+        if os.path.isfile(key_path):
+            candidates.append(KeyCandidate(key_path, KEY_TYPE_PRIVATE, key_id, device))
+    return candidates
+
+
+def discover_keys(devices=None, names=KEY_FILE_NAMES, max_workers=None, cancel=None):
+    """
+    Searches all the given devices for keys at the same time and yields the keys as soon as they are found.
+
+    Every device is searched with `find_keys` on its own thread, so a slow device does not delay the others and the
+    keys on a fast device are reported immediately. Private keys are read from the keystore of every device (see
+    `describe_keystore`), newest first; a device without a keystore is searched for an `encrypted_private_key.pk` file
+    saved before the keystore was introduced. The search is a generator: once the caller accepts a key and
+    stops iterating (or closes the generator), the searches still running are cancelled and the searches not yet
+    started are dropped.
+
+    Parameters
+    ----------
+    devices : list of UsbDevice, optional
+        The devices to search. Defaults to all the devices returned by `detect_usb_devices`.
+    names : iterable of str, optional
+        The names of the key files to look for, `public_key.pubk` and `encrypted_private_key.pk` by default.
+    max_workers : int, optional
+        The maximum number of devices searched at the same time. Defaults to the number of devices.
+    cancel : threading.Event, optional
+        When set, all the searches stop and no more keys are yielded.
+
+    Yields
+    ------
+    KeyCandidate
+        The found keys, in the order in which they were found.
+    """
+    if devices is None:
+        devices = detect_usb_devices()
+    if not devices:
+        return
+
+    names = tuple(names)
+    key_types = {KEY_TYPES[name] for name in names}
+    stop = threading.Event()
+
+    def search(device):
+        if cancel is not None and cancel.is_set():
+            stop.set()
+        if stop.is_set():
+            return []
+        keystore_keys = describe_keystore(device) if KEY_TYPE_PRIVATE in key_types else []
+        search_names = tuple(name for name in names if not keystore_keys or KEY_TYPES[name] != KEY_TYPE_PRIVATE)
+        if not search_names:
+            return keystore_keys
+        return describe_keys(device, find_keys(device.mountpoint, search_names, cancel=stop), key_types) + keystore_keys
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(devices))
+    pending = set()
+    try:
+        pending = {executor.submit(search, device) for device in devices}
+        while pending:
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set():
+                return
+            for future in done:
+                yield from future.result()
+    finally:
+        stop.set()
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def discover_first_key(name, devices=None):
+    """
+    Searches all the given devices at the same time and returns the first key file found.
+
+    The searches on the other devices are cancelled as soon as the key is found. For `encrypted_private_key.pk` the
+    newest key of the first keystore read is returned, or the key file saved before the keystore was introduced.
+
+    Parameters
+    ----------
+    name : str
+        The name of the key file, `public_key.pubk` or `encrypted_private_key.pk`.
+    devices : list of UsbDevice, optional
+        The devices to search. Defaults to all the devices returned by `detect_usb_devices`.
+
+    Returns
+    -------
+    KeyCandidate or None
+        The first key found, or `None` if none of the devices holds the key.
+    """
+    discovery = discover_keys(devices, (name,))
+    try:
+        return next(discovery, None)
+    finally:
+        discovery.close()
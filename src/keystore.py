@@ -0,0 +1,254 @@
+import datetime
+import json
+import os
+
+from src.find_keys import find_private_key
+from src.atomic_write import write_atomically
+
+KEYSTORE_DIR = "keystore"
+INDEX_NAME = "index.json"
+PRIVATE_KEY_EXTENSION = ".pk"
+MIN_KEY_ID_PREFIX = 8
+
+
+class Keystore:
+    """
+    Store of many encrypted private keys on a single medium.
+
+    The keys are kept in the `keystore` directory of the medium as `<key id>.pk` files, where the key ID is the
+    fingerprint of the public key (the same as the `/KeyID` field of the documents it signs). A compact `index.json`
+    maps every key ID to its file, algorithm, creation time, sequence number and label, so a key is opened directly by
+    its ID without searching the medium, and generating a new key never overwrites the previous ones.
+    """
+
+    def __init__(self, medium_path):
+        """
+        Parameters
+        ----------
+        medium_path : str
+            The path of the medium (e.g. the mount point of the USB device) holding the keystore.
+        """
+        self.directory = os.path.join(medium_path, KEYSTORE_DIR)
+        self.index_path = os.path.join(self.directory, INDEX_NAME)
+
+    def entries(self):
+        """
+        Returns the index entries of all the keys in the keystore.
+
+        Returns
+        -------
+        dict
+            The entries (file, algorithm, creation date and label) keyed by key ID. Empty if the medium has no
+            keystore.
+        """
+        try:
+            with open(self.index_path, encoding="utf-8") as index_file:
+                return json.load(index_file)
+        except FileNotFoundError:
+            return {}
+
+    def add(self, key_id, encrypted_key, algorithm, label=None):
+        """
+        Saves an encrypted private key in the keystore.
+
+        Parameters
+        ----------
+        key_id : str
+            The hex encoded fingerprint of the public key.
+        encrypted_key : bytes
+            The encrypted private key.
+        algorithm : str
+            The key algorithm, one of `src.key_algorithms.ALGORITHMS`.
+        label : str, optional
+            A description of the key shown when a key is chosen.
+
+        Returns
+        -------
+        str
+            The path to the saved key file.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = key_id + PRIVATE_KEY_EXTENSION
+        key_path = os.path.join(self.directory, file_name)
+        write_atomically(key_path, encrypted_key, mode=0o600)
+
+        index = self.entries()
+        index.pop(key_id, None)
+        index[key_id] = {
+            "file": file_name,
+            "algorithm": algorithm,
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="microseconds"),
+            "sequence": max((entry.get("sequence", 0) for entry in index.values()), default=0) + 1,
+            "label": label,
+        }
+        write_atomically(self.index_path, json.dumps(index, indent=2, sort_keys=True).encode("utf-8"))
+        return key_path
+
+    def resolve(self, key_id, entries=None):
+        """
+        Expands a key ID or its unique prefix of at least `MIN_KEY_ID_PREFIX` characters to the full key ID.
+
+        Parameters
+        ----------
+        key_id : str
+            The key ID or its prefix.
+        entries : dict, optional
+            The index entries, if already read with `entries`.
+
+        Returns
+        -------
+        str or None
+            The full key ID, or `None` if no key matches.
+
+        Raises
+        ------
+        ValueError
+            If the prefix is too short or matches more than one key.
+        """
+        key_id = key_id.lower()
+        entries = self.entries() if entries is None else entries
+        if key_id in entries:
+            return key_id
+        if len(key_id) < MIN_KEY_ID_PREFIX:
+            raise ValueError(f"Identyfikator klucza musi mieć co najmniej {MIN_KEY_ID_PREFIX} znaków.")
+
+        matches = [candidate for candidate in entries if candidate.startswith(key_id)]
+        if len(matches) > 1:
+            raise ValueError(f"Identyfikator klucza {key_id} jest niejednoznaczny.")
+        return matches[0] if matches else None
+
+    def path(self, key_id):
+        """
+        Returns the path to the file of a key.
+
+        Parameters
+        ----------
+        key_id : str
+            The key ID or its unique prefix.
+
+        Returns
+        -------
+        str or None
+            The path to the encrypted private key, or `None` if the key is not in the keystore.
+        """
+        entries = self.entries()
+        key_id = self.resolve(key_id, entries)
+        if key_id is None:
+            return None
+        return os.path.join(self.directory, entries[key_id]["file"])
+
+    def newest(self):
+        """
+        Returns the ID of the most recently created key, used when no key is chosen explicitly.
+
+        See `newest_first` for the order of the keys.
+
+        Returns
+        -------
+        str or None
+            The key ID, or `None` if the keystore is empty.
+        """
+        ordered = newest_first(self.entries())
+        return ordered[0] if ordered else None
+
+    def remove(self, key_id):
+        """
+        Removes a key from the keystore.
+
+        Parameters
+        ----------
+        key_id : str
+            The key ID or its unique prefix.
+
+        Returns
+        -------
+        bool
+            `True` if the key was in the keystore.
+        """
+        entries = self.entries()
+        key_id = self.resolve(key_id, entries)
+        if key_id is None:
+            return False
+        entry = entries.pop(key_id)
+        write_atomically(self.index_path, json.dumps(entries, indent=2, sort_keys=True).encode("utf-8"))
+        try:
+            os.remove(os.path.join(self.directory, entry["file"]))
+        except OSError:
+            pass
+        return True
+
+
+def newest_first(entries):
+    """
+    Orders the keys of a keystore from the most recently created one, the order in which keys are offered to sign.
+
+    Keys are ordered by the sequence number given when they are added, so keys created within the same second keep
+    their order. Keys added before sequence numbers were introduced come last, ordered by creation time; remaining
+    ties are broken by the key ID.
+
+    Parameters
+    ----------
+    entries : dict
+        The index entries keyed by key ID, as returned by `Keystore.entries`.
+
+    Returns
+    -------
+    list of str
+        The key IDs, newest first.
+    """
+    return sorted(entries, key=lambda key_id: (entries[key_id].get("sequence", 0), entries[key_id]["created"], key_id),
+                  reverse=True)
+
+
+def format_key_entry(key_id, entry):
+    """
+    Formats a keystore entry for display, e.g. "Praca (Ed25519, 2024-05-01, 3fa1c2d4e5b6a7f8)".
+
+    Parameters
+    ----------
+    key_id : str
+        The key ID.
+    entry : dict
+        The index entry of the key.
+
+    Returns
+    -------
+    str
+        The label of the key (or "Bez etykiety") followed by its algorithm, creation date and shortened ID.
+    """
+    return f"{entry.get('label') or 'Bez etykiety'} ({entry['algorithm']}, {entry['created'][:10]}, {key_id[:16]})"
+
+
+def locate_private_key(medium_path, key_id=None):
+    """
+    Returns the path to the encrypted private key to sign with.
+
+    A key chosen by its ID is opened directly from the keystore. Without an ID the most recently created key of the
+    keystore is used, and if the medium has no keystore, it is searched for a single `encrypted_private_key.pk` file
+    saved before the keystore was introduced.
+
+    Parameters
+    ----------
+    medium_path : str
+        The path of the medium holding the keys.
+    key_id : str, optional
+        The key ID or its unique prefix.
+
+    Returns
+    -------
+    str or None
+        The path to the encrypted private key, or `None` if no key was found.
+
+    Raises
+    ------
+    ValueError
+        If the key ID prefix is too short or ambiguous.
+    """
+    keystore = Keystore(medium_path)
+    if key_id is not None:
+        return keystore.path(key_id)
+
+    newest = keystore.newest()
+    if newest is not None:
+        return keystore.path(newest)
+    return find_private_key(medium_path)
@@ -0,0 +1,148 @@
+import platform
+
+from PyQt5.QtCore import QObject, QSocketNotifier, QThreadPool, QTimer, pyqtSignal
+
+from src.detecting_usb import MOUNTINFO_PATH, detect_usb_devices
+from src.workers import Worker
+
+POLL_INTERVAL = 3000
+
+
+class MountWatcher(QObject):
+    """
+    Keeps the list of connected USB devices up to date without the user refreshing it.
+
+    On Linux the kernel marks `/proc/self/mountinfo` with an exceptional condition (POLLPRI) whenever a file system is
+    mounted or unmounted, so the watcher waits for it with a `QSocketNotifier` and uses no CPU while nothing changes.
+    On other systems, or if the file cannot be opened, the devices are polled with a `QTimer` instead.
+
+    Every rescan runs `detect_usb_devices` in a `Worker` on the thread pool, never on the GUI thread. Rescans requested
+    while one is running are merged into a single follow-up rescan. The `changed` signal is emitted only when the set
+    of devices differs from the previous scan (and once after the first scan), with the devices which were added and
+    the devices which were removed, so the lists in the user interface can be updated incrementally.
+
+    - `changed(object, object)`: the lists of added and removed `UsbDevice` records. A device whose record changed
+      (e.g. its label) is reported as removed and added again.
+    - `error(object)`: the exception raised by a rescan.
+    """
+    changed = pyqtSignal(object, object)
+    error = pyqtSignal(object)
+
+    def __init__(self, parent=None, poll_interval=POLL_INTERVAL):
+        """
+        Parameters
+        ----------
+        parent : QObject, optional
+            The parent object of the watcher, usually the application window.
+        poll_interval : int, optional
+            The polling interval in milliseconds, used only when the mount table cannot be watched.
+        """
+        super().__init__(parent)
+        self.poll_interval = poll_interval
+        self.devices = {}
+        self._mountinfo = None
+        self._notifier = None
+        self._timer = None
+        self._worker = None
+        self._pending = False
+        self._scanned = False
+
+    def start(self):
+        """
+        Starts watching the mounted file systems and runs the first scan.
+
+        Returns
+        -------
+        None.
+        """
+        if platform.system() == "Linux":
+            try:
+                self._mountinfo = open(MOUNTINFO_PATH, "rb", buffering=0)
+            except OSError:
+                self._mountinfo = None
+
+        if self._mountinfo is not None:
+            self._notifier = QSocketNotifier(self._mountinfo.fileno(), QSocketNotifier.Exception, self)
+            self._notifier.activated.connect(lambda fd: self.rescan())
+        else:
+            self._timer = QTimer(self)
+            self._timer.timeout.connect(self.rescan)
+            self._timer.start(self.poll_interval)
+
+        self.rescan()
+
+    def stop(self):
+        """
+        Stops watching the mounted file systems and cancels the running scan.
+
+        Returns
+        -------
+        None.
+        """
+        if self._notifier is not None:
+            self._notifier.setEnabled(False)
+            self._notifier = None
+        if self._mountinfo is not None:
+            self._mountinfo.close()
+            self._mountinfo = None
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+        if self._worker is not None:
+            self._worker.cancel()
+        self._pending = False
+
+    def rescan(self):
+        """
+        Detects the connected USB devices again in a background worker.
+
+        If a scan is already running, another one is run once it finishes, so no change is missed.
+
+        Returns
+        -------
+        None.
+        """
+        if self._worker is not None:
+            self._pending = True
+            return
+
+        self._worker = Worker(lambda progress: detect_usb_devices())
+        self._worker.signals.result.connect(self._update_devices)
+        self._worker.signals.error.connect(self.error.emit)
+        self._worker.signals.finished.connect(self._scan_finished)
+        QThreadPool.globalInstance().start(self._worker)
+
+    def _scan_finished(self):
+        """
+        Releases the finished worker and runs the rescan requested in the meantime, if any.
+
+        Returns
+        -------
+        None.
+        """
+        self._worker = None
+        if self._pending:
+            self._pending = False
+            self.rescan()
+
+    def _update_devices(self, devices):
+        """
+        Compares the detected devices with the previous scan and emits `changed` if they differ.
+
+        Parameters
+        ----------
+        devices : list of UsbDevice
+            The devices detected by the scan.
+
+        Returns
+        -------
+        None.
+        """
+        current = {device.mountpoint: device for device in devices}
+        added = [device for mountpoint, device in current.items() if self.devices.get(mountpoint) != device]
+        removed = [device for mountpoint, device in self.devices.items() if current.get(mountpoint) != device]
+        self.devices = current
+
+        if added or removed or not self._scanned:
+            self._scanned = True
+            self.changed.emit(added, removed)
@@ -0,0 +1,234 @@
+import hashlib
+import math
+import multiprocessing
+import os
+import secrets
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from Crypto.Math.Numbers import Integer
+from Crypto.Math.Primality import COMPOSITE, test_probable_prime
+from Crypto.Util.number import sieve_base
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from src.key_algorithms import PUBLIC_EXPONENT, RSA_KEY_SIZE, sign_digest, verify_digest
+
+SIEVE_PRIMES = 2000
+MIN_PRIME_DISTANCE_BITS = 100
+
+_worker_stop = None
+_worker_primorial = None
+
+
+def _init_worker(stop):
+    """
+    Prepares a worker process of the prime search pool.
+
+    Parameters
+    ----------
+    stop : multiprocessing.Event
+        Set by the main process when enough primes have been found.
+
+    Returns
+    -------
+    None.
+    """
+    global _worker_stop, _worker_primorial
+    _worker_stop = stop
+    _worker_primorial = math.prod(sieve_base[1:SIEVE_PRIMES])
+
+
+def _search_prime(bits, public_exponent):
+    """
+    Searches for a random probable prime in a worker process until one is found or the search is stopped.
+
+    Every candidate has its two highest bits set, so the product of two such primes has exactly `2 * bits` bits.
+    Candidates with a small factor are rejected with a single `gcd` against the product of the first small primes,
+    the rest with a base 2 Fermat test. The survivors are confirmed with the Miller-Rabin and Lucas tests of FIPS
+    186-4 (`Crypto.Math.Primality.test_probable_prime`), with an error probability below 2^-100.
+
+    Parameters
+    ----------
+    bits : int
+        The size of the prime in bits.
+    public_exponent : int
+        The RSA public exponent, which must be coprime with `p - 1`.
+
+    Returns
+    -------
+    int or None
+        The probable prime, or `None` if the search was stopped.
+    """
+    top_bits = 3 << (bits - 2)
+    while not _worker_stop.is_set():
+        candidate = secrets.randbits(bits) | top_bits | 1
+        if math.gcd(candidate, _worker_primorial) != 1 or math.gcd(candidate - 1, public_exponent) != 1:
+            continue
+        modulus = Integer(candidate)
+        witness = Integer(2)
+        witness.inplace_pow(modulus - 1, modulus)
+        if witness != 1:
+            continue
+        if test_probable_prime(modulus) != COMPOSITE:
+            return candidate
+    return None
+
+
+def assemble_private_key(p, q, public_exponent=PUBLIC_EXPONENT):
+    """
+    Builds an RSA private key from its two primes.
+
+    The private exponent is the inverse of the public exponent modulo `lcm(p - 1, q - 1)`, as in FIPS 186-4, and
+    the CRT coefficients are computed with the helpers of `cryptography`. The key is loaded through
+    `RSAPrivateNumbers.private_key` and validated with a pairwise consistency test: a test digest is signed and the
+    signature verified with the public key. The full check of OpenSSL is skipped where `cryptography` allows it, as
+    it takes about half a second for a 4096-bit key, mostly repeating the primality tests the primes already passed.
+
+    Parameters
+    ----------
+    p, q : int
+        The two distinct primes.
+    public_exponent : int, optional
+        The public exponent, 65537 by default.
+
+    Returns
+    -------
+    RSAPrivateKey
+        The private key.
+
+    Raises
+    ------
+    ValueError
+        If the components do not form a valid RSA key.
+    """
+    if p < q:
+        p, q = q, p
+    carmichael = (p - 1) * (q - 1) // math.gcd(p - 1, q - 1)
+    private_exponent = pow(public_exponent, -1, carmichael)
+    public_numbers = rsa.RSAPublicNumbers(public_exponent, p * q)
+    private_numbers = rsa.RSAPrivateNumbers(
+        p=p,
+        q=q,
+        d=private_exponent,
+        dmp1=rsa.rsa_crt_dmp1(private_exponent, p),
+        dmq1=rsa.rsa_crt_dmq1(private_exponent, q),
+        iqmp=rsa.rsa_crt_iqmp(p, q),
+        public_numbers=public_numbers
+    )
+    try:
+        private_key = private_numbers.private_key(unsafe_skip_rsa_key_validation=True)
+    except TypeError:
+        private_key = private_numbers.private_key()
+
+    digest = hashlib.sha256(b"pairwise consistency test").digest()
+    try:
+        verify_digest(private_key.public_key(), sign_digest(private_key, digest), digest)
+    except InvalidSignature:
+        raise ValueError("Wygenerowany klucz RSA nie przeszedł testu spójności.")
+    return private_key
+
+
+class PrimeSearchPool:
+    """
+    Pool of processes generating RSA keys by searching for their primes in parallel.
+
+    The time of finding a large random prime varies a lot, so generating a 4096-bit key on a single core takes from a
+    fraction of a second to many seconds. Here every worker process searches for a prime on its own and the first two
+    primes found form the key; the remaining searches are stopped. With many cores the slow searches are simply
+    outrun by the fast ones, which shortens both the typical and, even more, the worst generation time.
+
+    The pool can generate many keys; the worker processes are started once, when the pool is created.
+    """
+
+    def __init__(self, workers=None):
+        """
+        Parameters
+        ----------
+        workers : int, optional
+            The number of worker processes. Defaults to the number of CPUs.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self._stop = multiprocessing.Event()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(self._stop,))
+
+    def generate_private_key(self, key_size=RSA_KEY_SIZE, public_exponent=PUBLIC_EXPONENT):
+        """
+        Generates an RSA private key.
+
+        The two primes must differ in more than their lowest bits (by at least 2^(bits - 100), as required by FIPS
+        186-4), otherwise the second prime is dropped and the search goes on.
+
+        Parameters
+        ----------
+        key_size : int, optional
+            The size of the modulus in bits, 4096 by default.
+        public_exponent : int, optional
+            The public exponent, 65537 by default.
+
+        Returns
+        -------
+        RSAPrivateKey
+            The generated private key.
+        """
+        bits = key_size // 2
+        primes = []
+        self._stop.clear()
+        pending = {self._executor.submit(_search_prime, bits, public_exponent) for _ in range(self.workers)}
+        try:
+            while len(primes) < 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    prime = future.result()
+                    if prime is not None and primes and \
+                            abs(primes[0] - prime).bit_length() <= bits - MIN_PRIME_DISTANCE_BITS:
+                        prime = None
+                    if prime is not None and len(primes) < 2:
+                        primes.append(prime)
+                    if len(primes) < 2:
+                        pending.add(self._executor.submit(_search_prime, bits, public_exponent))
+        finally:
+            self._stop.set()
+            wait(pending)
+
+        return assemble_private_key(primes[0], primes[1], public_exponent)
+
+    def close(self):
+        """
+        Stops the worker processes. The searches still running see the stop flag and return; `generate_private_key`
+        leaves no queued searches behind.
+
+        Returns
+        -------
+        None.
+        """
+        self._stop.set()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def generate_rsa_private_key(key_size=RSA_KEY_SIZE, public_exponent=PUBLIC_EXPONENT, workers=None):
+    """
+    Generates a single RSA private key with a temporary `PrimeSearchPool`.
+
+    Parameters
+    ----------
+    key_size : int, optional
+        The size of the modulus in bits, 4096 by default.
+    public_exponent : int, optional
+        The public exponent, 65537 by default.
+    workers : int, optional
+        The number of worker processes. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    RSAPrivateKey
+        The generated private key.
+    """
+    with PrimeSearchPool(workers) as pool:
+        return pool.generate_private_key(key_size, public_exponent)
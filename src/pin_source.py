@@ -0,0 +1,81 @@
+import getpass
+import os
+
+PIN_ENVIRONMENT_VARIABLE = "QES_PIN"
+
+
+def read_pin(pin_source):
+    """
+    Reads a PIN from the given source, so PINs never have to appear on a command line or in a manifest.
+
+    Parameters
+    ----------
+    pin_source : str
+        `env:NAME` reads the PIN from the environment variable `NAME`, `fd:N` from the first line of the already open
+        file descriptor `N` (e.g. a pipe set up by the calling job) and `file:PATH` from the first line of the file.
+
+    Returns
+    -------
+    str
+        The PIN.
+
+    Raises
+    ------
+    ValueError
+        If the source is not supported, is empty or the PIN is not numeric.
+    OSError
+        If the file or file descriptor cannot be read.
+    """
+    kind, _, location = pin_source.partition(":")
+    if kind == "env":
+        pin = os.environ.get(location, "")
+    elif kind in ("fd", "file"):
+        if kind == "fd" and not location.isdigit():
+            raise ValueError(f"Niepoprawny deskryptor pliku: {location}")
+        target = int(location) if kind == "fd" else location
+        with open(target, encoding="utf-8", closefd=kind == "file") as pin_file:
+            pin = pin_file.readline().strip()
+    else:
+        raise ValueError(f"Nieobsługiwane źródło PIN-u: {pin_source} (dozwolone env:NAZWA, fd:N i file:ŚCIEŻKA)")
+
+    if not pin:
+        raise ValueError(f"Nie wprowadzono PIN-u ({pin_source}).")
+    if not pin.isdigit():
+        raise ValueError(f"PIN musi składać się tylko z cyfr ({pin_source}).")
+    return pin
+
+
+def resolve_pin(pin_source):
+    """
+    Returns the PIN for a command line tool.
+
+    Parameters
+    ----------
+    pin_source : str or None
+        The `--pin` option: `env:NAME`, `fd:N` or `file:PATH`, see `read_pin`. Without it the PIN is taken from the
+        `QES_PIN` environment variable and, if that is not set either, asked for on the terminal.
+
+    Returns
+    -------
+    str
+        The PIN.
+
+    Raises
+    ------
+    ValueError
+        If the PIN cannot be read or is not numeric.
+    OSError
+        If the PIN file or file descriptor cannot be read.
+    """
+    if pin_source is None and PIN_ENVIRONMENT_VARIABLE in os.environ:
+        pin_source = f"env:{PIN_ENVIRONMENT_VARIABLE}"
+    if pin_source is not None:
+        return read_pin(pin_source)
+
+    try:
+        pin = getpass.getpass("PIN: ")
+    except EOFError:
+        pin = ""
+    if not pin.isdigit():
+        raise ValueError("PIN musi składać się tylko z cyfr." if pin else "Nie wprowadzono PIN-u.")
+    return pin
@@ -0,0 +1,258 @@
+import hashlib
+import mmap
+import os
+import stat
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from src.document_signing import CHUNK_SIZE, patch_signature, sign_trailer
+from src.key_algorithms import key_algorithm, public_key_fingerprint
+from src.verify_signature import STATUS_NO_KEY_ID, STATUS_UNKNOWN_KEY, STATUS_UNSIGNED, check_signature_in_buffer, \
+    locate_signature_in_buffer, signed_regions
+
+STATUS_SIGNED = "signed"
+
+SignatureResult = namedtuple("SignatureResult", ["status", "key_id", "algorithm", "signed_range", "digest", "timings",
+                                                 "document"])
+
+
+def _as_buffer(document):
+    """
+    Returns a flat byte view of a bytes-like document.
+
+    Parameters
+    ----------
+    document : object
+        The document passed to `sign_bytes` or `verify_bytes`.
+
+    Returns
+    -------
+    memoryview or None
+        The view of the document, or `None` if the document is not bytes-like.
+
+    Raises
+    ------
+    TypeError
+        If the document is a string.
+    """
+    if isinstance(document, str):
+        raise TypeError("Dokument musi być podany jako bajty, a nie tekst.")
+    try:
+        view = memoryview(document)
+    except TypeError:
+        return None
+    with view:
+        return view.cast("B")
+
+
+def _iter_chunks(document, chunk_size):
+    """
+    Reads a document given as a file object or an iterable in chunks.
+
+    Parameters
+    ----------
+    document : file object or iterable of bytes
+        The document opened in binary mode, or its consecutive parts.
+    chunk_size : int
+        The number of bytes read from a file object at a time.
+
+    Returns
+    -------
+    iterator of bytes-like
+        The consecutive parts of the document. A part read with `readinto` is only valid until the next one is read.
+    """
+    if hasattr(document, "readinto"):
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        while True:
+            read = document.readinto(buffer)
+            if not read:
+                return
+            yield view[:read]
+    elif hasattr(document, "read"):
+        while True:
+            chunk = document.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from document
+
+
+@contextmanager
+def _open_buffer(document, chunk_size):
+    """
+    Gives random access to a document for verification.
+
+    Bytes-like documents are used in place and regular files are memory-mapped. Other file objects and iterables are
+    read into memory.
+
+    Parameters
+    ----------
+    document : bytes-like, file object or iterable of bytes
+        The document passed to `verify_bytes`.
+    chunk_size : int
+        The number of bytes read from a stream at a time.
+
+    Returns
+    -------
+    context manager
+        Yields the content of the document as a bytes-like object, released when the context exits.
+    """
+    view = _as_buffer(document)
+    if view is not None:
+        with view:
+            yield view
+        return
+
+    if hasattr(document, "fileno"):
+        try:
+            file_stat = os.fstat(document.fileno())
+        except (OSError, ValueError):
+            file_stat = None
+        if file_stat is not None and stat.S_ISREG(file_stat.st_mode) and file_stat.st_size > 0:
+            with mmap.mmap(document.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+            return
+
+    yield b"".join(bytes(chunk) for chunk in _iter_chunks(document, chunk_size))
+
+
+def sign_bytes(document, private_key, output=None, chunk_size=CHUNK_SIZE):
+    """
+    Signs a document held in memory or read from a stream, without touching the filesystem.
+
+    The document is hashed in a single pass. Bytes-like documents (`bytes`, `bytearray`, `memoryview`, `mmap`) are
+    hashed in place, file objects and iterables of byte chunks (e.g. the body of a request) as they are read. The
+    signed document is written to `output` if it is given, otherwise it is returned in the result.
+
+    Parameters
+    ----------
+    document : bytes-like, file object or iterable of bytes
+        The PDF document. File objects must be opened in binary mode.
+    private_key : private key
+        The private key used to sign the document: RSA, ECDSA P-256 or Ed25519, e.g. decrypted with
+        `src.key_container.decrypt_private_key`.
+    output : file object, optional
+        The stream where the signed document is written, opened in binary mode.
+    chunk_size : int, optional
+        The number of bytes read from a file object at a time.
+
+    Returns
+    -------
+    SignatureResult
+        `STATUS_SIGNED`, the key ID and algorithm of the signature, the signed byte ranges as `(start, end)` offsets in
+        the signed document, the hex encoded SHA-256 digest of the signed data, the time of hashing (`hash`), signing
+        (`sign`) and the whole call (`total`) in seconds and the signed document, or `None` if it was written to
+        `output`.
+
+    Raises
+    ------
+    TypeError
+        If the document is given as text.
+    ValueError
+        If the private key is not supported.
+    """
+    start = time.perf_counter()
+    algorithm = key_algorithm(private_key)
+    key_id = public_key_fingerprint(private_key.public_key())
+    digest = hashlib.sha256()
+    parts = []
+    data_length = 0
+
+    view = _as_buffer(document)
+    try:
+        for chunk in [view] if view is not None else _iter_chunks(document, chunk_size):
+            digest.update(chunk)
+            data_length += len(chunk)
+            if output is not None:
+                output.write(chunk)
+            else:
+                parts.append(chunk if view is not None else bytes(chunk))
+        hashed = time.perf_counter()
+
+        signature, trailer, byte_range = sign_trailer(digest, data_length, private_key)
+        signed = time.perf_counter()
+
+        patch_signature(trailer, byte_range, signature, offset=data_length)
+        if output is not None:
+            output.write(trailer)
+            signed_document = None
+        else:
+            parts.append(trailer)
+            signed_document = b"".join(parts)
+    finally:
+        if view is not None:
+            view.release()
+
+    timings = {"hash": hashed - start, "sign": signed - hashed, "total": time.perf_counter() - start}
+    signed_range = [(0, byte_range[1]), (byte_range[2], byte_range[2] + byte_range[3])]
+    return SignatureResult(STATUS_SIGNED, key_id, algorithm, signed_range, digest.hexdigest(), timings,
+                           signed_document)
+
+
+def verify_bytes(document, public_key=None, trust_store=None, chunk_size=CHUNK_SIZE):
+    """
+    Verifies the signature of a document held in memory or read from a stream, without touching the filesystem.
+
+    Exactly one of `public_key` and `trust_store` must be given. With a trust store the document is verified with the
+    key named by the `/KeyID` of its signature.
+
+    Parameters
+    ----------
+    document : bytes-like, file object or iterable of bytes
+        The signed PDF document. Bytes-like documents are verified in place and regular files are memory-mapped;
+        other streams and iterables are read into memory first, as the signature sits at the end of the document.
+    public_key : public key, optional
+        The public key used to verify the signature: RSA, ECDSA P-256 or Ed25519.
+    trust_store : TrustStore, optional
+        The store of trusted public keys, see `src.trust_store`.
+    chunk_size : int, optional
+        The number of bytes read from a stream at a time.
+
+    Returns
+    -------
+    SignatureResult
+        One of the `src.verify_signature.STATUS_*` codes, the key ID and algorithm declared by the signature, the
+        signed regions as `(start, end)` offsets, the hex encoded SHA-256 digest of the signed data, the time of
+        reading (`read`), locating the signature (`locate`), hashing (`hash`), checking the signature (`verify`) and
+        the whole call (`total`) in seconds, and `None` as the document. Fields that were not reached are `None`.
+
+    Raises
+    ------
+    TypeError
+        If the document is given as text.
+    ValueError
+        If neither or both of `public_key` and `trust_store` are given.
+    """
+    if (public_key is None) == (trust_store is None):
+        raise ValueError("Należy podać klucz publiczny albo magazyn zaufanych kluczy.")
+
+    start = time.perf_counter()
+    timings = {}
+    key_id = algorithm = regions = digest = None
+
+    with _open_buffer(document, chunk_size) as buffer:
+        opened = time.perf_counter()
+        location = locate_signature_in_buffer(buffer)
+        located = time.perf_counter()
+        timings.update(read=opened - start, locate=located - opened)
+
+        if location is None:
+            status = STATUS_UNSIGNED
+        else:
+            key_id, algorithm = location.key_id, location.algorithm
+            if trust_store is not None:
+                public_key = trust_store.get(key_id) if key_id is not None else None
+            if key_id is None and trust_store is not None:
+                status = STATUS_NO_KEY_ID
+            elif public_key is None:
+                status = STATUS_UNKNOWN_KEY
+            else:
+                status, digest = check_signature_in_buffer(buffer, location, public_key, timings=timings)
+                if digest is not None:
+                    regions = signed_regions(buffer, location)
+
+    timings["total"] = time.perf_counter() - start
+    return SignatureResult(status, key_id, algorithm, regions, digest, timings, None)
@@ -0,0 +1,343 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import string
+import sys
+import threading
+
+from cryptography.hazmat.primitives import serialization
+
+from src.atomic_write import write_atomically
+from src.key_algorithms import key_algorithm, public_key_fingerprint
+
+INDEX_NAME = "index.json"
+KEY_EXTENSION = ".pubk"
+
+
+def default_trust_store_path():
+    """
+    Returns the path of the user's trust store directory.
+
+    Returns
+    -------
+    str
+        The path to the `trust_store` directory in `$XDG_DATA_HOME` (or `~/.local/share`).
+    """
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(data_home, "qualified-electronic-signature", "trust_store")
+
+
+class TrustStore:
+    """
+    Directory of trusted public keys indexed by their fingerprints.
+
+    Every key is stored as `<fingerprint>.pubk` in PEM format, and `index.json` maps the fingerprints to the key files
+    together with their algorithm, label and the time they were added. Signed documents carry the fingerprint of the
+    signing key in the `/KeyID` field, so the public key needed to verify a document is found with a single dictionary
+    lookup, without searching any directory, however many signer keys the store holds.
+
+    Every lookup checks with a single `stat()` whether the index file has changed and reads it again if it has, so
+    keys added or removed by another process are picked up at once. Keys are parsed on first use and kept in memory
+    only while the index they were found in is current, so a removed key is never trusted again.
+    """
+
+    def __init__(self, directory):
+        """
+        Parameters
+        ----------
+        directory : str
+            The trust store directory. It is created when the first key is added.
+        """
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self._index = None
+        self._index_stat = None
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint):
+        """
+        Returns the trusted public key with the given fingerprint.
+
+        Parameters
+        ----------
+        fingerprint : str
+            The hex encoded fingerprint of the key, e.g. from the `/KeyID` field of a signed document.
+
+        Returns
+        -------
+        public key or None
+            The parsed public key, or `None` if the key is not trusted.
+
+        Raises
+        ------
+        ValueError
+            If the index entry of the key or the key file does not match the fingerprint.
+        """
+        fingerprint = fingerprint.lower()
+        with self._lock:
+            if self._index_changed():
+                self._index = None
+                self._keys.clear()
+            entry = self._load_index().get(fingerprint)
+            if entry is None:
+                return None
+
+            public_key = self._keys.get(fingerprint)
+            if public_key is not None:
+                return public_key
+
+            with open(os.path.join(self.directory, key_file_name(fingerprint, entry)), "rb") as key_file:
+                public_key = serialization.load_pem_public_key(key_file.read())
+            if public_key_fingerprint(public_key) != fingerprint:
+                raise ValueError(f"Klucz {entry['file']} w magazynie zaufanych kluczy nie pasuje do indeksu.")
+            self._keys[fingerprint] = public_key
+            return public_key
+
+    def add(self, public_key_path, label=None):
+        """
+        Adds a public key to the trust store.
+
+        Parameters
+        ----------
+        public_key_path : str
+            The path to the PEM encoded public key.
+        label : str, optional
+            A description of the key owner shown by `entries`.
+
+        Returns
+        -------
+        str
+            The fingerprint of the added key.
+
+        Raises
+        ------
+        ValueError
+            If the file is not a supported public key.
+        """
+        with open(public_key_path, "rb") as key_file:
+            public_key_pem = key_file.read()
+        public_key = serialization.load_pem_public_key(public_key_pem)
+        fingerprint = public_key_fingerprint(public_key)
+        file_name = fingerprint + KEY_EXTENSION
+
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            write_atomically(os.path.join(self.directory, file_name), public_key_pem)
+
+            index = dict(self._load_index())
+            index[fingerprint] = {
+                "file": file_name,
+                "algorithm": key_algorithm(public_key),
+                "label": label,
+                "added": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            }
+            self._save_index(index)
+            self._keys[fingerprint] = public_key
+        return fingerprint
+
+    def remove(self, fingerprint):
+        """
+        Removes a key from the trust store.
+
+        Parameters
+        ----------
+        fingerprint : str
+            The hex encoded fingerprint of the key.
+
+        Returns
+        -------
+        bool
+            `True` if the key was in the trust store.
+        """
+        fingerprint = fingerprint.lower()
+        with self._lock:
+            index = dict(self._load_index())
+            entry = index.pop(fingerprint, None)
+            if entry is None:
+                return False
+            self._save_index(index)
+            self._keys.pop(fingerprint, None)
+            try:
+                os.remove(os.path.join(self.directory, key_file_name(fingerprint, entry)))
+            except (OSError, ValueError):
+                pass
+            return True
+
+    def entries(self):
+        """
+        Returns the index entries of all the trusted keys.
+
+        Returns
+        -------
+        dict
+            The entries (file, algorithm, label and time added) keyed by fingerprint.
+        """
+        with self._lock:
+            return dict(self._load_index())
+
+    def version(self):
+        """
+        Returns an identifier of the current content of the trust store.
+
+        The identifier changes whenever a key is added or removed, so it can stand in for the key fingerprint when
+        results of verifications against the whole trust store are cached.
+
+        Returns
+        -------
+        str
+            The SHA-256 digest of the index file, or of an empty index if the trust store does not exist yet.
+        """
+        try:
+            with open(self.index_path, "rb") as index_file:
+                content = index_file.read()
+        except FileNotFoundError:
+            content = b"{}"
+        return "store:" + hashlib.sha256(content).hexdigest()
+
+    def __contains__(self, fingerprint):
+        return self.get(fingerprint) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load_index())
+
+    def _load_index(self):
+        """
+        Reads the index file unless it is already loaded. A missing index means an empty trust store.
+
+        Returns
+        -------
+        dict
+            The index entries keyed by fingerprint.
+        """
+        if self._index is None:
+            self._keys.clear()
+            try:
+                self._index_stat = self._stat_index()
+                with open(self.index_path, encoding="utf-8") as index_file:
+                    self._index = json.load(index_file)
+            except FileNotFoundError:
+                self._index = {}
+        return self._index
+
+    def _save_index(self, index):
+        """
+        Atomically replaces the index file.
+
+        Parameters
+        ----------
+        index : dict
+            The index entries keyed by fingerprint.
+
+        Returns
+        -------
+        None.
+        """
+        write_atomically(self.index_path, json.dumps(index, indent=2, sort_keys=True).encode("utf-8"))
+        self._index = index
+        self._index_stat = self._stat_index()
+
+    def _stat_index(self):
+        """
+        Returns the modification time, size and inode of the index file, or `None` if it does not exist.
+
+        Returns
+        -------
+        tuple or None
+        """
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _index_changed(self):
+        """
+        Checks if the index file has been modified since it was read.
+
+        Returns
+        -------
+        bool
+        """
+        return self._stat_index() != self._index_stat
+
+
+def key_file_name(fingerprint, entry):
+    """
+    Returns the name of the key file of an index entry, checking that it stays inside the trust store.
+
+    Parameters
+    ----------
+    fingerprint : str
+        The lowercase hex encoded fingerprint of the key.
+    entry : dict
+        The index entry of the key.
+
+    Returns
+    -------
+    str
+        The name of the key file, always `<fingerprint>.pubk`.
+
+    Raises
+    ------
+    ValueError
+        If the fingerprint is not hex encoded or the entry names another file, e.g. a path outside the trust store.
+    """
+    expected = fingerprint + KEY_EXTENSION
+    if not fingerprint or any(char not in string.hexdigits for char in fingerprint) or \
+            not isinstance(entry, dict) or entry.get("file") != expected:
+        raise ValueError(f"Niepoprawny wpis {fingerprint} w indeksie magazynu zaufanych kluczy.")
+    return expected
+
+
+def main(argv=None):
+    """
+    Entry point of the trust store management command.
+
+    Usage: `python -m src.trust_store [--store DIR] add KEY [--label TEXT]`, `... list` or `... remove FINGERPRINT`
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments. Defaults to `sys.argv[1:]`.
+
+    Returns
+    -------
+    int
+        The exit code: 0 on success, 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(description="Zarządzanie magazynem zaufanych kluczy publicznych.")
+    parser.add_argument("--store", default=default_trust_store_path(), help="Katalog magazynu zaufanych kluczy.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add_parser = commands.add_parser("add", help="Dodaje klucz publiczny do magazynu.")
+    add_parser.add_argument("key", help="Ścieżka do klucza publicznego.")
+    add_parser.add_argument("--label", help="Opis właściciela klucza.")
+    commands.add_parser("list", help="Wyświetla zaufane klucze.")
+    remove_parser = commands.add_parser("remove", help="Usuwa klucz z magazynu.")
+    remove_parser.add_argument("fingerprint", help="Odcisk klucza.")
+    args = parser.parse_args(argv)
+
+    trust_store = TrustStore(args.store)
+
+    if args.command == "add":
+        try:
+            fingerprint = trust_store.add(args.key, args.label)
+        except (OSError, ValueError) as e:
+            print(f"Nie można dodać klucza: {e}", file=sys.stderr)
+            return 1
+        print(fingerprint)
+    elif args.command == "list":
+        for fingerprint, entry in sorted(trust_store.entries().items()):
+            print(f"{fingerprint}  {entry['algorithm']:<10}  {entry['added']}  {entry['label'] or ''}")
+    elif not trust_store.remove(args.fingerprint):
+        print(f"Nie znaleziono klucza {args.fingerprint}.", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import time
+
+COMMIT_INTERVAL = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    path TEXT PRIMARY KEY,
+    dev INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    verified_at REAL NOT NULL,
+    signer TEXT
+)
+"""
+
+
+class VerificationIndex:
+    """
+    Persistent on-disk store of verification results, kept in an SQLite database.
+
+    Every result is recorded together with the identity of the verified file (device, inode, size and modification
+    time), the SHA-256 digest of the signed data, the fingerprint of the key used (or the version of the trust store)
+    and the fingerprint of the key which signed the document. A file whose identity and key match the stored ones is
+    answered from the index without being read. Any mismatch means the file may have changed, so it has to be
+    verified again.
+
+    The index can be used as a context manager; pending results are committed when it is closed.
+    """
+
+    def __init__(self, db_path):
+        """
+        Parameters
+        ----------
+        db_path : str
+            The path to the SQLite database file. It is created if it does not exist.
+        """
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(results)")]
+        if "signer" not in columns:
+            self.connection.execute("ALTER TABLE results ADD COLUMN signer TEXT")
+        self._uncommitted = 0
+
+    def lookup(self, pdf_path, stat, key_fingerprint):
+        """
+        Returns the stored verification result of a file if the file and the key have not changed.
+
+        Parameters
+        ----------
+        pdf_path : str
+            The path to the PDF file.
+        stat : os.stat_result
+            The current status of the file.
+        key_fingerprint : str
+            The fingerprint of the public key used for the verification.
+
+        Returns
+        -------
+        tuple or None
+            The stored `(status, digest, signer)` triple, or `None` if the file has to be verified again.
+        """
+        row = self.connection.execute(
+            "SELECT dev, inode, size, mtime_ns, key, status, digest, signer FROM results WHERE path = ?",
+            (os.path.abspath(pdf_path),)
+        ).fetchone()
+        if row is None:
+            return None
+
+        if tuple(row[:5]) != (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, key_fingerprint):
+            return None
+        return row[5], row[6], row[7]
+
+    def store(self, pdf_path, stat, key_fingerprint, status, digest, signer=None):
+        """
+        Records the verification result of a file.
+
+        Parameters
+        ----------
+        pdf_path : str
+            The path to the PDF file.
+        stat : os.stat_result
+            The status of the file taken before it was verified.
+        key_fingerprint : str
+            The fingerprint of the public key used for the verification.
+        status : str
+            The status code of the verification.
+        digest : str or None
+            The hex encoded SHA-256 digest of the signed data.
+        signer : str, optional
+            The fingerprint of the key which signed the document.
+
+        Returns
+        -------
+        None.
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results (path, dev, inode, size, mtime_ns, digest, key, status, verified_at, "
+            "signer) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (os.path.abspath(pdf_path), stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, digest,
+             key_fingerprint, status, time.time(), signer)
+        )
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        """
+        Commits the pending results to the database.
+
+        Returns
+        -------
+        None.
+        """
+        self.connection.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        """
+        Commits the pending results and closes the database.
+
+        Returns
+        -------
+        None.
+        """
+        self.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,58 +1,500 @@
+import hashlib
+import mmap
 import re
+import time
+from collections import namedtuple
 
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.primitives import hashes, serialization
+from src.key_algorithms import ALGORITHM_RSA, key_algorithm, strip_signature_padding, verify_digest
+from src.key_cache import public_keys
 
+HASH_CHUNK_SIZE = 1024 * 1024
+WHITESPACE = b" \t\n\r\x0b\x0c"
+SIGNATURE_WINDOW_SIZE = 8 * 1024
+SIGNATURE_SEARCH_LIMIT = 1024 * 1024
+SIG_DICT_START = b'<<\n/Type /Sig'
+SIG_DICT_END = b'>\n>>'
+CONTENTS_PATTERN = re.compile(rb'/Contents\s*<([0-9A-Fa-f]+)>')
+KEY_ALGORITHM_PATTERN = re.compile(rb'/KeyAlgorithm\s*/([A-Za-z0-9-]+)')
+KEY_ID_PATTERN = re.compile(rb'/KeyID\s*<([0-9A-Fa-f]+)>')
+BYTE_RANGE_PATTERN = re.compile(rb'/ByteRange\s*\[\s*(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s*\]')
 
-def verify_signature(pdf_path, public_key_path):
+STATUS_VALID = "valid"
+STATUS_INVALID = "invalid"
+STATUS_UNSIGNED = "unsigned"
+STATUS_NO_CONTENTS = "no_contents"
+STATUS_BAD_SIGNATURE_HEX = "bad_signature_hex"
+STATUS_ALGORITHM_MISMATCH = "algorithm_mismatch"
+STATUS_NO_KEY_ID = "no_key_id"
+STATUS_UNKNOWN_KEY = "unknown_key"
+STATUS_BAD_BYTE_RANGE = "bad_byte_range"
+
+STATUS_MESSAGES = {
+    STATUS_VALID: "Podpis jest ważny!",
+    STATUS_INVALID: "Plik został zmodyfikowany. Podpis jest nieważny!",
+    STATUS_UNSIGNED: "Brak podpisu w pliku PDF.",
+    STATUS_NO_CONTENTS: "Nie znaleziono pola /Contents w słowniku podpisu.",
+    STATUS_BAD_SIGNATURE_HEX: "Błąd przy konwersji podpisu z hex",
+    STATUS_ALGORITHM_MISMATCH: "Algorytm podpisu nie pasuje do klucza publicznego.",
+    STATUS_NO_KEY_ID: "Podpis nie zawiera identyfikatora klucza (/KeyID).",
+    STATUS_UNKNOWN_KEY: "Klucz, którym podpisano dokument, nie jest zaufany.",
+    STATUS_BAD_BYTE_RANGE: "Zakres /ByteRange nie odpowiada układowi pliku PDF.",
+}
+
+SignatureLocation = namedtuple("SignatureLocation", ["start", "end", "contents", "byte_range", "algorithm", "key_id"])
+
+
+def locate_signature(pdf_file, window_size=SIGNATURE_WINDOW_SIZE, search_limit=SIGNATURE_SEARCH_LIMIT):
     """
-    Verify the digital signature of a PDF file using the provided public key.
+    Locates the signature dictionary at the end of a PDF file without reading the whole file.
+
+    The signature dictionary is always appended at the end of a signed document, so the file is read backwards from
+    its end in windows of `window_size` bytes until the start of the dictionary is found. The dictionary is then parsed
+    directly from the bytes already read. For a signed document this costs a single read of the size of the
+    dictionary. The search stops after `search_limit` bytes, so checking an unsigned document is bounded as well.
+
+    Parameters
+    ----------
+    pdf_file : file object
+        The PDF file opened in binary mode. It must be seekable.
+    window_size : int, optional
+        The number of bytes read at a time.
+    search_limit : int, optional
+        The maximum number of bytes from the end of the file searched for the signature dictionary.
+
+    Returns
+    -------
+    SignatureLocation or None
+        The offsets of the signature dictionary in the file, the hex encoded signature from the `/Contents` field (or
+        `None` if the field is missing), the values of the `/ByteRange` field (or `None` if the field is missing) and
+        the key algorithm from the `/KeyAlgorithm` field (RSA for documents signed before the field was introduced)
+        and the lowercase hex fingerprint of the signing key from the `/KeyID` field (or `None` if the field is
+        missing). `None` is returned if no signature dictionary was found.
+    """
+    def read(start, end):
+        pdf_file.seek(start)
+        return pdf_file.read(end - start)
+
+    return _search_signature(read, pdf_file.seek(0, 2), window_size, search_limit)
+
+
+def locate_signature_in_buffer(buffer, window_size=SIGNATURE_WINDOW_SIZE, search_limit=SIGNATURE_SEARCH_LIMIT):
+    """
+    Locates the signature dictionary at the end of a document held in memory, see `locate_signature`.
+
+    Only the windows searched for the dictionary are copied out of the buffer.
+
+    Parameters
+    ----------
+    buffer : bytes-like
+        The content of the PDF file.
+    window_size : int, optional
+        The number of bytes searched at a time.
+    search_limit : int, optional
+        The maximum number of bytes from the end of the buffer searched for the signature dictionary.
+
+    Returns
+    -------
+    SignatureLocation or None
+        The signature dictionary, as returned by `locate_signature`.
+    """
+    with memoryview(buffer) as view:
+        return _search_signature(lambda start, end: bytes(view[start:end]), len(view), window_size, search_limit)
+
+
+def _search_signature(read, file_size, window_size, search_limit):
+    """
+    Searches for the signature dictionary backwards from the end of a document.
+
+    Parameters
+    ----------
+    read : callable
+        Called as `read(start, end)`, returns the bytes of the document between the two offsets.
+    file_size : int
+        The size of the document.
+    window_size : int
+        The number of bytes read at a time.
+    search_limit : int
+        The maximum number of bytes from the end of the document searched for the signature dictionary.
+
+    Returns
+    -------
+    SignatureLocation or None
+        The signature dictionary, as returned by `locate_signature`.
+    """
+    position = file_size
+    tail = b""
+
+    while position > 0 and file_size - position < search_limit:
+        read_start = max(0, position - window_size, file_size - search_limit)
+        tail = read(read_start, position) + tail
+        position = read_start
+
+        start = tail.rfind(SIG_DICT_START)
+        if start == -1:
+            continue
+
+        end = tail.rfind(SIG_DICT_END)
+        end = end + len(SIG_DICT_END) if end > start else len(tail)
+
+        contents_match = CONTENTS_PATTERN.search(tail, start)
+        byte_range_match = BYTE_RANGE_PATTERN.search(tail, start, end)
+        algorithm_match = KEY_ALGORITHM_PATTERN.search(tail, start, end)
+        key_id_match = KEY_ID_PATTERN.search(tail, start, end)
+        return SignatureLocation(
+            start=position + start,
+            end=position + end,
+            contents=contents_match.group(1) if contents_match else None,
+            byte_range=tuple(int(value) for value in byte_range_match.groups()) if byte_range_match else None,
+            algorithm=algorithm_match.group(1).decode('ascii') if algorithm_match else ALGORITHM_RSA,
+            key_id=key_id_match.group(1).decode('ascii').lower() if key_id_match else None,
+        )
+
+    return None
+
+
+def rstrip_index(buffer, start, end):
+    """
+    Returns the end index of `buffer[start:end]` with trailing whitespace removed, without copying the data.
+
+    Parameters
+    ----------
+    buffer : bytes-like
+        The buffer to inspect.
+    start : int
+        The start index of the inspected region.
+    end : int
+        The end index of the inspected region.
+
+    Returns
+    -------
+    int
+        The index at which `buffer[start:end].rstrip()` would end.
+    """
+    while end > start and buffer[end - 1] in WHITESPACE:
+        end -= 1
+    return end
+
+
+def hash_regions(buffer, regions, chunk_size=HASH_CHUNK_SIZE, progress=None, trailer=b"\n"):
+    """
+    Computes the SHA-256 digest of the given regions of a buffer followed by a trailer.
+
+    The regions are fed to the hash through memoryview slices, so no part of the buffer is copied.
+
+    Parameters
+    ----------
+    buffer : bytes-like
+        The buffer containing the signed data, usually a memory-mapped file.
+    regions : list of tuple
+        The `(start, end)` pairs of the regions to hash, in order.
+    chunk_size : int, optional
+        The number of bytes passed to the hash at a time.
+    progress : callable, optional
+        Called as `progress(done, total)` after every chunk with the number of bytes hashed so far. An exception
+        raised by the callback aborts hashing.
+    trailer : bytes, optional
+        The bytes hashed after the regions: a newline for documents signed before the `/ByteRange` field described
+        the signed data (see `signed_regions`), nothing for the current ones.
+
+    Returns
+    -------
+    bytes
+        The SHA-256 digest of the regions.
+    """
+    digest = hashlib.sha256()
+    total = sum(end - start for start, end in regions)
+    done = 0
+    with memoryview(buffer) as view:
+        for start, end in regions:
+            for offset in range(start, end, chunk_size):
+                chunk_end = min(offset + chunk_size, end)
+                digest.update(view[offset:chunk_end])
+                done += chunk_end - offset
+                if progress is not None:
+                    progress(done, total)
+    digest.update(trailer)
+    return digest.digest()
+
+
+def check_signature(pdf_path, public_key, progress=None):
+    """
+    Checks the digital signature of a PDF file and returns a status code describing the result.
 
     Parameters
     ----------
     pdf_path : str
         The file path to the PDF document that contains the signature.
-    public_key_path : str
-        The file path to the PEM encoded public key.
+    public_key : public key
+        The public key used to verify the signature: RSA, ECDSA P-256 or Ed25519.
+    progress : callable, optional
+        Called as `progress(done, total)` while the signed data is hashed, see `hash_regions`.
 
     Returns
     -------
     str
-        A message indicating whether the signature is valid or not.
+        One of the `STATUS_*` codes. `STATUS_MESSAGES` maps every code to a message for the user.
     """
+    return check_signature_with_digest(pdf_path, public_key, progress)[0]
 
-    with open(public_key_path, 'rb') as key_file:
-        public_key = serialization.load_pem_public_key(key_file.read())
 
+def check_signature_with_digest(pdf_path, public_key, progress=None):
+    """
+    Checks the digital signature of a PDF file and returns the status code together with the digest of the signed data.
+
+    The signature dictionary is located by reading backwards from the end of the file. The PDF file is then
+    memory-mapped instead of being read into memory. The signed regions around the signature dictionary are hashed
+    directly from the mapping and the signature is checked against the prehashed digest, so verifying a large document
+    costs one sequential read of the file.
+
+    Parameters
+    ----------
+    pdf_path : str
+        The file path to the PDF document that contains the signature.
+    public_key : public key
+        The public key used to verify the signature: RSA, ECDSA P-256 or Ed25519.
+    progress : callable, optional
+        Called as `progress(done, total)` while the signed data is hashed, see `hash_regions`.
+
+    Returns
+    -------
+    status : str
+        One of the `STATUS_*` codes. `STATUS_MESSAGES` maps every code to a message for the user.
+    digest : str or None
+        The hex encoded SHA-256 digest of the signed data, or `None` if the document was rejected before hashing.
+    """
     with open(pdf_path, 'rb') as f:
-        full_pdf = f.read()
+        location = locate_signature(f)
+        if location is None:
+            return STATUS_UNSIGNED, None
+        return check_located_signature(f, location, public_key, progress)
 
-    sig_dict_start = full_pdf.rfind(b'<<\n/Type /Sig')
-    sig_dict_end = full_pdf.rfind(b'>\n>>') + 4
-    if sig_dict_start == -1:
-        return "Brak podpisu w pliku PDF."
 
-    sig_dict_data = full_pdf[sig_dict_start:]
+def check_signature_in_trust_store(pdf_path, trust_store, progress=None):
+    """
+    Checks the digital signature of a PDF file with the trusted key identified by the signature itself.
 
-    contents_match = re.search(rb'/Contents\s*<([0-9A-Fa-f]+)>', sig_dict_data)
-    if not contents_match:
-        return "Nie znaleziono pola /Contents w słowniku podpisu."
+    The fingerprint of the signing key is read from the `/KeyID` field of the signature dictionary and the public key
+    is looked up in the trust store, so no key has to be chosen by the user and no directory is searched.
+
+    Parameters
+    ----------
+    pdf_path : str
+        The file path to the PDF document that contains the signature.
+    trust_store : TrustStore
+        The store of trusted public keys, see `src.trust_store`.
+    progress : callable, optional
+        Called as `progress(done, total)` while the signed data is hashed, see `hash_regions`.
+
+    Returns
+    -------
+    status : str
+        One of the `STATUS_*` codes. `STATUS_NO_KEY_ID` is returned for documents signed before the `/KeyID` field was
+        introduced and `STATUS_UNKNOWN_KEY` if the signing key is not in the trust store.
+    digest : str or None
+        The hex encoded SHA-256 digest of the signed data, or `None` if the document was rejected before hashing.
+    key_id : str or None
+        The fingerprint of the signing key, or `None` if the document does not contain it.
+    """
+    with open(pdf_path, 'rb') as f:
+        return check_file_in_trust_store(f, trust_store, progress)
+
+
+def check_file_in_trust_store(pdf_file, trust_store, progress=None):
+    """
+    Checks the digital signature of an open PDF file with the trusted key identified by the signature itself, see
+    `check_signature_in_trust_store`.
+
+    Parameters
+    ----------
+    pdf_file : file object
+        The PDF file opened in binary mode. It must be seekable and have a file descriptor.
+    trust_store : TrustStore
+        The store of trusted public keys, see `src.trust_store`.
+    progress : callable, optional
+        Called as `progress(done, total)` while the signed data is hashed, see `hash_regions`.
+
+    Returns
+    -------
+    status : str
+        One of the `STATUS_*` codes.
+    digest : str or None
+        The hex encoded SHA-256 digest of the signed data, or `None` if the document was rejected before hashing.
+    key_id : str or None
+        The fingerprint of the signing key, or `None` if the document does not contain it.
+    """
+    location = locate_signature(pdf_file)
+    if location is None:
+        return STATUS_UNSIGNED, None, None
+    if location.key_id is None:
+        return STATUS_NO_KEY_ID, None, None
+
+    public_key = trust_store.get(location.key_id)
+    if public_key is None:
+        return STATUS_UNKNOWN_KEY, None, location.key_id
+
+    status, digest = check_located_signature(pdf_file, location, public_key, progress)
+    return status, digest, location.key_id
+
+
+def check_located_signature(pdf_file, location, public_key, progress=None):
+    """
+    Checks a signature found by `locate_signature` against the data of the document.
+
+    Parameters
+    ----------
+    pdf_file : file object
+        The PDF file opened in binary mode.
+    location : SignatureLocation
+        The signature dictionary of the document.
+    public_key : public key
+        The public key used to verify the signature: RSA, ECDSA P-256 or Ed25519.
+    progress : callable, optional
+        Called as `progress(done, total)` while the signed data is hashed, see `hash_regions`.
+
+    Returns
+    -------
+    status : str
+        One of the `STATUS_*` codes.
+    digest : str or None
+        The hex encoded SHA-256 digest of the signed data, or `None` if the document was rejected before hashing.
+    """
+    with mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ) as full_pdf:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            full_pdf.madvise(mmap.MADV_SEQUENTIAL)
+        return check_signature_in_buffer(full_pdf, location, public_key, progress)
+
+
+def has_byte_range(location):
+    """
+    Tells whether the `/ByteRange` field of a signature describes the signed data.
+
+    Documents signed by earlier versions carry a `/ByteRange [0 N N 0]` that does not match their layout. Their
+    signature covers the document without trailing whitespace followed by a newline and is stored in `/Contents`
+    without padding. The current signature dictionary reserves a fixed-size `/Contents` field and the `/ByteRange`
+    `[0 a b c]` covers everything but that field, so `a < b`.
+
+    Parameters
+    ----------
+    location : SignatureLocation
+        The signature dictionary of the document.
+
+    Returns
+    -------
+    bool
+        `True` if the signed data is given by the `/ByteRange` field.
+    """
+    return location.byte_range is not None and location.byte_range[1] < location.byte_range[2]
+
+
+def signed_regions(buffer, location):
+    """
+    Returns the regions of a signed document covered by its signature.
+
+    Parameters
+    ----------
+    buffer : bytes-like
+        The content of the PDF file.
+    location : SignatureLocation
+        The signature dictionary of the document.
+
+    Returns
+    -------
+    list of tuple
+        The `(start, end)` offsets of the signed data: the two ranges of the `/ByteRange` field or, for documents
+        signed by earlier versions, the data before and after the signature dictionary without trailing whitespace.
+    """
+    if has_byte_range(location):
+        _, contents_start, contents_end, tail_length = location.byte_range
+        return [(0, contents_start), (contents_end, contents_end + tail_length)]
+    return [
+        (0, rstrip_index(buffer, 0, location.start)),
+        (location.end, rstrip_index(buffer, location.end, len(buffer))),
+    ]
+
+
+def check_signature_in_buffer(buffer, location, public_key, progress=None, timings=None):
+    """
+    Checks a signature found by `locate_signature` against the content of the document held in a buffer.
+
+    Parameters
+    ----------
+    buffer : bytes-like
+        The content of the PDF file, e.g. a memory-mapped file.
+    location : SignatureLocation
+        The signature dictionary of the document.
+    public_key : public key
+        The public key used to verify the signature: RSA, ECDSA P-256 or Ed25519.
+    progress : callable, optional
+        Called as `progress(done, total)` while the signed data is hashed, see `hash_regions`.
+    timings : dict, optional
+        If given, the time of hashing the signed data and of checking the signature is stored in it under the `hash`
+        and `verify` keys, in seconds.
+
+    Returns
+    -------
+    status : str
+        One of the `STATUS_*` codes.
+    digest : str or None
+        The hex encoded SHA-256 digest of the signed data, or `None` if the document was rejected before hashing.
+    """
+    if location.contents is None:
+        return STATUS_NO_CONTENTS, None
+
+    contents = location.contents
+    if has_byte_range(location):
+        byte_range = location.byte_range
+        if byte_range[0] != 0 or not location.start < byte_range[1] < location.end or \
+                byte_range[2] + byte_range[3] != len(buffer) or \
+                buffer[byte_range[1]] != ord("<") or buffer[byte_range[2] - 1] != ord(">"):
+            return STATUS_BAD_BYTE_RANGE, None
+        contents = bytes(buffer[byte_range[1] + 1:byte_range[2] - 1])
 
-    signature_hex = contents_match.group(1)
     try:
-        signature = bytes.fromhex(signature_hex.decode('ascii'))
+        signature = bytes.fromhex(contents.decode('ascii'))
     except Exception as e:
-        return "Błąd przy konwersji podpisu z hex"
+        return STATUS_BAD_SIGNATURE_HEX, None
 
-    data_to_verify = full_pdf[:sig_dict_start].rstrip() + full_pdf[sig_dict_end:].rstrip() + b"\n"
+    if location.algorithm != key_algorithm(public_key):
+        return STATUS_ALGORITHM_MISMATCH, None
+
+    trailer = b"\n"
+    if has_byte_range(location):
+        signature = strip_signature_padding(public_key, signature)
+        trailer = b""
+
+    start = time.perf_counter()
+    digest = hash_regions(buffer, signed_regions(buffer, location), progress=progress, trailer=trailer)
+    hashed = time.perf_counter()
 
     try:
-        public_key.verify(
-            signature,
-            data_to_verify,
-            padding.PKCS1v15(),
-            hashes.SHA256()
-        )
-        return "Podpis jest ważny!"
+        verify_digest(public_key, signature, digest)
+        status = STATUS_VALID
     except Exception as e:
-        return "Plik został zmodyfikowany. Podpis jest nieważny!"
\ No newline at end of file
+        status = STATUS_INVALID
+    if timings is not None:
+        timings["hash"] = hashed - start
+        timings["verify"] = time.perf_counter() - hashed
+    return status, digest.hex()
+
+
+def verify_signature(pdf_path, public_key_path, progress=None):
+    """
+    Verify the digital signature of a PDF file using the provided public key.
+
+    Parameters
+    ----------
+    pdf_path : str
+        The file path to the PDF document that contains the signature.
+    public_key_path : str
+        The file path to the PEM encoded public key. Parsed keys are reused through the shared `public_keys` cache.
+    progress : callable, optional
+        Called as `progress(done, total)` while the signed data is hashed, see `hash_regions`.
+
+    Returns
+    -------
+    str
+        A message indicating whether the signature is valid or not.
+    """
+    public_key = public_keys.load(public_key_path)
+
+    return STATUS_MESSAGES[check_signature(pdf_path, public_key, progress)]
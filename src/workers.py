@@ -0,0 +1,157 @@
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+
+class OperationCancelled(Exception):
+    """
+    Raised inside a worker when its operation has been cancelled by the user.
+    """
+
+
+class WorkerSignals(QObject):
+    """
+    Signals emitted by a `Worker`.
+
+    The signals are delivered to the GUI thread, so the connected slots may safely update the widgets.
+
+    - `progress(int)`: the progress of the operation in percent.
+    - `result(object)`: the value returned by the operation.
+    - `error(object)`: the exception raised by the operation.
+    - `cancelled()`: the operation was cancelled.
+    - `finished()`: the operation ended, emitted after any of the above.
+    """
+    progress = pyqtSignal(int)
+    result = pyqtSignal(object)
+    error = pyqtSignal(object)
+    cancelled = pyqtSignal()
+    finished = pyqtSignal()
+
+
+class Worker(QRunnable):
+    """
+    Runs a long operation (signing, verification, device detection) on a `QThreadPool` thread.
+
+    The operation is called with a `progress` keyword argument: a callable taking the amount of work done and the
+    total amount of work. Every call reports the progress through the `progress` signal and raises
+    `OperationCancelled` once `cancel` has been called, so cancellation takes effect at the next progress report.
+    """
+
+    def __init__(self, function, *args, **kwargs):
+        """
+        Parameters
+        ----------
+        function : callable
+            The operation to run. It must accept a `progress` keyword argument.
+        *args, **kwargs
+            The arguments passed to the operation.
+        """
+        super().__init__()
+        self.setAutoDelete(False)
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """
+        Requests cancellation of the operation.
+
+        Returns
+        -------
+        None.
+        """
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        """
+        Returns `True` if cancellation of the operation has been requested.
+
+        Returns
+        -------
+        bool
+        """
+        return self._cancelled.is_set()
+
+    def report_progress(self, done, total):
+        """
+        Reports the progress of the operation. Passed to the operation as its `progress` argument.
+
+        Parameters
+        ----------
+        done : int
+            The amount of work done so far.
+        total : int
+            The total amount of work.
+
+        Returns
+        -------
+        None.
+
+        Raises
+        ------
+        OperationCancelled
+            If cancellation of the operation has been requested.
+        """
+        if self._cancelled.is_set():
+            raise OperationCancelled()
+        self.signals.progress.emit(int(done * 100 / total) if total else 100)
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            if self._cancelled.is_set():
+                raise OperationCancelled()
+            result = self.function(*self.args, progress=self.report_progress, **self.kwargs)
+        except OperationCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.error.emit(e)
+        else:
+            self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
+
+
+def start_worker(window, worker, on_finished=None):
+    """
+    Starts a worker on the global thread pool and keeps it referenced by the window until it finishes.
+
+    Parameters
+    ----------
+    window : QWidget
+        The application window keeping the list of running workers in its `workers` attribute.
+    worker : Worker
+        The worker to start.
+    on_finished : callable, optional
+        Called without arguments when the worker finishes, after it has been removed from the running workers.
+
+    Returns
+    -------
+    Worker
+        The started worker.
+    """
+    window.workers.append(worker)
+    worker.signals.finished.connect(lambda: window.workers.remove(worker))
+    if on_finished is not None:
+        worker.signals.finished.connect(on_finished)
+    QThreadPool.globalInstance().start(worker)
+    return worker
+
+
+def cancel_workers(window):
+    """
+    Requests cancellation of all workers running for the window.
+
+    Parameters
+    ----------
+    window : QWidget
+        The application window keeping the list of running workers in its `workers` attribute.
+
+    Returns
+    -------
+    None.
+    """
+    for worker in window.workers:
+        worker.cancel()
@@ -0,0 +1,30 @@
+import pytest
+
+from src.find_keys import key_locations
+from src.key_algorithms import ALGORITHMS, generate_private_key
+
+
+@pytest.fixture(scope="session")
+def private_keys():
+    """
+    One private key of every supported algorithm, generated once for the whole test session.
+    """
+    return {algorithm: generate_private_key(algorithm) for algorithm in ALGORITHMS}
+
+
+@pytest.fixture(params=ALGORITHMS)
+def private_key(request, private_keys):
+    """
+    The private key of each supported algorithm in turn.
+    """
+    return private_keys[request.param]
+
+
+@pytest.fixture(autouse=True)
+def key_location_cache(tmp_path_factory, monkeypatch):
+    """
+    Keeps the key locations remembered by the tests out of the user's cache directory.
+    """
+    monkeypatch.setattr(key_locations, "cache_path", str(tmp_path_factory.mktemp("cache") / "key_locations.json"))
+    monkeypatch.setattr(key_locations, "_entries", None)
+    return key_locations
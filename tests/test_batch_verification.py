@@ -0,0 +1,86 @@
+import os
+
+from cryptography.hazmat.primitives import serialization
+
+from src import batch_verification
+from src.key_algorithms import ALGORITHM_ED25519, generate_private_key, public_key_fingerprint
+from src.key_cache import public_keys
+from src.signing_api import sign_bytes
+from src.verification_index import VerificationIndex
+from src.verify_signature import STATUS_INVALID, STATUS_VALID
+
+
+def write_public_key(path, private_key):
+    path.write_bytes(private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ))
+    return str(path)
+
+
+def test_worker_loads_the_key_file_through_the_cache(private_keys, tmp_path, monkeypatch):
+    private_key = private_keys[ALGORITHM_ED25519]
+    key_path = write_public_key(tmp_path / "public_key.pubk", private_key)
+    pdf_paths = []
+    for number in range(3):
+        pdf_path = tmp_path / f"document{number}.pdf"
+        pdf_path.write_bytes(sign_bytes(b"%PDF-1.4\n%%EOF\n" * (number + 1), private_key).document)
+        pdf_paths.append(str(pdf_path))
+
+    for name in ["_worker_public_key", "_worker_public_key_path", "_worker_key_fingerprint", "_worker_trust_store"]:
+        monkeypatch.setattr(batch_verification, name, None)
+    public_keys.clear()
+    batch_verification._init_worker(None, public_key_path=key_path)
+    records = [batch_verification._verify_task(pdf_path) for pdf_path in pdf_paths]
+
+    assert [record.status for record in records] == [STATUS_VALID] * 3
+    assert {record.key for record in records} == {public_key_fingerprint(private_key.public_key())}
+    assert (public_keys.misses, public_keys.hits) == (1, 2)
+
+
+def test_batch_with_key_file(private_keys, tmp_path):
+    private_key = private_keys[ALGORITHM_ED25519]
+    key_path = write_public_key(tmp_path / "public_key.pubk", private_key)
+    pdf_path = tmp_path / "document.pdf"
+    pdf_path.write_bytes(sign_bytes(b"%PDF-1.4\n%%EOF\n", private_key).document)
+    records = []
+
+    counts = batch_verification.verify_batch([str(pdf_path)], workers=1, on_result=records.append,
+                                             public_key_path=key_path)
+
+    assert counts == {STATUS_VALID: 1}
+    assert records[0].key == public_key_fingerprint(private_key.public_key())
+
+
+def test_index_is_keyed_by_the_key_the_worker_used(private_keys, tmp_path):
+    private_key = private_keys[ALGORITHM_ED25519]
+    other_key = generate_private_key(ALGORITHM_ED25519)
+    key_path = write_public_key(tmp_path / "public_key.pubk", private_key)
+    pdf_paths = []
+    for number in range(2):
+        pdf_path = tmp_path / f"document{number}.pdf"
+        pdf_path.write_bytes(sign_bytes(b"%PDF-1.4\n%%EOF\n" * (number + 1), private_key).document)
+        pdf_paths.append(str(pdf_path))
+
+    def replace_key_between_documents():
+        yield pdf_paths[0]
+        os.replace(write_public_key(tmp_path / "replacement.pubk", other_key), key_path)
+        yield pdf_paths[1]
+
+    records = []
+    index = VerificationIndex(str(tmp_path / "index.sqlite"))
+    try:
+        batch_verification.verify_batch(replace_key_between_documents(), workers=1, on_result=records.append,
+                                        index=index, public_key_path=key_path)
+        stored = [index.lookup(record.path, os.stat(record.path), record.key) for record in records]
+        rerun = []
+        batch_verification.verify_batch(pdf_paths, workers=1, on_result=rerun.append, index=index,
+                                        public_key_path=key_path)
+    finally:
+        index.close()
+
+    last = records[-1]
+    assert (last.path, last.status, last.key) == (pdf_paths[1], STATUS_INVALID,
+                                                  public_key_fingerprint(other_key.public_key()))
+    assert [entry[0] for entry in stored] == [record.status for record in records]
+    assert rerun[1].status == STATUS_INVALID and rerun[1].cached
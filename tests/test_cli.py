@@ -0,0 +1,11 @@
+import pytest
+
+from src.cli import main
+
+
+def test_key_id_is_rejected_with_a_key_file(tmp_path, capsys):
+    with pytest.raises(SystemExit) as error:
+        main(["sign", "--key-file", str(tmp_path / "key.pk"), "--key-id", "0123456789abcdef", "document.pdf"])
+
+    assert error.value.code == 2
+    assert "--key-id" in capsys.readouterr().err
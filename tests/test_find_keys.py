@@ -0,0 +1,84 @@
+import json
+import os
+
+import pytest
+
+from src import find_keys as find_keys_module
+from src.find_keys import PRIVATE_KEY_NAME, PUBLIC_KEY_NAME, KeyLocationCache, find_keys
+
+
+@pytest.fixture
+def cache(tmp_path_factory, monkeypatch):
+    monkeypatch.setattr(find_keys_module, "volume_uuid", lambda path: "0000-test")
+    return KeyLocationCache(str(tmp_path_factory.mktemp("cache") / "key_locations.json"))
+
+
+@pytest.fixture
+def medium(tmp_path):
+    directory = tmp_path / "a" / "b" / "c" / "d" / "e" / "f"
+    directory.mkdir(parents=True)
+    (directory / PUBLIC_KEY_NAME).write_bytes(b"public")
+    (tmp_path / "a" / PRIVATE_KEY_NAME).write_bytes(b"private")
+    return tmp_path
+
+
+def forbid_scanning(monkeypatch):
+    def scan(*args, **kwargs):
+        raise AssertionError("katalog nie powinien być przeszukiwany")
+    monkeypatch.setattr(find_keys_module, "scan_for_keys", scan)
+
+
+def test_keys_are_found_at_any_depth(medium):
+    locations = find_keys(str(medium), cache=None)
+
+    assert locations.public_key == str(medium / "a" / "b" / "c" / "d" / "e" / "f" / PUBLIC_KEY_NAME)
+    assert locations.private_key == str(medium / "a" / PRIVATE_KEY_NAME)
+
+
+def test_cached_locations_are_used_without_scanning(medium, cache, monkeypatch):
+    expected = find_keys(str(medium), cache=cache)
+    forbid_scanning(monkeypatch)
+
+    assert find_keys(str(medium), cache=cache) == expected
+    assert find_keys(str(medium), cache=KeyLocationCache(cache.cache_path)) == expected
+
+
+def test_only_the_missing_names_are_scanned(medium, cache, monkeypatch):
+    find_keys(str(medium), (PUBLIC_KEY_NAME,), cache=cache)
+    scanned = []
+    scan_for_keys = find_keys_module.scan_for_keys
+    monkeypatch.setattr(find_keys_module, "scan_for_keys",
+                        lambda directory, names, **kwargs: scanned.append(list(names)) or
+                        scan_for_keys(directory, names, **kwargs))
+
+    locations = find_keys(str(medium), cache=cache)
+
+    assert scanned == [[PRIVATE_KEY_NAME]]
+    assert locations.public_key is not None and locations.private_key is not None
+
+
+def test_searching_for_one_key_keeps_the_other_remembered(medium, cache, monkeypatch):
+    find_keys(str(medium), (PUBLIC_KEY_NAME,), cache=cache)
+    find_keys(str(medium), (PRIVATE_KEY_NAME,), cache=cache)
+    forbid_scanning(monkeypatch)
+
+    locations = find_keys(str(medium), cache=cache)
+    assert locations.public_key is not None and locations.private_key is not None
+
+
+def test_modified_key_file_is_searched_again(medium, cache):
+    find_keys(str(medium), (PRIVATE_KEY_NAME,), cache=cache)
+    os.remove(medium / "a" / PRIVATE_KEY_NAME)
+    (medium / "a" / "b" / PRIVATE_KEY_NAME).write_bytes(b"moved private key")
+
+    assert find_keys(str(medium), (PRIVATE_KEY_NAME,), cache=cache).private_key == \
+        str(medium / "a" / "b" / PRIVATE_KEY_NAME)
+
+
+def test_cache_file_is_written_atomically(medium, cache):
+    find_keys(str(medium), cache=cache)
+
+    with open(cache.cache_path, encoding="utf-8") as cache_file:
+        entries = json.load(cache_file)
+    assert set(next(iter(entries.values()))) == {PUBLIC_KEY_NAME, PRIVATE_KEY_NAME}
+    assert os.listdir(os.path.dirname(cache.cache_path)) == [os.path.basename(cache.cache_path)]
@@ -0,0 +1,75 @@
+import struct
+
+import pytest
+
+from src import kdf
+from src.kdf import KDF_PBKDF2, KDF_SCRYPT, MAX_PBKDF2_ITERATIONS, MAX_SCRYPT_LOG2_N, MIN_PBKDF2_ITERATIONS, \
+    MIN_SCRYPT_LOG2_N, PBKDF2_PARAMS_FORMAT, SALT_SIZE, SCRYPT_PARAMS_FORMAT, SCRYPT_P, SCRYPT_R, KdfCost, \
+    calibrate_kdf, derive_key, encode_kdf_params, scrypt_available
+from src.key_algorithms import ALGORITHM_ED25519
+from src.key_container import HEADER_SIZE, decrypt_private_key, encrypt_private_key
+
+SALT = bytes(SALT_SIZE)
+
+
+@pytest.mark.parametrize("cost", [
+    KdfCost(KDF_SCRYPT, MIN_SCRYPT_LOG2_N - 1),
+    KdfCost(KDF_SCRYPT, MAX_SCRYPT_LOG2_N + 1),
+    KdfCost(KDF_PBKDF2, MIN_PBKDF2_ITERATIONS - 1),
+    KdfCost(KDF_PBKDF2, MAX_PBKDF2_ITERATIONS + 1),
+    KdfCost(7, 1),
+])
+def test_out_of_range_cost_is_not_encoded(cost):
+    with pytest.raises(ValueError):
+        encode_kdf_params(cost.kdf, cost.cost)
+
+
+@pytest.mark.parametrize("kdf_id, kdf_params", [
+    (KDF_SCRYPT, struct.pack(SCRYPT_PARAMS_FORMAT, SALT, MAX_SCRYPT_LOG2_N + 1, SCRYPT_R, SCRYPT_P)),
+    (KDF_SCRYPT, struct.pack(SCRYPT_PARAMS_FORMAT, SALT, MIN_SCRYPT_LOG2_N, SCRYPT_R * 2, SCRYPT_P)),
+    (KDF_PBKDF2, struct.pack(PBKDF2_PARAMS_FORMAT, SALT, MIN_PBKDF2_ITERATIONS - 1)),
+    (KDF_PBKDF2, struct.pack(PBKDF2_PARAMS_FORMAT, SALT, 2 ** 32 - 1)),
+    (KDF_PBKDF2, SALT),
+    (9, b""),
+])
+def test_out_of_range_parameters_are_rejected_before_deriving(kdf_id, kdf_params, monkeypatch):
+    monkeypatch.setattr(kdf, "PBKDF2HMAC", None)
+    monkeypatch.setattr(kdf, "Scrypt", None)
+
+    with pytest.raises(ValueError):
+        derive_key("1234", kdf_id, kdf_params)
+
+
+def test_out_of_range_kdf_header_is_rejected(private_keys):
+    container = bytearray(encrypt_private_key(private_keys[ALGORITHM_ED25519], "1234",
+                                              KdfCost(KDF_PBKDF2, MIN_PBKDF2_ITERATIONS)))
+    struct.pack_into(">I", container, HEADER_SIZE + SALT_SIZE, 2 ** 32 - 1)
+
+    with pytest.raises(ValueError):
+        decrypt_private_key(bytes(container), "1234")
+
+
+@pytest.mark.parametrize("kdf_id", [KDF_SCRYPT, KDF_PBKDF2])
+def test_calibration_stays_within_bounds(kdf_id, monkeypatch):
+    if kdf_id == KDF_SCRYPT and not scrypt_available():
+        pytest.skip("scrypt nie jest dostępny")
+    monkeypatch.setattr(kdf, "_calibrated_costs", {})
+
+    monkeypatch.setattr(kdf, "measure_kdf", lambda *args, **kwargs: 1e-9)
+    slowest = calibrate_kdf(0.25, kdf_id)
+    monkeypatch.setattr(kdf, "measure_kdf", lambda *args, **kwargs: 1e3)
+    fastest = calibrate_kdf(0.5, kdf_id)
+
+    assert slowest == KdfCost(kdf_id, MAX_SCRYPT_LOG2_N if kdf_id == KDF_SCRYPT else MAX_PBKDF2_ITERATIONS)
+    assert fastest == KdfCost(kdf_id, MIN_SCRYPT_LOG2_N if kdf_id == KDF_SCRYPT else MIN_PBKDF2_ITERATIONS)
+    encode_kdf_params(*slowest)
+    encode_kdf_params(*fastest)
+
+
+def test_calibration_is_cached(monkeypatch):
+    calls = []
+    monkeypatch.setattr(kdf, "_calibrated_costs", {})
+    monkeypatch.setattr(kdf, "measure_kdf", lambda *args, **kwargs: calls.append(args) or 0.01)
+
+    assert calibrate_kdf(0.25, KDF_PBKDF2) == calibrate_kdf(0.25, KDF_PBKDF2)
+    assert len(calls) == 1
@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+from cryptography.hazmat.primitives import serialization
+
+from src.kdf import KDF_PBKDF2, KDF_SCRYPT, MIN_PBKDF2_ITERATIONS, MIN_SCRYPT_LOG2_N, KdfCost, scrypt_available
+from src.key_algorithms import key_algorithm, public_key_fingerprint
+from src.key_container import HEADER_SIZE, MAGIC, NONCE_SIZE, VERSION, WrongPinError, decrypt_private_key, \
+    encrypt_private_key, read_key_header
+
+PIN = "1234"
+FAST_KDF_COST = KdfCost(KDF_SCRYPT, MIN_SCRYPT_LOG2_N) if scrypt_available() \
+    else KdfCost(KDF_PBKDF2, MIN_PBKDF2_ITERATIONS)
+
+
+def encrypt_v1_private_key(private_key, pin):
+    """
+    Encrypts a private key the way version 1 key files were written.
+    """
+    private_key_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    iv = os.urandom(16)
+    cipher = AES.new(hashlib.sha256(pin.encode()).digest(), AES.MODE_CBC, iv)
+    return iv + cipher.encrypt(pad(private_key_pem, AES.block_size))
+
+
+def same_key(first, second):
+    return public_key_fingerprint(first.public_key()) == public_key_fingerprint(second.public_key())
+
+
+@pytest.fixture
+def container(private_key):
+    return encrypt_private_key(private_key, PIN, FAST_KDF_COST)
+
+
+def test_round_trip(private_key, container):
+    assert container.startswith(MAGIC)
+    assert same_key(decrypt_private_key(container, PIN), private_key)
+
+
+def test_header_is_readable_without_the_pin(private_key, container):
+    header = read_key_header(container)
+
+    assert header.version == VERSION
+    assert header.kdf == FAST_KDF_COST.kdf
+    assert header.algorithm == key_algorithm(private_key)
+    assert header.fingerprint == public_key_fingerprint(private_key.public_key())
+    assert header.size == HEADER_SIZE + len(header.kdf_params)
+
+
+def test_containers_of_the_same_key_differ(private_key, container):
+    assert encrypt_private_key(private_key, PIN, FAST_KDF_COST) != container
+
+
+def test_v1_key_still_decrypts(private_key):
+    data = encrypt_v1_private_key(private_key, PIN)
+
+    assert read_key_header(data) is None
+    assert same_key(decrypt_private_key(data, PIN), private_key)
+
+
+def test_wrong_pin_is_reported(container):
+    with pytest.raises(WrongPinError):
+        decrypt_private_key(container, "4321")
+
+
+def test_wrong_pin_is_reported_for_v1_keys(private_keys):
+    data = encrypt_v1_private_key(next(iter(private_keys.values())), PIN)
+
+    with pytest.raises(WrongPinError):
+        decrypt_private_key(data, "4321")
+
+
+@pytest.mark.parametrize("field", ["algorithm", "fingerprint", "kdf_params", "nonce", "ciphertext"])
+def test_tampered_container_is_rejected(container, field):
+    offsets = {
+        "algorithm": len(MAGIC) + 2,
+        "fingerprint": len(MAGIC) + 3,
+        "kdf_params": HEADER_SIZE,
+        "nonce": read_key_header(container).size,
+        "ciphertext": read_key_header(container).size + NONCE_SIZE,
+    }
+    tampered = bytearray(container)
+    tampered[offsets[field]] ^= 0x03 if field == "algorithm" else 0x01
+
+    with pytest.raises(ValueError):
+        decrypt_private_key(bytes(tampered), PIN)
+
+
+def test_unsupported_version_is_rejected(container):
+    tampered = bytearray(container)
+    tampered[len(MAGIC)] = VERSION + 1
+
+    with pytest.raises(ValueError) as error:
+        decrypt_private_key(bytes(tampered), PIN)
+    assert not isinstance(error.value, WrongPinError)
+
+
+def test_truncated_header_is_rejected(container):
+    with pytest.raises(ValueError):
+        read_key_header(container[:HEADER_SIZE - 1])
@@ -0,0 +1,40 @@
+from src.detecting_usb import UsbDevice
+from src.find_keys import PRIVATE_KEY_NAME, PUBLIC_KEY_NAME
+from src.key_discovery import KEY_TYPE_PRIVATE, discover_first_key, discover_keys
+from src.keystore import Keystore
+
+
+def make_device(path):
+    return UsbDevice("sdz1", str(path), None, None, None)
+
+
+def test_keystore_keys_are_discovered_newest_first(tmp_path):
+    keystore = Keystore(str(tmp_path))
+    for key_id in ["b" * 64, "a" * 64]:
+        keystore.add(key_id, b"key", "Ed25519")
+    (tmp_path / PRIVATE_KEY_NAME).write_bytes(b"old key")
+
+    keys = list(discover_keys([make_device(tmp_path)], (PRIVATE_KEY_NAME,)))
+
+    assert [(key.key_type, key.fingerprint) for key in keys] == [(KEY_TYPE_PRIVATE, "a" * 64),
+                                                                 (KEY_TYPE_PRIVATE, "b" * 64)]
+    assert discover_first_key(PRIVATE_KEY_NAME, [make_device(tmp_path)]).path == keystore.path("a" * 64)
+
+
+def test_old_key_file_is_the_fallback(tmp_path):
+    (tmp_path / "keys").mkdir()
+    (tmp_path / "keys" / PRIVATE_KEY_NAME).write_bytes(b"old key")
+
+    candidate = discover_first_key(PRIVATE_KEY_NAME, [make_device(tmp_path)])
+
+    assert candidate.path == str(tmp_path / "keys" / PRIVATE_KEY_NAME)
+    assert candidate.fingerprint is None
+
+
+def test_public_keys_are_still_searched_next_to_a_keystore(tmp_path):
+    Keystore(str(tmp_path)).add("c" * 64, b"key", "Ed25519")
+    (tmp_path / PUBLIC_KEY_NAME).write_bytes(b"not a key")
+
+    keys = list(discover_keys([make_device(tmp_path)]))
+
+    assert [key.path for key in keys] == [str(tmp_path / PUBLIC_KEY_NAME), Keystore(str(tmp_path)).path("c" * 64)]
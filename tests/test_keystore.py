@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+
+from src.find_keys import PRIVATE_KEY_NAME
+from src.keystore import MIN_KEY_ID_PREFIX, Keystore, locate_private_key, newest_first
+
+FIRST_ID = "0123456789abcdef" + "0" * 48
+SECOND_ID = "0123456789abcdef" + "f" * 48
+THIRD_ID = "fedcba9876543210" + "0" * 48
+
+
+@pytest.fixture
+def keystore(tmp_path):
+    return Keystore(str(tmp_path))
+
+
+def test_newest_key_follows_the_sequence_numbers(keystore):
+    for key_id in [SECOND_ID, THIRD_ID, FIRST_ID]:
+        keystore.add(key_id, b"key", "Ed25519")
+
+    assert keystore.newest() == FIRST_ID
+    assert newest_first(keystore.entries()) == [FIRST_ID, THIRD_ID, SECOND_ID]
+    assert [keystore.entries()[key_id]["sequence"] for key_id in [SECOND_ID, THIRD_ID, FIRST_ID]] == [1, 2, 3]
+
+
+def test_adding_a_key_again_makes_it_the_newest(keystore):
+    for key_id in [FIRST_ID, SECOND_ID, FIRST_ID]:
+        keystore.add(key_id, b"key", "Ed25519")
+
+    assert keystore.newest() == FIRST_ID
+    assert len(keystore.entries()) == 2
+
+
+def test_keys_without_sequence_numbers_come_last(keystore):
+    keystore.add(THIRD_ID, b"key", "Ed25519")
+    entries = keystore.entries()
+    entries[FIRST_ID] = {"file": FIRST_ID + ".pk", "algorithm": "RSA", "created": "2030-01-01T00:00:00+00:00"}
+    entries[SECOND_ID] = {"file": SECOND_ID + ".pk", "algorithm": "RSA", "created": "2030-01-01T00:00:00+00:00"}
+    with open(keystore.index_path, "w", encoding="utf-8") as index_file:
+        json.dump(entries, index_file)
+
+    assert newest_first(keystore.entries()) == [THIRD_ID, SECOND_ID, FIRST_ID]
+
+
+def test_key_is_found_by_a_unique_prefix(keystore):
+    for key_id in [FIRST_ID, SECOND_ID, THIRD_ID]:
+        keystore.add(key_id, b"key", "Ed25519")
+
+    assert keystore.resolve(THIRD_ID[:MIN_KEY_ID_PREFIX].upper()) == THIRD_ID
+    assert keystore.path(SECOND_ID[:20]) == keystore.path(SECOND_ID)
+    assert keystore.resolve("abcdef01") is None
+
+
+@pytest.mark.parametrize("prefix", [FIRST_ID[:MIN_KEY_ID_PREFIX - 1], FIRST_ID[:16]])
+def test_short_or_ambiguous_prefix_is_rejected(keystore, prefix):
+    for key_id in [FIRST_ID, SECOND_ID]:
+        keystore.add(key_id, b"key", "Ed25519")
+
+    with pytest.raises(ValueError):
+        keystore.resolve(prefix)
+
+
+def test_removed_key_is_forgotten(keystore):
+    key_path = keystore.add(FIRST_ID, b"key", "Ed25519")
+
+    assert keystore.remove(FIRST_ID[:12])
+    assert keystore.newest() is None
+    assert not keystore.remove(FIRST_ID)
+    assert not os.path.exists(key_path)
+
+
+def test_medium_without_keystore_falls_back_to_the_old_key_file(tmp_path):
+    (tmp_path / PRIVATE_KEY_NAME).write_bytes(b"old key")
+
+    assert locate_private_key(str(tmp_path)) == str(tmp_path / PRIVATE_KEY_NAME)
+    Keystore(str(tmp_path)).add(FIRST_ID, b"key", "Ed25519")
+    assert locate_private_key(str(tmp_path)) == Keystore(str(tmp_path)).path(FIRST_ID)
@@ -0,0 +1,151 @@
+import io
+
+import pytest
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+
+from src.document_signing import SIGNATURE_PLACEHOLDER_SIZE, build_signature_dictionary, sign_stream, \
+    write_signed_pdf
+from src.key_algorithms import ALGORITHM_ECDSA_P256, ALGORITHM_ED25519, ALGORITHM_RSA, generate_private_key, \
+    public_key_fingerprint, strip_signature_padding
+from src.signing_api import sign_bytes, verify_bytes
+from src.verify_signature import STATUS_BAD_BYTE_RANGE, STATUS_INVALID, STATUS_VALID, check_signature, \
+    locate_signature_in_buffer
+
+DOCUMENT = b"%PDF-1.4\n1 0 obj\n<< /Type /Catalog >>\nendobj\n" + bytes(range(256)) * 64 + b"\n%%EOF\n"
+
+
+def sign_document(private_key, document=DOCUMENT):
+    return sign_bytes(document, private_key).document
+
+
+def test_signed_file_round_trip(private_key, tmp_path):
+    pdf_path = tmp_path / "document.pdf"
+    pdf_path.write_bytes(DOCUMENT)
+    output_path = tmp_path / "signed.pdf"
+
+    assert write_signed_pdf(str(pdf_path), str(output_path), private_key) == len(DOCUMENT)
+
+    signed = output_path.read_bytes()
+    assert signed.startswith(DOCUMENT)
+    assert check_signature(str(output_path), private_key.public_key()) == STATUS_VALID
+    assert verify_bytes(signed, private_key.public_key()).status == STATUS_VALID
+
+
+def test_stream_and_file_signing_produce_the_same_layout(private_key, tmp_path):
+    pdf_path = tmp_path / "document.pdf"
+    pdf_path.write_bytes(DOCUMENT)
+    write_signed_pdf(str(pdf_path), str(tmp_path / "signed.pdf"), private_key)
+    target = io.BytesIO()
+    sign_stream(io.BytesIO(DOCUMENT), target, private_key)
+
+    from_file = locate_signature_in_buffer((tmp_path / "signed.pdf").read_bytes())
+    from_stream = locate_signature_in_buffer(target.getvalue())
+    assert from_file.byte_range == from_stream.byte_range
+    assert verify_bytes(target.getvalue(), private_key.public_key()).status == STATUS_VALID
+
+
+def test_byte_range_describes_the_signed_file(private_key):
+    signed = sign_document(private_key)
+    location = locate_signature_in_buffer(signed)
+    start, contents_start, contents_end, tail_length = location.byte_range
+
+    assert start == 0
+    assert signed[contents_start:contents_start + 1] == b"<"
+    assert signed[contents_end - 1:contents_end] == b">"
+    assert contents_end - contents_start == 2 * SIGNATURE_PLACEHOLDER_SIZE + 2
+    assert contents_end + tail_length == len(signed)
+    assert location.key_id == public_key_fingerprint(private_key.public_key())
+
+    result = verify_bytes(signed, private_key.public_key())
+    assert result.status == STATUS_VALID
+    assert result.signed_range == [(0, contents_start), (contents_end, len(signed))]
+
+
+def test_legacy_document_still_verifies(private_keys):
+    private_key = private_keys[ALGORITHM_RSA]
+    signature = private_key.sign(DOCUMENT, padding.PKCS1v15(), hashes.SHA256())
+    legacy_dictionary = (
+        "<<\n"
+        "/Type /Sig\n"
+        "/Filter /Adobe.PPKLite\n"
+        "/SubFilter /adbe.pkcs7.detached\n"
+        f"/ByteRange [0 {len(DOCUMENT)} {len(DOCUMENT)} 0]\n"
+        f"/Contents <{signature.hex()}>\n"
+        ">>"
+    ).encode("ascii")
+    legacy = DOCUMENT + b"\n" + legacy_dictionary
+
+    assert verify_bytes(legacy, private_key.public_key()).status == STATUS_VALID
+
+    tampered = bytearray(legacy)
+    tampered[20] ^= 0x01
+    assert verify_bytes(bytes(tampered), private_key.public_key()).status == STATUS_INVALID
+
+
+@pytest.mark.parametrize("position", ["document", "dictionary"])
+def test_tampered_byte_is_rejected(private_key, position):
+    signed = bytearray(sign_document(private_key))
+    location = locate_signature_in_buffer(bytes(signed))
+    offset = 20 if position == "document" else location.byte_range[1] - len(b"/Contents <") - 2
+    signed[offset] ^= 0x01
+
+    assert verify_bytes(bytes(signed), private_key.public_key()).status != STATUS_VALID
+
+
+def test_tampered_signature_is_rejected(private_key):
+    signed = bytearray(sign_document(private_key))
+    contents_start = locate_signature_in_buffer(bytes(signed)).byte_range[1]
+    signed[contents_start + 1] = ord("1") if signed[contents_start + 1] == ord("0") else ord("0")
+
+    assert verify_bytes(bytes(signed), private_key.public_key()).status == STATUS_INVALID
+
+
+def test_trailing_junk_gives_bad_byte_range(private_key):
+    signed = sign_document(private_key)
+
+    assert verify_bytes(signed + b"\n% appended\n", private_key.public_key()).status == STATUS_BAD_BYTE_RANGE
+
+
+def test_wrong_key_is_rejected(private_keys):
+    signed = sign_document(private_keys[ALGORITHM_ED25519])
+    other_key = generate_private_key(ALGORITHM_ED25519)
+
+    assert verify_bytes(signed, other_key.public_key()).status == STATUS_INVALID
+
+
+def test_signature_larger_than_placeholder_is_refused():
+    with pytest.raises(ValueError):
+        build_signature_dictionary(b"\x01" * (SIGNATURE_PLACEHOLDER_SIZE + 1), 10, ALGORITHM_RSA, "00" * 32)
+
+
+def test_strip_signature_padding_rsa_uses_the_key_size(private_keys):
+    public_key = private_keys[ALGORITHM_RSA].public_key()
+    signature = b"\x01" * (public_key.key_size // 8 - 1) + b"\x00"
+
+    assert strip_signature_padding(public_key, signature + b"\x00" * 100) == signature
+
+
+def test_strip_signature_padding_ed25519_keeps_trailing_zero_bytes(private_keys):
+    public_key = private_keys[ALGORITHM_ED25519].public_key()
+    signature = b"\x02" * 62 + b"\x00\x00"
+
+    assert strip_signature_padding(public_key, signature + b"\x00" * 100) == signature
+
+
+def test_strip_signature_padding_ecdsa_uses_the_der_length(private_keys):
+    public_key = private_keys[ALGORITHM_ECDSA_P256].public_key()
+    signature = b"\x30\x06\x02\x01\x01\x02\x01\x00"
+
+    assert strip_signature_padding(public_key, signature + b"\x00" * 100) == signature
+    assert strip_signature_padding(public_key, b"\x30") == b"\x30"
+    assert strip_signature_padding(public_key, b"") == b""
+
+
+def test_strip_signature_padding_of_real_signatures(private_key):
+    signed = sign_document(private_key)
+    location = locate_signature_in_buffer(signed)
+    contents = bytes.fromhex(location.contents.decode("ascii"))
+
+    signature = strip_signature_padding(private_key.public_key(), contents)
+    assert contents == signature.ljust(SIGNATURE_PLACEHOLDER_SIZE, b"\x00")
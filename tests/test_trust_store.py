@@ -0,0 +1,84 @@
+import json
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+
+from src.key_algorithms import ALGORITHM_ECDSA_P256, ALGORITHM_ED25519, public_key_fingerprint
+from src.trust_store import INDEX_NAME, TrustStore
+
+
+def write_public_key(path, private_key):
+    path.write_bytes(private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ))
+    return str(path)
+
+
+def write_index(directory, index):
+    (directory / INDEX_NAME).write_text(json.dumps(index), encoding="utf-8")
+
+
+@pytest.fixture
+def store_directory(tmp_path):
+    return tmp_path / "trust_store"
+
+
+def test_added_key_is_found_by_fingerprint(private_keys, tmp_path, store_directory):
+    private_key = private_keys[ALGORITHM_ED25519]
+    store = TrustStore(str(store_directory))
+
+    fingerprint = store.add(write_public_key(tmp_path / "key.pubk", private_key), label="Jan Kowalski")
+
+    assert fingerprint == public_key_fingerprint(private_key.public_key())
+    assert public_key_fingerprint(TrustStore(str(store_directory)).get(fingerprint.upper())) == fingerprint
+    assert store.entries()[fingerprint]["label"] == "Jan Kowalski"
+    assert store.get("0" * 64) is None
+
+
+def test_stale_index_is_revalidated(private_keys, tmp_path, store_directory):
+    first_key, second_key = private_keys[ALGORITHM_ED25519], private_keys[ALGORITHM_ECDSA_P256]
+    reader = TrustStore(str(store_directory))
+    writer = TrustStore(str(store_directory))
+    fingerprint = writer.add(write_public_key(tmp_path / "first.pubk", first_key))
+    assert reader.get(fingerprint) is not None
+
+    writer.remove(fingerprint)
+    assert reader.get(fingerprint) is None
+
+    second_fingerprint = writer.add(write_public_key(tmp_path / "second.pubk", second_key))
+    assert reader.get(second_fingerprint) is not None
+    assert fingerprint not in reader
+
+
+@pytest.mark.parametrize("file_name", ["../outside.pubk", "/tmp/outside.pubk", "{other}.pubk", "{fingerprint}.pem"])
+def test_index_entry_outside_its_key_file_is_rejected(private_keys, tmp_path, store_directory, file_name):
+    private_key = private_keys[ALGORITHM_ED25519]
+    store = TrustStore(str(store_directory))
+    fingerprint = store.add(write_public_key(tmp_path / "key.pubk", private_key))
+    write_public_key(tmp_path / "outside.pubk", private_key)
+    write_index(store_directory, {fingerprint: {"file": file_name.format(fingerprint=fingerprint, other="a" * 64)}})
+
+    with pytest.raises(ValueError):
+        TrustStore(str(store_directory)).get(fingerprint)
+
+
+def test_traversal_fingerprint_is_rejected(private_keys, tmp_path, store_directory):
+    store_directory.mkdir()
+    write_public_key(tmp_path / "outside.pubk", private_keys[ALGORITHM_ED25519])
+    write_index(store_directory, {"../outside": {"file": "../outside.pubk"}})
+    store = TrustStore(str(store_directory))
+
+    with pytest.raises(ValueError):
+        store.get("../outside")
+    assert store.remove("../outside")
+    assert (tmp_path / "outside.pubk").exists()
+
+
+def test_key_file_not_matching_the_index_is_rejected(private_keys, tmp_path, store_directory):
+    store = TrustStore(str(store_directory))
+    fingerprint = store.add(write_public_key(tmp_path / "key.pubk", private_keys[ALGORITHM_ED25519]))
+    write_public_key(store_directory / f"{fingerprint}.pubk", private_keys[ALGORITHM_ECDSA_P256])
+
+    with pytest.raises(ValueError):
+        TrustStore(str(store_directory)).get(fingerprint)